@@ -0,0 +1,308 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Executor, Future
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import schedule
+
+from broadcast import BroadcastEngine, DELIVERED, FAILED, BLOCKED
+from outbox import GLOBAL_RESERVE, MAX_ATTEMPTS, PRIORITY_INTERACTIVE, PRIORITY_NAMES, _ClassMetrics
+from ratelimit import TokenBucket, get_retry_after
+from scheduler import NotificationScheduler
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_TICK = 1.0  # как часто проверять расписание, секунд
+
+
+async def acquire_async(limiter, *args):
+    """Дождаться токена TokenBucket, не блокируя цикл событий"""
+    while True:
+        wait = limiter.try_acquire(*args)
+        if wait <= 0:
+            return
+        await asyncio.sleep(wait)
+
+
+def offload(handler: Callable[[Any], Any], executor: Executor) -> Callable[[Any], Awaitable[Any]]:
+    """Синхронный обработчик -> корутина для AsyncTeleBot.
+
+    Обработчики обращаются к базе данных и ждут отправки сообщений, поэтому
+    выполняются в отдельном пуле потоков, а цикл событий остается свободным.
+    """
+    async def run(update):
+        return await asyncio.get_running_loop().run_in_executor(executor, handler, update)
+
+    run.__name__ = handler.__name__
+    run.__doc__ = handler.__doc__
+    return run
+
+
+class LoopBridge:
+    """Обертка AsyncTeleBot для потоков WebhookServer: обработка обновлений в цикле событий"""
+
+    def __init__(self, bot, loop: asyncio.AbstractEventLoop):
+        self.bot = bot
+        self.loop = loop
+
+    def process_new_updates(self, updates: List[Any]):
+        asyncio.run_coroutine_threadsafe(self.bot.process_new_updates(updates), self.loop).result()
+
+
+class AsyncOutbox:
+    """Очередь исходящих запросов для AsyncTeleBot с интерфейсом Outbox.
+
+    Каждый запрос - корутина в цикле событий, а не элемент очереди потока:
+    тысячи одновременных отправок не занимают потоков. Одновременность
+    ограничена семафором своего класса приоритета, скорость - token bucket
+    класса и общим (с запасом GLOBAL_RESERVE для более важных классов, как в Outbox). Запросы в один чат выполняются в порядке постановки.
+    На ответ 429 все запросы приостанавливаются на retry_after, запрос повторяется.
+    call() можно вызывать из любого потока; результат - concurrent.futures.Future,
+    как у Outbox, поэтому синхронные обработчики работают без изменений.
+    """
+
+    def __init__(
+        self,
+        transport: Any,
+        loop: asyncio.AbstractEventLoop,
+        global_rate: float = 30,
+        class_rates: Optional[Dict[int, float]] = None,
+        concurrency: Optional[Dict[int, int]] = None
+    ):
+        self.transport = transport
+        self.loop = loop
+        self._global_bucket = TokenBucket(global_rate)
+        class_rates = class_rates or {}
+        concurrency = concurrency or {}
+        self._class_buckets = {
+            priority: TokenBucket(class_rates.get(priority, global_rate))
+            for priority in PRIORITY_NAMES
+        }
+        self._semaphores = {
+            priority: asyncio.Semaphore(concurrency.get(priority, 100))
+            for priority in PRIORITY_NAMES
+        }
+        self._metrics = {priority: _ClassMetrics() for priority in PRIORITY_NAMES}
+        self._metrics_lock = threading.Lock()
+        # Последний запрос в каждый чат: следующий ждет его завершения.
+        # Словарь меняется только в потоке цикла событий
+        self._tails: Dict[Any, asyncio.Future] = {}
+
+    def call(self, method: str, chat_id: int, *args, priority: int = PRIORITY_INTERACTIVE, **kwargs) -> Future:
+        """Запланировать вызов метода транспорта; результат - через Future"""
+        with self._metrics_lock:
+            self._metrics[priority].enqueued += 1
+        return asyncio.run_coroutine_threadsafe(
+            self._call(priority, time.monotonic(), method, chat_id, args, kwargs), self.loop
+        )
+
+    def send_message(self, chat_id: int, text: str, priority: int = PRIORITY_INTERACTIVE, **kwargs) -> Future:
+        """Запланировать отправку сообщения"""
+        return self.call('send_message', chat_id, text, priority=priority, **kwargs)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Глубина очереди, задержки и счетчики по классам приоритета"""
+        with self._metrics_lock:
+            return {PRIORITY_NAMES[priority]: metrics.as_dict() for priority, metrics in self._metrics.items()}
+
+    async def drain(self, timeout: Optional[float] = None) -> bool:
+        """Дождаться отправки всех запросов (в цикле событий); False - не успели за timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while any(stats['depth'] > 0 for stats in self.stats().values()):
+            if deadline is not None and time.monotonic() >= deadline:
+                logger.warning("Очередь исходящих сообщений не успела опустеть до остановки")
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    async def _call(self, priority: int, enqueued_at: float, method: str, chat_id: int, args, kwargs):
+        previous = self._tails.get(chat_id)
+        done = self.loop.create_future()
+        self._tails[chat_id] = done
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            async with self._semaphores[priority]:
+                for attempt in range(1, MAX_ATTEMPTS + 1):
+                    await acquire_async(self._class_buckets[priority])
+                    await acquire_async(self._global_bucket, GLOBAL_RESERVE[priority])
+                    try:
+                        result = await getattr(self.transport, method)(chat_id, *args, **kwargs)
+                        error = None
+                    except Exception as e:
+                        result = None
+                        error = e
+                    retry_after = get_retry_after(error) if error is not None else None
+                    if retry_after is None or attempt == MAX_ATTEMPTS:
+                        break
+                    # Telegram просит подождать - притормаживаем все запросы, как Outbox
+                    logger.warning(f"Telegram просит подождать {retry_after} с ({method} для чата {chat_id})")
+                    self._global_bucket.pause(retry_after)
+        finally:
+            done.set_result(None)
+            if self._tails.get(chat_id) is done:
+                del self._tails[chat_id]
+
+        latency = time.monotonic() - enqueued_at
+        with self._metrics_lock:
+            metrics = self._metrics[priority]
+            if error is None:
+                metrics.sent += 1
+            else:
+                metrics.failed += 1
+            metrics.latency_total += latency
+            metrics.latency_max = max(metrics.latency_max, latency)
+
+        if error is not None:
+            logger.warning(f"Ошибка {method} для чата {chat_id}: {error}")
+            raise error
+        return result
+
+
+class AsyncBroadcastEngine(BroadcastEngine):
+    """Рассылка корутинами: порция пользователей отправляется одновременно.
+
+    Одновременных отправок не больше concurrency, скорость и повторы при
+    ответах 429 - в очереди исходящих, как и у BroadcastEngine. Запросы к базе данных и отчеты администратору
+    выполняются в пуле потоков executor. send(user_id, text, wait=False)
+    должен вернуть Future отправки.
+    """
+
+    def __init__(
+        self,
+        db,
+        send: Callable[..., Future],
+        report: Callable[[int, str, bool], Any],
+        loop: asyncio.AbstractEventLoop,
+        executor: Executor,
+        concurrency: int = 500,
+        **kwargs
+    ):
+        super().__init__(db, send, report, **kwargs)
+        self.loop = loop
+        self.executor = executor
+        self.concurrency = concurrency
+        self._tasks: Dict[int, Future] = {}
+
+    def _spawn(self, job: Dict):
+        """Запустить задание корутиной в цикле событий (из любого потока)"""
+        self._tasks[job['job_id']] = asyncio.run_coroutine_threadsafe(self._run_job_async(job), self.loop)
+
+    def wait(self, job_id: int, timeout: Optional[float] = None):
+        """Дождаться завершения задания из другого потока"""
+        task = self._tasks.get(job_id)
+        if task is not None:
+            task.result(timeout)
+
+    async def _in_executor(self, func: Callable, *args):
+        return await self.loop.run_in_executor(self.executor, func, *args)
+
+    async def _run_job_async(self, job: Dict):
+        """Выполнить задание рассылки (та же логика, что BroadcastEngine._run_job)"""
+        counters = {
+            DELIVERED: job['success'],
+            FAILED: job['failures'],
+            BLOCKED: job['blocked']
+        }
+        last_user_id = job['last_user_id']
+        last_report = time.monotonic()
+        started = time.monotonic()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def deliver(user_id: int) -> str:
+            async with semaphore:
+                return await self._deliver_async(user_id, job['text'])
+
+        try:
+            while True:
+                user_ids = await self._in_executor(self.db.get_user_ids_after, last_user_id, self.chunk_size)
+                if not user_ids:
+                    break
+
+                for result in await asyncio.gather(*[deliver(user_id) for user_id in user_ids]):
+                    counters[result] += 1
+                last_user_id = user_ids[-1]
+                await self._in_executor(
+                    self.db.update_broadcast_job, job['job_id'], last_user_id,
+                    counters[DELIVERED], counters[FAILED], counters[BLOCKED]
+                )
+
+                if time.monotonic() - last_report >= self.progress_interval:
+                    last_report = time.monotonic()
+                    await self._in_executor(
+                        self._safe_report, job['admin_id'], self._format_progress(job, counters), False
+                    )
+        except Exception as e:
+            logger.error(f"Рассылка {job['job_id']} прервана: {e}")
+            await self._in_executor(
+                self._safe_report, job['admin_id'], f"⚠️ Рассылка прервана из-за ошибки: {e}", True
+            )
+            return
+
+        await self._in_executor(
+            lambda: self.db.update_broadcast_job(
+                job['job_id'], last_user_id,
+                counters[DELIVERED], counters[FAILED], counters[BLOCKED],
+                status='done'
+            )
+        )
+        elapsed = time.monotonic() - started
+        await self._in_executor(
+            self._safe_report,
+            job['admin_id'],
+            f"Рассылка завершена!\n\n"
+            f"Успешно: {counters[DELIVERED]}\n"
+            f"Не удалось: {counters[FAILED]}\n"
+            f"Заблокировали бота: {counters[BLOCKED]}\n"
+            f"Время: {elapsed:.0f} с",
+            True
+        )
+
+    async def _deliver_async(self, user_id: int, text: str) -> str:
+        """Отправить одно сообщение и дождаться результата (без потоков)"""
+        try:
+            await asyncio.wrap_future(self._send(user_id, text, wait=False))
+            return DELIVERED
+        except Exception as e:
+            return self._failure(user_id, e)
+
+
+async def run_schedule():
+    """Задачи schedule (еженедельный анализ и др.) вместо потока schedule_checker.
+
+    Сами задачи должны быть неблокирующими - например, запускать работу в пуле потоков.
+    """
+    while True:
+        schedule.run_pending()
+        await asyncio.sleep(SCHEDULER_TICK)
+
+
+async def run_notifications(scheduler: NotificationScheduler, executor: Executor, concurrency: int):
+    """Персональные уведомления вместо потока NotificationScheduler.
+
+    Уведомления отправляются в отдельном пуле executor, не больше concurrency
+    одновременно: остальные ждут в куче планировщика, поэтому утренний
+    и вечерний всплеск не занимает потоки обработчиков сообщений.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    running = set()
+
+    async def dispatch(user_id: int, kind: str):
+        try:
+            await loop.run_in_executor(executor, scheduler.dispatch, user_id, kind)
+        finally:
+            semaphore.release()
+
+    while True:
+        await semaphore.acquire()
+        due, delay = scheduler.pop_due()
+        if due is not None:
+            task = loop.create_task(dispatch(*due))
+            running.add(task)
+            task.add_done_callback(running.discard)
+            continue
+        semaphore.release()
+        await asyncio.sleep(SCHEDULER_TICK if delay is None else min(delay, SCHEDULER_TICK))
@@ -0,0 +1,691 @@
+import logging
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from correlation import CORRELATION_FACTORS, hours_or_nan
+from kmeans import cluster_matrices
+
+logger = logging.getLogger(__name__)
+
+MIN_ANALYSIS_DAYS = 7  # минимум дней данных для анализа
+# Способ запуска рабочих процессов анализа: 'spawn' запускает чистый интерпретатор.
+# fork процесса с работающими потоками (очереди, планировщик) может унаследовать
+# захваченные ими блокировки; импорт main побочных эффектов не имеет
+ANALYSIS_START_METHOD = 'spawn'
+NO_RECOMMENDATIONS = "Пока у меня нет конкретных рекомендаций. Продолжай заполнять опросы!"
+
+# Характеристики ночи для кластерного анализа
+CLUSTER_COLUMNS = ['sleep_duration', 'sleep_quality', 'awakenings', 'stress_level']
+MIN_CLUSTER_DAYS = 10  # минимум полных записей для кластеризации
+
+
+def parse_hours(times: pd.Series) -> pd.Series:
+    """Перевести столбец времени 'ЧЧ:ММ' в часы с десятичной частью.
+
+    Различных значений времени не больше 1440, поэтому разбираются только
+    уникальные строки, а результат раскладывается по строкам индексированием
+    массива NumPy. Пустые и некорректные значения превращаются в NaN.
+    """
+    codes, uniques = pd.factorize(times)
+    parsed = np.array([hours_or_nan(value) for value in uniques] + [np.nan], dtype=float)
+    # Код -1 (пропуск) указывает на последний элемент - NaN
+    return pd.Series(parsed[codes], index=times.index, name=times.name)
+
+
+def preprocess_data(data: pd.DataFrame) -> pd.DataFrame:
+    """Предварительная обработка данных.
+
+    Работает и с данными одного пользователя, и с данными многих пользователей
+    (со столбцом user_id, отсортированными по user_id и дате).
+    """
+    if 'date' not in data.columns:
+        raise ValueError("Для анализа нужен столбец date")
+
+    # Преобразуем время отхода ко сну и подъема в числовой формат (часы с десятичной частью)
+    data['bedtime_num'] = parse_hours(data['bedtime'])
+    data['wakeup_num'] = parse_hours(data['wakeup_time'])
+
+    # Рассчитываем регулярность сна
+    regularity = data['bedtime_num'].rolling(window=3).std()
+    if 'user_id' in data.columns:
+        # В пакетном режиме окно не должно захватывать записи другого пользователя
+        regularity[data.groupby('user_id').cumcount().to_numpy() < 2] = np.nan
+    data['sleep_regularity'] = regularity.fillna(0)
+
+    # Дополнительные метрики (подъем раньше отхода ко сну - переход через полночь)
+    time_in_bed = data['wakeup_num'] - data['bedtime_num'] + 24 * (data['wakeup_num'] < data['bedtime_num'])
+    data['sleep_efficiency'] = data['sleep_duration'] / time_in_bed
+    data['weekday'] = pd.to_datetime(data['date']).dt.dayofweek
+    data['is_weekend'] = (data['weekday'] >= 5).astype(int)
+
+    return data
+
+
+def analyze_basic_metrics(data: pd.DataFrame, user: Dict) -> List[str]:
+    """Анализ основных метрик сна"""
+    # Средние показатели
+    return basic_metrics_rules(
+        data['sleep_duration'].mean(),
+        data['sleep_quality'].mean(),
+        data['sleep_efficiency'].mean(),
+        user
+    )
+
+
+def basic_metrics_rules(avg_sleep: float, avg_quality: float, avg_efficiency: float, user: Dict) -> List[str]:
+    """Рекомендации по средним показателям сна"""
+    recommendations = []
+    
+    # Рекомендации по продолжительности
+    age = user['age']
+    ideal_sleep = calculate_ideal_sleep(age)
+    
+    if avg_sleep < ideal_sleep - 1:
+        recommendations.append(
+            f"Для твоего возраста ({age} лет) рекомендованная продолжительность сна {ideal_sleep}-{ideal_sleep+1} часов. "
+            f"Ты спишь в среднем {avg_sleep:.1f} часов. Попробуй увеличить продолжительность сна на {ideal_sleep - avg_sleep:.1f} часов."
+        )
+    elif avg_sleep > ideal_sleep + 1:
+        recommendations.append(
+            f"Ты спишь больше ({avg_sleep:.1f} часов) рекомендованной для твоего возраста ({age} лет) нормы ({ideal_sleep} часов). "
+            "Избыток сна может снижать продуктивность. Попробуй сократить время сна на 30 минут."
+        )
+    
+    # Рекомендации по качеству
+    if avg_quality < 6:
+        recommendations.append(
+            f"Твое среднее качество сна ({avg_quality:.1f}/10) ниже оптимального. "
+            "Рассмотри возможность улучшения гигиены сна: регулярное время отхода ко сну, "
+            "комфортные условия в спальне, ограничение кофеина и экранов перед сном."
+        )
+    
+    # Эффективность сна
+    if avg_efficiency < 0.85:
+        recommendations.append(
+            f"Твоя эффективность сна ({avg_efficiency:.1%}) ниже оптимальной (85%+). "
+            "Это означает, что ты проводишь много времени в постели без сна. "
+            "Попробуй ложиться только когда действительно хочешь спать."
+        )
+    
+    return recommendations
+
+
+def calculate_ideal_sleep(age: int) -> int:
+    """Рассчитать идеальную продолжительность сна по возрасту"""
+    if age < 18: return 9
+    elif 18 <= age < 25: return 8
+    elif 25 <= age < 45: return 7.5
+    elif 45 <= age < 65: return 7
+    else: return 7.5  # Пожилым часто нужно немного больше сна
+
+
+def advanced_correlation_analysis(
+    data: pd.DataFrame,
+    user: Dict,
+    correlations: Optional[Tuple[pd.Series, pd.Series]] = None
+) -> List[str]:
+    """Расширенный корреляционный анализ.
+
+    correlations - готовые коэффициенты и средние факторов (из накопленных
+    сумм в базе); без них корреляции считаются по data.
+    """
+    recommendations = []
+    
+    # Рассчитываем корреляции с качеством сна
+    try:
+        if correlations is not None:
+            sleep_quality_corr, means = correlations
+        else:
+            corr_matrix = data[CORRELATION_FACTORS + ['sleep_quality']].corr()
+            sleep_quality_corr = corr_matrix['sleep_quality'].drop('sleep_quality')
+            means = {col: data[col].mean() for col in ('exercise', 'screen_time', 'bedtime_num')}
+        recommendations = correlation_rules(sleep_quality_corr, means, user)
+    except Exception as e:
+        logger.error(f"Ошибка корреляционного анализа: {e}")
+    
+    return recommendations
+
+
+def correlation_rules(sleep_quality_corr: pd.Series, means: Dict[str, float], user: Dict) -> List[str]:
+    """Рекомендации по корреляциям факторов с качеством сна.
+
+    sleep_quality_corr - коэффициенты корреляции факторов с sleep_quality,
+    means - средние значения exercise, screen_time и bedtime_num.
+    """
+    recommendations = []
+    top_factors = sleep_quality_corr.abs().sort_values(ascending=False)
+    
+    # Анализ топ-3 факторов
+    for factor in top_factors.index[:3]:
+        corr_value = sleep_quality_corr[factor]
+        abs_corr = abs(corr_value)
+        
+        if abs_corr > 0.4:  # Значимая корреляция
+            if factor == 'stress_level' and corr_value < -0.4:
+                recommendations.append(
+                    "Выявлена сильная отрицательная связь между уровнем стресса и качеством сна (r={:.2f}). ".format(corr_value) +
+                    "Техники управления стрессом могут значительно улучшить твой сон:\n"
+                    "- Вечерняя медитация или дыхательные упражнения\n"
+                    "- Ведение 'списка тревог' перед сном\n"
+                    "- Теплый душ или ванна за час до сна"
+                )
+            
+            elif factor == 'exercise' and corr_value > 0.4:
+                rec = "Физическая активность положительно влияет на твой сон (r={:.2f}). ".format(corr_value)
+                if means['exercise'] < 30:
+                    rec += "Ты занимаешься в среднем всего {:.1f} минут в день. ".format(means['exercise'])
+                    rec += "Попробуй увеличить активность до 30-40 минут, особенно аэробные упражнения."
+                else:
+                    rec += "Отлично! Продолжай в том же духе, но избегай интенсивных тренировок за 3 часа до сна."
+                recommendations.append(rec)
+            
+            elif factor == 'screen_time' and corr_value < -0.3:
+                avg_screen_time = means['screen_time']
+                recommendations.append(
+                    "Время перед экранами перед сном отрицательно влияет на качество твоего сна (r={:.2f}). ".format(corr_value) +
+                    f"Ты проводишь в среднем {avg_screen_time:.1f} минут с гаджетами перед сном. Попробуй:\n"
+                    "- Установить 'ночной режим' на устройствах\n"
+                    "- Использовать приложения, ограничивающие синий свет\n"
+                    "- Читать бумажные книги вместо электронных"
+                )
+            
+            elif factor == 'bedtime_num' and abs_corr > 0.3:
+                if corr_value > 0:  # Поздний отход ко сну = хуже качество
+                    avg_bedtime = means['bedtime_num']
+                    ideal_bedtime = 22.5 if user['age'] >= 18 else 21.5
+                    if avg_bedtime > ideal_bedtime:
+                        recommendations.append(
+                            "Более поздний отход ко сну связан с ухудшением качества твоего сна (r={:.2f}). ".format(corr_value) +
+                            f"Ты обычно ложишься в {int(avg_bedtime)}:{int((avg_bedtime%1)*60):02d}. " +
+                            f"Попробуй постепенно смещать время отхода ко сну к {int(ideal_bedtime)}:{int((ideal_bedtime%1)*60):02d}."
+                        )
+    
+    return recommendations
+
+
+def analyze_time_series(data: pd.DataFrame, user: Dict) -> List[str]:
+    """Анализ временных рядов и паттернов"""
+    recommendations = []
+    
+    try:
+        # Будни/выходные
+        weekend_sleep = data.loc[data['is_weekend'] == 1, 'sleep_duration']
+        weekday_sleep = data.loc[data['is_weekend'] == 0, 'sleep_duration']
+        
+        # Тренд качества сна по неделям
+        weekly_avg = data.set_index(pd.to_datetime(data['date']))['sleep_quality'].resample('W').mean()
+        trend = None
+        if len(weekly_avg) > 2:
+            trend = (weekly_avg.iloc[-1] - weekly_avg.iloc[0]) / len(weekly_avg)
+        
+        recommendations = time_series_rules(
+            len(weekend_sleep), weekend_sleep.mean(),
+            len(weekday_sleep), weekday_sleep.mean(),
+            trend
+        )
+    except Exception as e:
+        logger.error(f"Ошибка анализа временных рядов: {e}")
+    
+    return recommendations
+
+
+def time_series_rules(
+    weekend_days: int,
+    weekend_sleep: float,
+    weekday_days: int,
+    weekday_sleep: float,
+    trend: Optional[float]
+) -> List[str]:
+    """Рекомендации по различиям будни/выходные и тренду качества сна.
+
+    trend - изменение среднего качества сна за неделю (None, если недель меньше трех).
+    """
+    recommendations = []
+    
+    # Анализ различий будни/выходные
+    if weekend_days > 2 and weekday_days > 5:
+        if abs(weekend_sleep - weekday_sleep) > 1.5:
+            recommendations.append(
+                "Я заметил значительную разницу в продолжительности твоего сна в выходные ({:.1f} ч) ".format(weekend_sleep) +
+                "и будни ({:.1f} ч). ".format(weekday_sleep) +
+                "Такие колебания могут вызывать 'социальный джетлаг'. " +
+                "Попробуй сократить разницу до 1 часа, вставая в выходные не более чем на 1 час позже."
+            )
+    
+    # Анализ тренда качества сна
+    if trend is not None:
+        if trend < -0.3:
+            recommendations.append(
+                "За последние недели я заметил ухудшение качества твоего сна. " +
+                "Это может быть связано с повышенным стрессом, изменением распорядка дня или другими факторами. " +
+                "Давай обсудим, что изменилось в твоей жизни за это время?"
+            )
+        elif trend > 0.3:
+            recommendations.append(
+                "Отличные новости! Качество твоего сна постепенно улучшается. " +
+                "Продолжай практиковать хорошие привычки сна, которые ты выработал."
+            )
+    
+    return recommendations
+
+
+def cluster_analysis(data: pd.DataFrame, user: Dict) -> List[str]:
+    """Кластерный анализ дней по характеристикам сна"""
+    recommendations = []
+    
+    try:
+        # Подготовка данных
+        cluster_data = data[CLUSTER_COLUMNS].dropna()
+        if len(cluster_data) < MIN_CLUSTER_DAYS:
+            return recommendations
+        
+        # Масштабирование и кластеризация (k-means на NumPy, k=2)
+        labels = cluster_matrices([cluster_data.to_numpy(dtype=float)])[0]
+        cluster_stats = cluster_data.groupby(labels).mean()
+        recommendations = cluster_rules(cluster_stats)
+    except Exception as e:
+        logger.error(f"Ошибка кластерного анализа: {e}")
+    
+    return recommendations
+
+
+def cluster_rules(cluster_stats: pd.DataFrame) -> List[str]:
+    """Рекомендации по сравнению «хорошего» и «плохого» кластеров ночей.
+
+    cluster_stats - средние CLUSTER_COLUMNS по кластерам 0 и 1.
+    """
+    recommendations = []
+    
+    # Находим "хороший" и "плохой" кластеры
+    good_cluster = cluster_stats['sleep_quality'].idxmax()
+    bad_cluster_stats = cluster_stats.loc[1 - good_cluster]
+    good_cluster_stats = cluster_stats.loc[good_cluster]
+    
+    # Сравниваем факторы
+    significant_diffs = []
+    for col in ['stress_level', 'awakenings']:
+        diff = bad_cluster_stats[col] - good_cluster_stats[col]
+        if diff > 0.5 * good_cluster_stats[col]:  # Значимая разница
+            significant_diffs.append((col, diff))
+    
+    # Формируем рекомендации
+    if significant_diffs:
+        rec = "Анализ твоих данных выявил два типа ночей: с хорошим и плохим сном. "
+        rec += "В 'плохие' ночи наблюдаются:\n"
+        
+        for col, diff in significant_diffs:
+            if col == 'stress_level':
+                rec += f"- Значительно более высокий уровень стресса (+{diff:.1f} балла)\n"
+            elif col == 'awakenings':
+                rec += f"- Больше пробуждений (+{diff:.1f} раза)\n"
+        
+        rec += "\nПопробуй в дни с высоким стрессом:\n"
+        rec += "- Техники релаксации перед сном\n"
+        rec += "- Теплый ромашковый чай\n"
+        rec += "- Более ранний отход ко сну"
+        
+        recommendations.append(rec)
+    
+    return recommendations
+
+
+def grouped_cluster_stats(data: pd.DataFrame) -> pd.DataFrame:
+    """Средние CLUSTER_COLUMNS по кластерам ночей для всех пользователей сразу.
+
+    Кластеризация всех пользователей выполняется пакетными вызовами k-means.
+    Возвращает таблицу с индексом (user_id, кластер); пользователи, у которых
+    меньше MIN_CLUSTER_DAYS полных записей, в нее не попадают.
+    """
+    cluster_data = data[['user_id'] + CLUSTER_COLUMNS].dropna()
+    counts = cluster_data.groupby('user_id', sort=False).size()
+    cluster_data = cluster_data[cluster_data['user_id'].isin(counts[counts >= MIN_CLUSTER_DAYS].index)]
+    
+    # Записи каждого пользователя идут подряд, поэтому матрицы - срезы одного массива
+    user_ids = cluster_data['user_id'].to_numpy()
+    starts = np.flatnonzero(np.r_[True, user_ids[1:] != user_ids[:-1]])
+    matrices = np.split(cluster_data[CLUSTER_COLUMNS].to_numpy(dtype=float), starts[1:])
+    labels = cluster_matrices(matrices) if matrices and len(cluster_data) else []
+    
+    cluster = pd.Series(np.concatenate(labels) if labels else [], index=cluster_data.index, dtype=int)
+    return cluster_data.groupby(['user_id', cluster.rename('cluster')])[CLUSTER_COLUMNS].mean()
+
+
+def generate_profile_based_recommendations(user: Dict) -> List[str]:
+    """Генерация рекомендаций на основе профиля пользователя"""
+    recommendations = []
+    age = user['age']
+    gender = user['gender']
+    lifestyle = user['lifestyle']
+    
+    # По возрасту
+    if age >= 45:
+        recommendations.append(
+            "В твоем возрасте мелатонин (гормон сна) вырабатывается менее активно. "
+            "Попробуй:\n"
+            "- Увеличить воздействие естественного света днем\n"
+            "- Рассмотреть добавки мелатонина после консультации с врачом\n"
+            "- Соблюдать строгий режим сна"
+        )
+    
+    # По полу
+    if gender == 'Женский':
+        recommendations.append(
+            "Женщины часто более чувствительны к изменениям циркадных ритмов. "
+            "Попробуй:\n"
+            "- Стабильный график сна даже в выходные\n"
+            "- Техники релаксации при ПМС\n"
+            "- Более темную и прохладную спальню"
+        )
+    
+    # По образу жизни
+    if 'сидячий' in lifestyle.lower():
+        recommendations.append(
+            "Твой сидячий образ жизни может влиять на качество сна. "
+            "Даже небольшая активность может помочь:\n"
+            "- 10-минутная прогулка после ужина\n"
+            "- Растяжка перед сном\n"
+            "- Использование стоячего рабочего места"
+        )
+    elif 'активный' in lifestyle.lower():
+        recommendations.append(
+            "Хотя ты ведешь активный образ жизни, обрати внимание:\n"
+            "- Интенсивные тренировки за 3+ часа до сна могут мешать засыпанию\n"
+            "- Восстановительные практики (йога, растяжка) вечером\n"
+            "- Достаточное потребление магния и белка"
+        )
+    
+    return recommendations
+
+
+def build_recommendations(
+    data: pd.DataFrame,
+    user: Dict,
+    correlations: Optional[Tuple[pd.Series, pd.Series]] = None
+) -> List[str]:
+    """Полный анализ данных одного пользователя; рекомендации без повторов в порядке важности"""
+    data = preprocess_data(data)
+    
+    # Основные метрики
+    recommendations = analyze_basic_metrics(data, user)
+    
+    # Углубленный корреляционный анализ
+    recommendations.extend(advanced_correlation_analysis(data, user, correlations))
+    
+    # Анализ временных рядов
+    recommendations.extend(analyze_time_series(data, user))
+    
+    # Кластерный анализ дней
+    recommendations.extend(cluster_analysis(data, user))
+    
+    # Персонализированные советы на основе профиля
+    recommendations.extend(generate_profile_based_recommendations(user))
+    
+    if not recommendations:
+        recommendations = [NO_RECOMMENDATIONS]
+    
+    # Удаляем дубликаты
+    return list(dict.fromkeys(recommendations))
+
+
+def grouped_correlations(data: pd.DataFrame, factors: List[str], target: str) -> pd.DataFrame:
+    """Коэффициенты Пирсона каждого фактора с target для всех пользователей сразу.
+
+    Как и DataFrame.corr, учитывает только строки, где заданы оба значения.
+    Возвращает таблицу: строки - user_id, столбцы - факторы.
+    """
+    user_ids = data['user_id']
+    x = data[factors].astype(float)
+    y = pd.DataFrame({factor: data[target].astype(float) for factor in factors}, index=data.index)
+    valid = x.notna() & y.notna()
+    x = x.where(valid)
+    y = y.where(valid)
+    
+    # Двухпроходная схема (через отклонения от средних) - как в pandas
+    dx = x - x.groupby(user_ids).transform('mean')
+    dy = y - y.groupby(user_ids).transform('mean')
+    sxy = (dx * dy).groupby(user_ids).sum()
+    sxx = (dx * dx).groupby(user_ids).sum()
+    syy = (dy * dy).groupby(user_ids).sum()
+    
+    denominator = np.sqrt(sxx * syy)
+    corr = sxy / denominator.where(denominator > 0)
+    return corr.clip(-1, 1)
+
+
+def grouped_weekly_trend(data: pd.DataFrame) -> pd.Series:
+    """Тренд качества сна по неделям (как resample('W')) для всех пользователей сразу.
+
+    Для пользователей, чьи данные охватывают меньше трех недель, значение NaN.
+    """
+    dates = pd.to_datetime(data['date'])
+    # Номер недели «понедельник-воскресенье», как у интервалов resample('W')
+    week = (dates - pd.to_timedelta(dates.dt.dayofweek, unit='D')).to_numpy().astype('datetime64[D]').astype(np.int64) // 7
+    weekly = (
+        data.assign(week=week)
+        .groupby(['user_id', 'week'])['sleep_quality'].mean()
+        .reset_index()
+    )
+    by_user = weekly.groupby('user_id')
+    first = weekly.drop_duplicates('user_id', keep='first').set_index('user_id')
+    last = weekly.drop_duplicates('user_id', keep='last').set_index('user_id')
+    weeks_spanned = by_user['week'].max() - by_user['week'].min() + 1
+    trend = (last['sleep_quality'] - first['sleep_quality']) / weeks_spanned
+    return trend.where(weeks_spanned > 2)
+
+
+def batch_recommendations(
+    data: pd.DataFrame,
+    users: Dict[int, Dict],
+    failed: Optional[List[int]] = None,
+    correlations: Optional[Tuple[pd.DataFrame, pd.DataFrame]] = None
+) -> Dict[int, List[str]]:
+    """Рекомендации для многих пользователей за один набор групповых операций.
+
+    data - опросы нескольких пользователей (столбец user_id), отсортированные
+    по user_id и дате; все записи каждого пользователя должны быть в data.
+    Анализируются только пользователи из users с достаточным объемом данных.
+    Правила те же, что и в build_recommendations. Пользователи, на которых
+    анализ упал, пропускаются и добавляются в failed. correlations - готовые
+    таблицы коэффициентов и средних факторов (см. Database.get_correlations).
+    """
+    data = data[data['user_id'].isin(list(users))]
+    counts = data.groupby('user_id').size()
+    data = data[data['user_id'].isin(counts[counts >= MIN_ANALYSIS_DAYS].index)].reset_index(drop=True)
+    if data.empty:
+        return {}
+    
+    data = preprocess_data(data)
+    grouped = data.groupby('user_id')
+    
+    means = grouped[['sleep_duration', 'sleep_quality', 'sleep_efficiency', 'exercise', 'screen_time', 'bedtime_num']].mean()
+    if correlations is None:
+        factor_means = means
+        correlations = grouped_correlations(data, CORRELATION_FACTORS, 'sleep_quality')
+    else:
+        correlations, factor_means = (table.reindex(means.index) for table in correlations)
+    day_types = data.groupby(['user_id', 'is_weekend'])['sleep_duration'].agg(['size', 'mean']).unstack('is_weekend')
+    trends = grouped_weekly_trend(data)
+    clusters = grouped_cluster_stats(data)
+    clustered = set(clusters.index.get_level_values('user_id'))
+    
+    results = {}
+    for user_id in means.index:
+        try:
+            results[user_id] = _user_batch_recommendations(
+                user_id, users[user_id], means, correlations, factor_means, day_types, trends,
+                clusters.loc[user_id] if user_id in clustered else None
+            )
+        except Exception as e:
+            logger.error(f"Ошибка при анализе данных пользователя {user_id}: {e}")
+            if failed is not None:
+                failed.append(user_id)
+    
+    return results
+
+
+def _user_batch_recommendations(
+    user_id: int,
+    user: Dict,
+    means: pd.DataFrame,
+    correlations: pd.DataFrame,
+    factor_means: pd.DataFrame,
+    day_types: pd.DataFrame,
+    trends: pd.Series,
+    cluster_stats: Optional[pd.DataFrame]
+) -> List[str]:
+    """Применить правила к заранее посчитанным групповым метрикам одного пользователя"""
+    user_means = means.loc[user_id]
+    
+    recommendations = basic_metrics_rules(
+        user_means['sleep_duration'], user_means['sleep_quality'], user_means['sleep_efficiency'], user
+    )
+    
+    try:
+        recommendations.extend(correlation_rules(correlations.loc[user_id], factor_means.loc[user_id], user))
+    except Exception as e:
+        logger.error(f"Ошибка корреляционного анализа: {e}")
+    
+    try:
+        sizes = day_types['size'].loc[user_id].fillna(0)
+        day_means = day_types['mean'].loc[user_id]
+        trend = trends.get(user_id)
+        recommendations.extend(time_series_rules(
+            int(sizes.get(1, 0)), day_means.get(1, np.nan),
+            int(sizes.get(0, 0)), day_means.get(0, np.nan),
+            None if pd.isna(trend) else trend
+        ))
+    except Exception as e:
+        logger.error(f"Ошибка анализа временных рядов: {e}")
+    
+    if cluster_stats is not None:
+        try:
+            recommendations.extend(cluster_rules(cluster_stats))
+        except Exception as e:
+            logger.error(f"Ошибка кластерного анализа: {e}")
+    recommendations.extend(generate_profile_based_recommendations(user))
+    
+    if not recommendations:
+        recommendations = [NO_RECOMMENDATIONS]
+    return list(dict.fromkeys(recommendations))
+
+
+def analyze_chunk(
+    data: pd.DataFrame,
+    users: Dict[int, Dict],
+    correlations: Optional[Tuple[pd.DataFrame, pd.DataFrame]] = None
+) -> Tuple[Dict[int, List[str]], List[int], float]:
+    """Задача рабочего процесса: проанализировать порцию пользователей.
+
+    Возвращает рекомендации, список пользователей с ошибкой анализа и время работы.
+    Ничего не пишет в базу и не отправляет - это делает родительский процесс.
+    """
+    started = time.perf_counter()
+    failed: List[int] = []
+    results = batch_recommendations(data, users, failed, correlations)
+    return results, failed, time.perf_counter() - started
+
+
+def iter_cohort_recommendations(
+    frames: Iterable[pd.DataFrame],
+    users: Dict[int, Dict],
+    workers: int = 1,
+    load_correlations: Optional[Callable[[List[int]], Tuple[pd.DataFrame, pd.DataFrame]]] = None
+) -> Iterator[Tuple[int, Optional[List[str]]]]:
+    """Проанализировать всех пользователей порциями, при workers > 1 - в пуле процессов.
+
+    Выдает пары (user_id, рекомендации); None вместо рекомендаций - анализ
+    пользователя завершился ошибкой. Пользователи с недостаточным объемом
+    данных не выдаются. Если порция целиком упала (в том числе вместе
+    с рабочим процессом), ее пользователи анализируются по одному
+    в текущем процессе, чтобы один «плохой» пользователь не сорвал весь запуск.
+    load_correlations(user_ids) - источник готовых корреляций для порции
+    (читается в текущем процессе, рабочие процессы к базе не обращаются).
+    """
+    def prepare(frame: pd.DataFrame) -> tuple:
+        chunk_users = {user_id: users[user_id] for user_id in frame['user_id'].unique() if user_id in users}
+        correlations = load_correlations(list(chunk_users)) if load_correlations is not None else None
+        return frame, chunk_users, correlations
+
+    def finish(index: int, outcome: Tuple[Dict[int, List[str]], List[int], float]):
+        results, failed, elapsed = outcome
+        logger.info(f"Порция {index}: {len(results)} пользователей за {elapsed:.2f} с, ошибок: {len(failed)}")
+        yield from results.items()
+        for user_id in failed:
+            yield user_id, None
+
+    def fallback(index: int, task: tuple, error: Exception):
+        frame, chunk_users, correlations = task
+        logger.error(f"Порция {index} не обработана ({error}), анализируем пользователей по одному")
+        for user_id, user_data in frame.groupby('user_id'):
+            if user_id not in chunk_users or len(user_data) < MIN_ANALYSIS_DAYS:
+                continue
+            try:
+                user_correlations = None
+                if correlations is not None:
+                    user_correlations = tuple(table.loc[user_id] for table in correlations)
+                yield user_id, build_recommendations(
+                    user_data.drop(columns='user_id').reset_index(drop=True), chunk_users[user_id], user_correlations
+                )
+            except Exception as e:
+                logger.error(f"Ошибка при анализе данных пользователя {user_id}: {e}")
+                yield user_id, None
+
+    if workers <= 1:
+        for index, frame in enumerate(frames):
+            task = prepare(frame)
+            try:
+                outcome = analyze_chunk(*task)
+            except Exception as e:
+                yield from fallback(index, task, e)
+                continue
+            yield from finish(index, outcome)
+        return
+
+    # Рабочие процессы только считают; в очереди держим не больше 2 порций на процесс
+    context = multiprocessing.get_context(ANALYSIS_START_METHOD)
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    pending = {}
+    try:
+        frames = iter(enumerate(frames))
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < workers * 2:
+                try:
+                    index, frame = next(frames)
+                except StopIteration:
+                    exhausted = True
+                    break
+                task = prepare(frame)
+                pending[executor.submit(analyze_chunk, *task)] = (index, task)
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future not in pending:
+                    # Порция уже отправлена заново после пересоздания пула
+                    continue
+                index, task = pending.pop(future)
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    if isinstance(e, BrokenProcessPool):
+                        # Процесс упал: пересоздаем пул и заново отправляем остальные порции
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+                        resubmit = list(pending.values())
+                        pending = {
+                            executor.submit(analyze_chunk, *t): (i, t)
+                            for i, t in resubmit
+                        }
+                    yield from fallback(index, task, e)
+                    continue
+                yield from finish(index, outcome)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
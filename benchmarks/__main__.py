@@ -0,0 +1,67 @@
+"""Запуск всех бенчмарков с выводом в JSON.
+
+Запуск: python -m benchmarks [--users N] [--days D] [--workers W] [--output файл.json]
+Результаты разных запусков можно сравнивать между собой: в файл попадают
+параметры, версия Python и коммит, на котором выполнялся замер.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+from benchmarks import bench_bot, bench_e2e, bench_kmeans, bench_preprocess, bench_startup
+
+
+def git_commit() -> str:
+    """Текущий коммит (или пустая строка вне git)"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return ''
+
+
+def main() -> dict:
+    parser = argparse.ArgumentParser(description='Бенчмарки бота СОНЯ')
+    parser.add_argument('--users', type=int, default=1000, help='пользователей в синтетической популяции')
+    parser.add_argument('--days', type=int, default=60, help='дней опросов на пользователя')
+    parser.add_argument('--workers', type=int, default=1, help='процессов еженедельного анализа')
+    parser.add_argument('--e2e-users', type=int, default=500, help='пользователей сквозного теста с заглушкой Bot API (0 - без него)')
+    parser.add_argument('--e2e-mode', choices=['polling', 'webhook'], default='polling', help='прием обновлений в сквозном тесте')
+    parser.add_argument('--e2e-runtime', choices=['threads', 'asyncio'], default='threads', help='среда выполнения бота в сквозном тесте')
+    parser.add_argument('--output', help='файл для результатов (по умолчанию - stdout)')
+    args = parser.parse_args()
+
+    results = bench_bot.run(args.users, args.days, args.workers)
+    results.append(bench_preprocess.run())
+    results.append(bench_startup.run())
+    if args.e2e_users:
+        results.append(bench_e2e.run(args.e2e_users, mode=args.e2e_mode, runtime=args.e2e_runtime))
+    try:
+        results.append(bench_kmeans.run())
+    except ImportError as e:
+        # Эталонной реализации нужен scikit-learn, которого нет в зависимостях
+        results.append({'benchmark': 'cluster_analysis', 'skipped': str(e)})
+
+    report = {
+        'started': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': vars(args),
+        'results': results
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    return report
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,168 @@
+"""Бенчмарки основных путей бота на синтетической популяции и боте-заглушке.
+
+Запуск: python -m benchmarks.bench_bot [пользователей] [дней]
+Telegram не вызывается: все запросы уходят в NoopBot, лимиты скорости
+очереди сняты, поэтому измеряется собственная работа бота и базы данных.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from typing import Dict, List
+
+import main
+from broadcast import BroadcastEngine
+from content import ContentPool
+from database import Database
+from outbox import Outbox, PRIORITY_NAMES
+from scheduler import NotificationScheduler, SURVEY
+from state import SQLiteStateStore
+
+from benchmarks.population import generate_population
+
+UNLIMITED_RATE = 1e9  # сообщений в секунду - фактически без ограничения
+
+
+class NoopBot:
+    """Заглушка TeleBot: принимает вызовы и считает их"""
+
+    def __init__(self):
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _count(self, chat_id: int) -> SimpleNamespace:
+        with self._lock:
+            self.calls += 1
+            return SimpleNamespace(message_id=self.calls, chat=SimpleNamespace(id=chat_id))
+
+    def send_message(self, chat_id: int, text: str, **kwargs) -> SimpleNamespace:
+        return self._count(chat_id)
+
+    def edit_message_reply_markup(self, chat_id: int, **kwargs) -> SimpleNamespace:
+        return self._count(chat_id)
+
+    def answer_callback_query(self, callback_query_id: str, *args, **kwargs) -> bool:
+        return True
+
+
+def setup(db_name: str, analysis_workers: int = 1) -> NoopBot:
+    """Подключить к модулю main базу, заглушку бота и очередь без ограничений"""
+    bot = NoopBot()
+    main.bot = bot
+    main.db = Database(db_name)
+    main.states = SQLiteStateStore(main.db)
+    main.content = ContentPool(main.db)
+    main.outbox = Outbox(bot, UNLIMITED_RATE, {priority: UNLIMITED_RATE for priority in PRIORITY_NAMES})
+    main.broadcast_engine = BroadcastEngine(
+        main.db,
+        send=main.send_broadcast_message,
+        report=lambda admin_id, text, finished: None,
+        progress_interval=float('inf')
+    )
+    main.ANALYSIS_WORKERS = analysis_workers
+    return bot
+
+
+def drain(timeout: float = 600):
+    """Дождаться, пока очередь исходящих сообщений опустеет"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if all(stats['depth'] == 0 for stats in main.outbox.stats().values()):
+            return
+        time.sleep(0.01)
+
+
+def _result(name: str, operations: int, seconds: float, **extra) -> Dict:
+    """Результат одного бенчмарка"""
+    return {
+        'benchmark': name,
+        'operations': operations,
+        'seconds': round(seconds, 4),
+        'ops_per_second': round(operations / seconds, 1) if seconds else None,
+        **extra
+    }
+
+
+def bench_save_survey(db: Database, user_ids: List[int], count: int = 2000) -> Dict:
+    """Сохранение опросов через очередь записи (вместе с агрегатами и суммами)"""
+    started = time.perf_counter()
+    for i in range(count):
+        db.save_survey(
+            user_ids[i % len(user_ids)], '23:30', '07:15', 7.5, 1, 7, 7, 4, 30, 1, 0, 60
+        )
+    db.flush()
+    return _result('save_survey', count, time.perf_counter() - started)
+
+
+def bench_get_user_stats(db: Database, user_ids: List[int], count: int = 2000) -> Dict:
+    """Экран статистики пользователя"""
+    started = time.perf_counter()
+    for i in range(count):
+        db.get_user_stats(user_ids[i % len(user_ids)])
+    return _result('get_user_stats', count, time.perf_counter() - started)
+
+
+def bench_survey_dispatch(bot: NoopBot, user_ids: List[int]) -> Dict:
+    """Утренний опрос всем пользователям так, как его отправляет NotificationScheduler"""
+    scheduler = NotificationScheduler({SURVEY: main.send_daily_survey})
+    calls = bot.calls
+    started = time.perf_counter()
+    for user_id in user_ids:
+        scheduler.dispatch(user_id, SURVEY)
+    drain()
+    return _result('survey_dispatch', bot.calls - calls, time.perf_counter() - started)
+
+
+def bench_weekly_analysis(db: Database, bot: NoopBot) -> Dict:
+    """Еженедельный анализ всех пользователей с отправкой рекомендаций"""
+    db.submit_write(lambda cursor: cursor.execute('DELETE FROM recommendations')).result()
+    calls = bot.calls
+    started = time.perf_counter()
+    main.weekly_analysis()
+    db.flush()
+    drain()
+    return _result(
+        'weekly_analysis', bot.calls - calls, time.perf_counter() - started,
+        workers=main.ANALYSIS_WORKERS
+    )
+
+
+def bench_broadcast(bot: NoopBot) -> Dict:
+    """Рассылка сообщения администратора всем пользователям"""
+    calls = bot.calls
+    started = time.perf_counter()
+    job_id = main.broadcast_engine.start(0, 'benchmark')
+    main.broadcast_engine.wait(job_id)
+    drain()
+    return _result('broadcast', bot.calls - calls, time.perf_counter() - started)
+
+
+def run(users: int = 1000, days: int = 60, analysis_workers: int = 1) -> List[Dict]:
+    """Сгенерировать популяцию во временной базе и выполнить все бенчмарки"""
+    with tempfile.TemporaryDirectory() as directory:
+        bot = setup(os.path.join(directory, 'sleep_bot.db'), analysis_workers)
+        db = main.db
+        try:
+            started = time.perf_counter()
+            population = generate_population(db, users, days)
+            results = [_result(
+                'generate_population', population['surveys'], time.perf_counter() - started,
+                users=users, days=days
+            )]
+            user_ids = list(range(1, users + 1))
+            # Опросы уходят только тем, кто еще не отвечал сегодня, - до bench_save_survey
+            results.append(bench_survey_dispatch(bot, user_ids))
+            results.append(bench_save_survey(db, user_ids))
+            results.append(bench_get_user_stats(db, user_ids))
+            results.append(bench_weekly_analysis(db, bot))
+            results.append(bench_broadcast(bot))
+        finally:
+            db.close()
+    return results
+
+
+if __name__ == '__main__':
+    for result in run(*map(int, sys.argv[1:3])):
+        print(result)
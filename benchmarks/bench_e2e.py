@@ -0,0 +1,120 @@
+"""Сквозной нагрузочный тест: настоящий бот против локальной заглушки Bot API.
+
+Запуск: python -m benchmarks.bench_e2e [пользователей] [задержка API, с] [polling|webhook] [threads|asyncio]
+Бот (SleepBot или AsyncSleepBot) получает обновления от заглушки через infinity_polling или через вебхук,
+сценарные пользователи регистрируются и проходят утренний опрос. Лимиты очереди исходящих сообщений
+сняты, поэтому измеряется пропускная способность опроса и обработчиков.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+from telebot import apihelper
+
+import main
+from outbox import PRIORITY_NAMES
+
+from benchmarks.bench_bot import UNLIMITED_RATE
+from benchmarks.fake_telegram import FakeBotAPI, FakeTelegramServer, ScriptedPopulation
+
+
+def run(
+    users: int = 1000,
+    latency: float = 0.0,
+    error_rates: Optional[Dict[int, float]] = None,
+    mode: str = 'polling',
+    runtime: str = 'threads',
+    timeout: float = 600
+) -> Dict:
+    """Регистрация и опрос users пользователей; вернуть время фаз и статистику заглушки"""
+    api = FakeBotAPI(latency=latency, error_rates=error_rates)
+    server = FakeTelegramServer(api).start()
+    population = ScriptedPopulation(api, users)
+    main.OUTBOX_GLOBAL_RATE = UNLIMITED_RATE
+    main.OUTBOX_CLASS_RATES = {priority: UNLIMITED_RATE for priority in PRIORITY_NAMES}
+    # Вебхук - на свободном локальном порту; регистрируем его в заглушке после запуска
+    main.WEBHOOK_HOST, main.WEBHOOK_PORT, main.WEBHOOK_URL = '127.0.0.1', 0, None
+    main.WEBHOOK_SECRET = main.WEBHOOK_SECRET or 'e2e-secret'
+
+    with tempfile.TemporaryDirectory() as directory:
+        app_class = main.AsyncSleepBot if runtime == 'asyncio' else main.SleepBot
+        app = app_class(
+            token='0:e2e', db_name=os.path.join(directory, 'sleep_bot.db'), api_url=server.url, update_mode=mode
+        )
+        polling = serving = None
+        if runtime == 'asyncio':
+            from telebot import asyncio_helper  # нужен aiohttp
+            default_api_url = asyncio_helper.API_URL
+            # Цикл событий бота - в отдельном потоке, serve() сам опрашивает заглушку в режиме polling
+            loop = asyncio.new_event_loop()
+            serving = threading.Thread(target=loop.run_until_complete, args=(app.serve(),), daemon=True)
+            serving.start()
+            while app.startup_seconds is None:
+                time.sleep(0.01)
+        else:
+            app.start()
+            if app.webhook is None:
+                polling = threading.Thread(
+                    target=main.bot.infinity_polling, kwargs={'timeout': 10, 'long_polling_timeout': 1}, daemon=True
+                )
+                polling.start()
+        if app.webhook is not None:
+            host, port = app.webhook.server_address[:2]
+            api.set_webhook(f'http://{host}:{port}{main.WEBHOOK_PATH}', main.WEBHOOK_SECRET)
+        try:
+            population.last_activity = time.monotonic()
+            started = time.perf_counter()
+            population.start_registration()
+            population.wait(lambda: len(population.registered) >= users, timeout)
+            registration_seconds = time.perf_counter() - started
+
+            # Утренний опрос всем зарегистрированным - как при совпадении времени опроса
+            population.last_activity = time.monotonic()
+            started = time.perf_counter()
+            for user_id in sorted(population.registered):
+                main.start_survey(user_id)
+            population.wait(lambda: population.surveys_completed >= len(population.registered), timeout)
+            survey_seconds = time.perf_counter() - started
+        finally:
+            if app.webhook is not None:
+                api.delete_webhook()
+            if serving is not None:
+                app.request_stop()
+                serving.join(timeout=15)
+                loop.close()
+                asyncio_helper.API_URL = default_api_url
+            else:
+                if polling is not None:
+                    main.bot.stop_polling()
+                    polling.join(timeout=15)
+                app.stop()
+            server.stop()
+            apihelper.API_URL = None
+
+    stats = population.stats()
+    # Ответов пользователей на опрос: по одному на каждый вопрос
+    answers = stats['surveys_completed'] * len(main.SURVEY_QUESTIONS)
+    return {
+        'benchmark': 'end_to_end',
+        'mode': mode,
+        'runtime': runtime,
+        'latency': latency,
+        'registration_seconds': round(registration_seconds, 4),
+        'survey_seconds': round(survey_seconds, 4),
+        'survey_answers_per_second': round(answers / survey_seconds, 1) if survey_seconds else None,
+        'routes': main.router.stats(),
+        **stats
+    }
+
+
+if __name__ == '__main__':
+    print(run(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 0.0,
+        mode=sys.argv[3] if len(sys.argv) > 3 else 'polling',
+        runtime=sys.argv[4] if len(sys.argv) > 4 else 'threads'
+    ))
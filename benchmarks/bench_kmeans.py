@@ -0,0 +1,96 @@
+"""Сравнение кластерного анализа на NumPy с прежней реализацией на scikit-learn.
+
+Запуск: python -m benchmarks.bench_kmeans [число пользователей]
+Для эталонной реализации нужен установленный scikit-learn.
+"""
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from analysis import CLUSTER_COLUMNS, MIN_CLUSTER_DAYS, cluster_rules, grouped_cluster_stats
+
+
+def legacy_cluster_analysis(data: pd.DataFrame, random_state: int = 42) -> List[str]:
+    """Прежняя реализация: импорт sklearn и отдельная подгонка на каждый вызов"""
+    from sklearn.cluster import KMeans
+    from sklearn.preprocessing import StandardScaler
+
+    cluster_data = data[CLUSTER_COLUMNS].dropna()
+    if len(cluster_data) < MIN_CLUSTER_DAYS:
+        return []
+    scaled_data = StandardScaler().fit_transform(cluster_data)
+    cluster_data['cluster'] = KMeans(n_clusters=2, random_state=random_state).fit_predict(scaled_data)
+    return cluster_rules(cluster_data.groupby('cluster').mean())
+
+
+def make_frame(users: int, seed: int = 42) -> pd.DataFrame:
+    """Синтетические опросы: у половины пользователей есть явные «плохие» ночи"""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for user_id in range(1, users + 1):
+        days = int(rng.integers(MIN_CLUSTER_DAYS, 120))
+        bad = rng.random(days) < rng.uniform(0.2, 0.5)
+        effect = rng.uniform(2, 4) if user_id % 2 else 0
+        frames.append(pd.DataFrame({
+            'user_id': user_id,
+            'sleep_duration': rng.normal(7.5, 1, days) - bad * effect * 0.5,
+            'sleep_quality': np.clip(np.round(rng.normal(7, 1.5, days) - bad * effect), 1, 10),
+            'awakenings': rng.poisson(1 + bad * effect, days),
+            'stress_level': np.clip(np.round(rng.normal(4, 1.5, days) + bad * effect), 1, 10),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def findings(recommendations: List[str]) -> Tuple[bool, bool]:
+    """Какие различия между кластерами найдены (стресс, пробуждения) - без чисел"""
+    text = ''.join(recommendations)
+    return 'уровень стресса' in text, 'пробуждений' in text
+
+
+def agreement(left: Dict[int, List[str]], right: Dict[int, List[str]], key=lambda recs: recs) -> float:
+    """Доля пользователей с одинаковым результатом"""
+    return round(sum(key(left.get(user_id, [])) == key(recs) for user_id, recs in right.items()) / len(right), 4)
+
+
+def batched(frame: pd.DataFrame) -> Dict[int, List[str]]:
+    """Новая реализация: все пользователи - пакетными вызовами k-means"""
+    stats = grouped_cluster_stats(frame)
+    return {
+        user_id: cluster_rules(stats.loc[user_id])
+        for user_id in stats.index.get_level_values('user_id').unique()
+    }
+
+
+def run(users: int = 1000) -> dict:
+    """Сравнить время и долю совпадающих рекомендаций"""
+    frame = make_frame(users)
+
+    started = time.perf_counter()
+    new = batched(frame)
+    numpy_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    legacy = {user_id: legacy_cluster_analysis(data) for user_id, data in frame.groupby('user_id')}
+    sklearn_seconds = time.perf_counter() - started
+
+    # k-means с одним запуском зависит от зерна, поэтому для ориентира
+    # сравниваем и прежнюю реализацию саму с собой при другом random_state
+    reseeded = {user_id: legacy_cluster_analysis(data, 7) for user_id, data in frame.groupby('user_id')}
+    return {
+        'benchmark': 'cluster_analysis',
+        'users': users,
+        'sklearn_seconds': round(sklearn_seconds, 4),
+        'numpy_seconds': round(numpy_seconds, 4),
+        'speedup': round(sklearn_seconds / numpy_seconds, 1) if numpy_seconds else None,
+        'same_findings': agreement(new, legacy, findings),
+        'same_recommendations': agreement(new, legacy),
+        'sklearn_reseeded_same_findings': agreement(reseeded, legacy, findings),
+        'sklearn_reseeded_same_recommendations': agreement(reseeded, legacy)
+    }
+
+
+if __name__ == '__main__':
+    print(run(int(sys.argv[1]) if len(sys.argv) > 1 else 1000))
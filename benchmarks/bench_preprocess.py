@@ -0,0 +1,74 @@
+"""Сравнение векторной предобработки с прежней построчной реализацией.
+
+Запуск: python -m benchmarks.bench_preprocess [число строк]
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from analysis import preprocess_data
+
+
+def legacy_preprocess_data(data: pd.DataFrame) -> pd.DataFrame:
+    """Прежняя реализация с разбором времени через .apply (эталон для сравнения)"""
+    data['bedtime_num'] = data['bedtime'].apply(
+        lambda x: float(x.split(':')[0]) + float(x.split(':')[1])/60 if pd.notnull(x) else None
+    )
+    data['wakeup_num'] = data['wakeup_time'].apply(
+        lambda x: float(x.split(':')[0]) + float(x.split(':')[1])/60 if pd.notnull(x) else None
+    )
+    data['sleep_regularity'] = data['bedtime_num'].rolling(window=3).std().fillna(0)
+    data['sleep_efficiency'] = data['sleep_duration'] / (data['wakeup_num'] - data['bedtime_num'] + 24*(data['wakeup_num'] < data['bedtime_num']))
+    data['weekday'] = pd.to_datetime(data['date']).dt.dayofweek
+    data['is_weekend'] = data['weekday'].isin([5, 6]).astype(int)
+    return data
+
+
+def make_frame(rows: int, seed: int = 42) -> pd.DataFrame:
+    """Синтетические данные опросов, включая отход ко сну после полуночи"""
+    rng = np.random.default_rng(seed)
+    bed_hour = rng.choice([21, 22, 23, 0, 1], size=rows)
+    wake_hour = rng.integers(5, 10, size=rows)
+    dates = pd.date_range('2020-01-01', periods=1000, freq='D').strftime('%Y-%m-%d')
+    return pd.DataFrame({
+        'date': dates[np.arange(rows) % len(dates)],
+        'bedtime': [f"{h}:{m:02d}" for h, m in zip(bed_hour, rng.integers(0, 60, size=rows))],
+        'wakeup_time': [f"{h}:{m:02d}" for h, m in zip(wake_hour, rng.integers(0, 60, size=rows))],
+        'sleep_duration': rng.uniform(4, 10, size=rows),
+    })
+
+
+def measure(func, frame: pd.DataFrame, repeat: int = 5) -> float:
+    """Лучшее время из нескольких запусков, секунд"""
+    best = float('inf')
+    for _ in range(repeat):
+        data = frame.copy()
+        started = time.perf_counter()
+        func(data)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run(rows: int = 100000) -> dict:
+    """Проверить совпадение результатов и сравнить время"""
+    frame = make_frame(rows)
+    pd.testing.assert_frame_equal(
+        preprocess_data(frame.copy()),
+        legacy_preprocess_data(frame.copy()),
+        check_dtype=False
+    )
+    legacy = measure(legacy_preprocess_data, frame)
+    vectorized = measure(preprocess_data, frame)
+    return {
+        'benchmark': 'preprocess_data',
+        'rows': rows,
+        'legacy_seconds': round(legacy, 4),
+        'vectorized_seconds': round(vectorized, 4),
+        'speedup': round(legacy / vectorized, 1) if vectorized else None
+    }
+
+
+if __name__ == '__main__':
+    print(run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000))
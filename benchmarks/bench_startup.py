@@ -0,0 +1,57 @@
+"""Время холодного старта бота: импорт main и SleepBot.start() в отдельном процессе.
+
+Запуск: python -m benchmarks.bench_startup [число запусков]
+Telegram не опрашивается; база данных создается во временном каталоге.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# Выполняется в дочернем процессе: чистый интерпретатор, как при запуске бота
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter() - started
+app = main.SleepBot(db_name=sys.argv[1])
+startup = app.start()
+print(json.dumps({
+    'import_seconds': imported,
+    'startup_seconds': startup,
+    'pandas_loaded': 'pandas' in sys.modules
+}))
+app.stop()
+'''
+
+
+def measure(db_name: str) -> dict:
+    """Один холодный старт в новом процессе"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, TELEGRAM_BOT_TOKEN=os.environ.get('TELEGRAM_BOT_TOKEN', '0:benchmark'))
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD, db_name],
+        cwd=root, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(repeat: int = 5) -> dict:
+    """Лучшее время из нескольких холодных стартов на уже созданной базе"""
+    with tempfile.TemporaryDirectory() as directory:
+        db_name = os.path.join(directory, 'sleep_bot.db')
+        # Первый запуск создает схему и применяет миграции - его не учитываем
+        measure(db_name)
+        runs = [measure(db_name) for _ in range(repeat)]
+    return {
+        'benchmark': 'startup',
+        'runs': repeat,
+        'import_seconds': round(min(r['import_seconds'] for r in runs), 4),
+        'startup_seconds': round(min(r['startup_seconds'] for r in runs), 4),
+        'pandas_loaded': any(r['pandas_loaded'] for r in runs)
+    }
+
+
+if __name__ == '__main__':
+    print(run(int(sys.argv[1]) if len(sys.argv) > 1 else 5))
@@ -0,0 +1,488 @@
+"""Локальная заглушка Telegram Bot API для сквозного нагрузочного тестирования.
+
+Реализует getUpdates, sendMessage, answerCallbackQuery и editMessageReplyMarkup
+(плюс getMe и «пустые» ответы на прочие методы), умеет добавлять задержку и
+отвечать ошибками 429/403 с заданной вероятностью. После setWebhook обновления
+не копятся для getUpdates, а отправляются POST-запросами на адрес вебхука. Сценарная популяция
+пользователей проходит регистрацию и весь опрос SURVEY_QUESTIONS, отвечая
+на сообщения бота.
+
+Запуск: python -m benchmarks.fake_telegram [--port 8081] [--users 1000] ...
+Бот подключается к заглушке через переменную окружения:
+TELEGRAM_API_URL=http://127.0.0.1:8081 python main.py
+Записанные обновления (JSON по одному в строке) можно воспроизвести: --replay файл.jsonl
+"""
+import argparse
+import http.client
+import json
+import queue
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from questions import SURVEY_QUESTIONS
+from webhook import SECRET_HEADER, update_chat_id
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'СОНЯ', 'username': 'fake_sonya_bot'}
+USER_METHODS = {'sendMessage', 'editMessageReplyMarkup'}  # методы, адресованные пользователю
+MAX_UPDATES = 100  # обновлений в одном ответе getUpdates (как в Telegram)
+WEBHOOK_CONNECTIONS = 8  # параллельных соединений доставки на вебхук
+WEBHOOK_ATTEMPTS = 50  # попыток доставить обновление, пока вебхук отвечает ошибкой
+WEBHOOK_RETRY_DELAY = 0.05  # пауза перед повторной доставкой, секунд
+
+# Начала сообщений бота, на которые отвечает сценарный пользователь
+REGISTRATION_AGE = 'Привет, '
+REGISTRATION_GENDER = 'Отлично! Теперь укажите ваш пол'
+REGISTRATION_LIFESTYLE = 'Хорошо! Теперь опишите ваш образ жизни'
+REGISTRATION_DONE = 'Регистрация завершена'
+SURVEY_DONE = 'Спасибо за заполнение опроса'
+
+GENDERS = ['Мужской', 'Женский', 'Другой']
+LIFESTYLES = [
+    'Активный (регулярные тренировки, подвижная работа)',
+    'Малоподвижный (редкие тренировки, сидячая работа)',
+    'Сидячий (нет тренировок, сидячая работа)'
+]
+
+
+class FakeBotAPI:
+    """Состояние заглушки: очередь входящих обновлений, счетчики и внедрение ошибок"""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rates: Optional[Dict[int, float]] = None,
+        retry_after: int = 1,
+        seed: int = 42
+    ):
+        """
+        latency, jitter - задержка ответа на каждый запрос: latency ± jitter секунд
+        error_rates - вероятности ответов ошибками на sendMessage/editMessageReplyMarkup,
+        например {429: 0.01, 403: 0.001}
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rates = error_rates or {}
+        self.retry_after = retry_after
+        # Вызывается для каждого доставленного сообщения бота: (chat_id, text, params)
+        self.on_message: Optional[Callable[[int, str, Dict[str, Any]], None]] = None
+
+        self._random = random.Random(seed)
+        self._updates: List[Dict[str, Any]] = []
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._condition = threading.Condition()
+        self._stats_lock = threading.Lock()
+        self.calls: Dict[str, int] = {}
+        self.errors: Dict[int, int] = {}
+        self.webhook_deliveries = 0
+        self.webhook_retries = 0
+        self.webhook_failures = 0
+        # Доставка на вебхук: шарды по пользователю, чтобы его обновления шли по порядку
+        self._webhook: Optional[Tuple[str, str]] = None
+        self._deliveries: List[queue.Queue] = []
+
+    # Входящие обновления (от имени пользователей)
+
+    def _push(self, update: Dict[str, Any]):
+        with self._condition:
+            update['update_id'] = self._next_update_id
+            self._next_update_id += 1
+            if self._webhook is None:
+                self._updates.append(update)
+                self._condition.notify_all()
+                return
+            deliveries = self._deliveries
+        deliveries[update_chat_id(update) % len(deliveries)].put(update)
+
+    def push_update(self, update: Dict[str, Any]):
+        """Воспроизвести записанное обновление (update_id назначается заново)"""
+        self._push(dict(update))
+
+    def _new_message_id(self) -> int:
+        with self._condition:
+            message_id = self._next_message_id
+            self._next_message_id += 1
+            return message_id
+
+    @staticmethod
+    def _user(user_id: int) -> Dict[str, Any]:
+        return {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'}
+
+    def push_message(self, user_id: int, text: str):
+        """Пользователь пишет боту текст (команды - с сущностью bot_command)"""
+        message = {
+            'message_id': self._new_message_id(),
+            'from': self._user(user_id),
+            'chat': {'id': user_id, 'type': 'private', 'first_name': f'user{user_id}'},
+            'date': int(time.time()),
+            'text': text
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        self._push({'message': message})
+
+    def push_callback(self, user_id: int, data: str, message_id: int):
+        """Пользователь нажимает инлайн-кнопку под сообщением message_id"""
+        self._push({'callback_query': {
+            'id': str(self._new_message_id()),
+            'from': self._user(user_id),
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': message_id,
+                'from': BOT_USER,
+                'chat': {'id': user_id, 'type': 'private'},
+                'date': int(time.time()),
+                'text': ''
+            }
+        }})
+
+    # Вебхук
+
+    def set_webhook(self, url: str, secret_token: str = '', connections: int = WEBHOOK_CONNECTIONS):
+        """Доставлять обновления на url; накопленные для getUpdates - тоже"""
+        self.delete_webhook()
+        deliveries = [queue.Queue() for _ in range(connections)]
+        for updates in deliveries:
+            threading.Thread(target=self._deliver, args=(url, secret_token, updates), daemon=True).start()
+        with self._condition:
+            self._webhook = (url, secret_token)
+            self._deliveries = deliveries
+            pending, self._updates = self._updates, []
+        for update in pending:
+            deliveries[update_chat_id(update) % len(deliveries)].put(update)
+
+    def delete_webhook(self):
+        """Вернуться к getUpdates (еще не доставленные обновления доставляются до конца)"""
+        with self._condition:
+            deliveries, self._deliveries = self._deliveries, []
+            self._webhook = None
+        for updates in deliveries:
+            updates.put(None)
+
+    def _deliver(self, url: str, secret_token: str, updates: queue.Queue):
+        """Поток доставки: POST каждого обновления, при ошибке - повтор, как у Telegram"""
+        address = urlsplit(url)
+        connection = http.client.HTTPConnection(address.hostname, address.port, timeout=30)
+        headers = {'Content-Type': 'application/json', SECRET_HEADER: secret_token}
+        while True:
+            update = updates.get()
+            if update is None:
+                connection.close()
+                return
+            body = json.dumps(update, ensure_ascii=False).encode('utf-8')
+            for _ in range(WEBHOOK_ATTEMPTS):
+                try:
+                    connection.request('POST', address.path or '/', body, headers)
+                    response = connection.getresponse()
+                    response.read()
+                    if response.status == 200:
+                        with self._stats_lock:
+                            self.webhook_deliveries += 1
+                        break
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                with self._stats_lock:
+                    self.webhook_retries += 1
+                time.sleep(WEBHOOK_RETRY_DELAY)
+            else:
+                with self._stats_lock:
+                    self.webhook_failures += 1
+
+    def pending_updates(self) -> int:
+        """Обновлений, еще не подтвержденных ботом"""
+        with self._condition:
+            return len(self._updates)
+
+    # Методы Bot API
+
+    def get_updates(self, offset: int = 0, limit: int = MAX_UPDATES, timeout: float = 0) -> List[Dict[str, Any]]:
+        """Длинный опрос: подтвердить обновления до offset и вернуть следующие"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            if offset:
+                self._updates = [u for u in self._updates if u['update_id'] >= offset]
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return self._updates[:limit]
+
+    def _injected_error(self) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """Случайная ошибка для методов, адресованных пользователю"""
+        with self._stats_lock:
+            roll = self._random.random()
+        for code, rate in self.error_rates.items():
+            if roll < rate:
+                with self._stats_lock:
+                    self.errors[code] = self.errors.get(code, 0) + 1
+                if code == 429:
+                    return 429, {
+                        'ok': False, 'error_code': 429,
+                        'description': f'Too Many Requests: retry after {self.retry_after}',
+                        'parameters': {'retry_after': self.retry_after}
+                    }
+                if code == 403:
+                    return 403, {'ok': False, 'error_code': 403, 'description': 'Forbidden: bot was blocked by the user'}
+                return code, {'ok': False, 'error_code': code, 'description': 'Injected error'}
+            roll -= rate
+        return None
+
+    def handle(self, method: str, params: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """Выполнить метод API; вернуть HTTP-статус и тело ответа"""
+        with self._stats_lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter)))
+
+        if method in USER_METHODS:
+            error = self._injected_error()
+            if error:
+                return error
+
+        if method == 'getUpdates':
+            result = self.get_updates(
+                int(params.get('offset') or 0),
+                int(params.get('limit') or MAX_UPDATES),
+                float(params.get('timeout') or 0)
+            )
+        elif method == 'getMe':
+            result = BOT_USER
+        elif method == 'sendMessage':
+            chat_id = int(params['chat_id'])
+            text = params.get('text', '')
+            result = {
+                'message_id': self._new_message_id(),
+                'from': BOT_USER,
+                'chat': {'id': chat_id, 'type': 'private'},
+                'date': int(time.time()),
+                'text': text
+            }
+            if self.on_message:
+                self.on_message(chat_id, text, result)
+        elif method == 'editMessageReplyMarkup':
+            result = {
+                'message_id': int(params.get('message_id') or 0),
+                'from': BOT_USER,
+                'chat': {'id': int(params['chat_id']), 'type': 'private'},
+                'date': int(time.time()),
+                'text': ''
+            }
+        elif method == 'setWebhook':
+            if params.get('url'):
+                self.set_webhook(params['url'], params.get('secret_token', ''))
+            else:
+                self.delete_webhook()
+            result = True
+        elif method == 'deleteWebhook':
+            self.delete_webhook()
+            result = True
+        else:
+            # answerCallbackQuery и прочие служебные методы
+            result = True
+        return 200, {'ok': True, 'result': result}
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """HTTP-обработчик вида /bot<token>/<method> (параметры - в строке запроса или теле)"""
+
+    protocol_version = 'HTTP/1.1'  # keep-alive, как у requests.Session
+    # Заголовки и тело уходят отдельными записями: без TCP_NODELAY каждый ответ
+    # ждал бы отложенного ACK клиента (~40 мс)
+    disable_nagle_algorithm = True
+
+    def _dispatch(self):
+        url = urlsplit(self.path)
+        method = url.path.rsplit('/', 1)[-1]
+        params = dict(parse_qsl(url.query))
+
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            body = self.rfile.read(length).decode('utf-8')
+            if self.headers.get('Content-Type', '').startswith('application/json'):
+                params.update(json.loads(body))
+            else:
+                params.update(parse_qsl(body))
+
+        status, payload = self.server.api.handle(method, params)
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = _dispatch
+    do_POST = _dispatch
+
+    def log_message(self, format, *args):
+        pass  # тысячи запросов в секунду - без журнала доступа
+
+
+class FakeTelegramServer(ThreadingHTTPServer):
+    """HTTP-сервер заглушки в фоновом потоке"""
+
+    daemon_threads = True
+
+    def __init__(self, api: FakeBotAPI, host: str = '127.0.0.1', port: int = 0):
+        super().__init__((host, port), _RequestHandler)
+        self.api = api
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Адрес для TELEGRAM_API_URL"""
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'FakeTelegramServer':
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class ScriptedPopulation:
+    """Сценарные пользователи: регистрируются и отвечают на вопросы опроса.
+
+    Каждый ответ - новое обновление в очереди заглушки, поэтому бот проходит
+    тот же путь, что и с настоящим Telegram: getUpdates, обработчики, sendMessage.
+    """
+
+    def __init__(self, api: FakeBotAPI, users: int, first_user_id: int = 1000, seed: int = 42):
+        self.api = api
+        self.user_ids = list(range(first_user_id, first_user_id + users))
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._questions = {question['text']: question for question in SURVEY_QUESTIONS}
+        self._survey_started: Dict[int, float] = {}
+        self.registered = set()
+        self.surveys_completed = 0
+        self.survey_seconds: List[float] = []
+        self.unexpected = 0  # сообщений, на которые сценарий не знает ответа
+        self.last_activity = time.monotonic()
+        api.on_message = self.on_message
+
+    def start_registration(self):
+        """Все пользователи отправляют /start"""
+        for user_id in self.user_ids:
+            self.api.push_message(user_id, '/start')
+
+    def _answer(self, question: Dict) -> str:
+        """Правдоподобный ответ на вопрос опроса"""
+        with self._lock:
+            if question['type'] == 'time':
+                if question['key'] == 'bedtime':
+                    return f"{self._random.choice([22, 23, 0])}:{self._random.choice(['00', '15', '30', '45'])}"
+                return f"0{self._random.randint(6, 9)}:{self._random.choice(['00', '15', '30', '45'])}"
+            if question['type'] == 'float':
+                return str(round(self._random.uniform(5, 9), 1))
+            if question['type'] == 'int':
+                if question['options']:
+                    return str(self._random.choice(question['options']))
+                return str(self._random.randint(0, 3))
+            return 'нет'
+
+    def on_message(self, chat_id: int, text: str, message: Dict[str, Any]):
+        """Реакция пользователя на сообщение бота"""
+        self.last_activity = time.monotonic()
+        # Вопрос опроса без подсказки к формату времени
+        question = self._questions.get(text.split('\n\n')[0])
+        if question is not None:
+            if question is SURVEY_QUESTIONS[0]:
+                with self._lock:
+                    self._survey_started[chat_id] = time.monotonic()
+            self.api.push_message(chat_id, self._answer(question))
+        elif text.startswith(REGISTRATION_AGE):
+            self.api.push_message(chat_id, str(self._random.randint(18, 70)))
+        elif text.startswith(REGISTRATION_GENDER):
+            self.api.push_message(chat_id, self._random.choice(GENDERS))
+        elif text.startswith(REGISTRATION_LIFESTYLE):
+            self.api.push_message(chat_id, self._random.choice(LIFESTYLES))
+        elif text.startswith(REGISTRATION_DONE):
+            with self._lock:
+                self.registered.add(chat_id)
+        elif text.startswith(SURVEY_DONE):
+            with self._lock:
+                self.surveys_completed += 1
+                started = self._survey_started.pop(chat_id, None)
+                if started is not None:
+                    self.survey_seconds.append(time.monotonic() - started)
+        else:
+            with self._lock:
+                self.unexpected += 1
+
+    def wait(self, condition: Callable[[], bool], timeout: float, idle_timeout: float = 5.0) -> bool:
+        """Дождаться условия (например, все зарегистрированы) не дольше timeout секунд.
+
+        Если бот idle_timeout секунд ничего не присылает, ждать дальше бессмысленно:
+        часть диалогов застряла, и это видно по счетчикам в stats().
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and time.monotonic() - self.last_activity < idle_timeout:
+            if condition():
+                return True
+            time.sleep(0.05)
+        return condition()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            seconds = sorted(self.survey_seconds)
+            stalled = len(self._survey_started)
+        return {
+            'users': len(self.user_ids),
+            'registered': len(self.registered),
+            'surveys_completed': self.surveys_completed,
+            'surveys_stalled': stalled,
+            'survey_seconds_median': round(seconds[len(seconds) // 2], 3) if seconds else None,
+            'survey_seconds_max': round(seconds[-1], 3) if seconds else None,
+            'unexpected_messages': self.unexpected,
+            'api_calls': dict(self.api.calls),
+            'injected_errors': dict(self.api.errors),
+            'webhook_deliveries': self.api.webhook_deliveries,
+            'webhook_retries': self.api.webhook_retries,
+            'webhook_failures': self.api.webhook_failures
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Заглушка Telegram Bot API со сценарными пользователями')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--users', type=int, default=1000, help='сценарных пользователей (0 - только сервер)')
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа, секунд')
+    parser.add_argument('--jitter', type=float, default=0.0, help='разброс задержки, секунд')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='доля ответов 429 на отправку')
+    parser.add_argument('--rate-403', type=float, default=0.0, help='доля ответов 403 на отправку')
+    parser.add_argument('--replay', help='файл с записанными обновлениями (JSON по одному в строке)')
+    args = parser.parse_args()
+
+    api = FakeBotAPI(args.latency, args.jitter, {429: args.rate_429, 403: args.rate_403})
+    server = FakeTelegramServer(api, args.host, args.port).start()
+    population = ScriptedPopulation(api, args.users)
+    print(f"Заглушка Bot API: TELEGRAM_API_URL={server.url}")
+    population.start_registration()
+    if args.replay:
+        with open(args.replay, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    api.push_update(json.loads(line))
+    try:
+        while True:
+            time.sleep(5)
+            print(population.stats())
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
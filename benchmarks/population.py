@@ -0,0 +1,132 @@
+"""Генератор синтетической популяции пользователей и опросов для бенчмарков.
+
+Данные генерируются векторно для N пользователей × D дней и пишутся
+в базу одной транзакцией через executemany, после чего пересчитываются
+агрегаты статистики и суммы для корреляций.
+"""
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict
+
+import numpy as np
+
+from correlation import rebuild_correlation_stats
+from database import Database
+from migrations import rebuild_user_aggregates
+
+GENDERS = ['Мужской', 'Женский', 'Другой']
+LIFESTYLES = [
+    'Активный (регулярные тренировки, подвижная работа)',
+    'Малоподвижный (редкие тренировки, сидячая работа)',
+    'Сидячий (нет тренировок, сидячая работа)'
+]
+NOTIFICATION_TIMES = ['07:00', '07:30', '08:00', '08:30', '09:00', '09:30']
+SKIP_PROBABILITY = 0.15  # доля пропущенных дней (опрос не заполнен)
+
+
+def _format_times(hours: np.ndarray) -> np.ndarray:
+    """Часы с десятичной частью -> строки 'ЧЧ:ММ' (по модулю суток)"""
+    minutes = np.round(hours * 60).astype(int) % (24 * 60)
+    return np.char.add(
+        np.char.add((minutes // 60).astype(str), ':'),
+        np.char.zfill((minutes % 60).astype(str), 2)
+    )
+
+
+def generate_population(
+    db: Database,
+    users: int,
+    days: int,
+    seed: int = 42,
+    first_user_id: int = 1
+) -> Dict[str, int]:
+    """Сгенерировать пользователей и их опросы за последние days дней.
+
+    Распределения правдоподобные: у каждого пользователя свои средние
+    продолжительность сна, время отхода ко сну и уровень стресса; в выходные
+    ложатся позже и спят дольше, стресс и кофеин ухудшают качество сна.
+    Возвращает количество созданных пользователей и опросов.
+    """
+    rng = np.random.default_rng(seed)
+    user_ids = np.arange(first_user_id, first_user_id + users)
+    now = datetime.now()
+    registered = (now - timedelta(days=days + 1)).strftime('%Y-%m-%d %H:%M:%S')
+
+    ages = np.clip(rng.normal(35, 12, users), 14, 80).astype(int)
+    user_rows = [
+        (
+            int(user_id), f'user{user_id}', int(age), db._determine_age_category(int(age)),
+            GENDERS[gender], LIFESTYLES[lifestyle], registered, registered, NOTIFICATION_TIMES[notification]
+        )
+        for user_id, age, gender, lifestyle, notification in zip(
+            user_ids, ages,
+            rng.choice(len(GENDERS), users, p=[0.48, 0.48, 0.04]),
+            rng.integers(0, len(LIFESTYLES), users),
+            rng.integers(0, len(NOTIFICATION_TIMES), users)
+        )
+    ]
+
+    # Матрицы (пользователи, дни); личные средние - столбцы, общие для всех дней
+    shape = (users, days)
+    base_sleep = rng.normal(7.2, 0.7, users)[:, None]
+    base_bedtime = rng.normal(23.3, 0.8, users)[:, None]
+    base_stress = rng.uniform(2, 7, users)[:, None]
+    dates = [now - timedelta(days=days - day) for day in range(days)]
+    weekend = np.array([date.weekday() >= 5 for date in dates])[None, :]
+
+    stress = np.clip(np.round(base_stress + rng.normal(0, 1.5, shape)), 1, 10)
+    caffeine = rng.poisson(1.5, shape)
+    alcohol = rng.poisson(0.2 + 0.6 * weekend, shape)
+    exercise = np.where(rng.random(shape) < 0.4, 0, np.round(rng.gamma(2, 20, shape)))
+    screen_time = np.round(rng.gamma(2, 30, shape))
+    bedtime = base_bedtime + 0.7 * weekend + 0.01 * screen_time + rng.normal(0, 0.5, shape)
+    sleep_duration = np.clip(
+        base_sleep + 0.8 * weekend - 0.1 * stress + rng.normal(0, 0.6, shape), 3, 12
+    )
+    wakeup = bedtime + sleep_duration + rng.uniform(0.1, 0.6, shape)
+    awakenings = rng.poisson(0.5 + 0.2 * stress + 0.3 * alcohol)
+    quality = np.clip(np.round(
+        5 + 0.6 * (sleep_duration - 7) - 0.35 * (stress - 4) - 0.3 * caffeine
+        - 0.4 * awakenings + 0.01 * exercise + rng.normal(0, 1, shape)
+    ), 1, 10)
+    mood = np.clip(np.round(quality + rng.normal(0, 1.5, shape)), 1, 10)
+
+    taken = rng.random(shape) >= SKIP_PROBABILITY
+    user_index, day_index = np.nonzero(taken)
+    date_strings = np.array([date.strftime('%Y-%m-%d') for date in dates])
+    bedtime_strings = _format_times(bedtime[taken])
+    wakeup_strings = _format_times(wakeup[taken])
+
+    survey_rows = list(zip(
+        user_ids[user_index].tolist(), date_strings[day_index].tolist(),
+        bedtime_strings.tolist(), wakeup_strings.tolist(),
+        np.round(sleep_duration[taken], 2).tolist(), awakenings[taken].tolist(),
+        quality[taken].astype(int).tolist(), mood[taken].astype(int).tolist(),
+        stress[taken].astype(int).tolist(), exercise[taken].astype(int).tolist(),
+        caffeine[taken].tolist(), alcohol[taken].tolist(), screen_time[taken].astype(int).tolist()
+    ))
+
+    def operation(cursor: sqlite3.Cursor):
+        cursor.executemany('''
+        INSERT OR REPLACE INTO users (
+            user_id, username, age, age_category, gender, lifestyle,
+            registration_date, last_active_date, notification_time
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', user_rows)
+        cursor.executemany('''
+        INSERT INTO surveys (
+            user_id, date, bedtime, wakeup_time, sleep_duration,
+            awakenings, sleep_quality, mood_morning, stress_level,
+            exercise, caffeine, alcohol, screen_time, notes
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'benchmark')
+        ''', survey_rows)
+        # Производные таблицы обычно ведет save_survey - здесь пересчитываем целиком
+        rebuild_user_aggregates(cursor)
+        rebuild_correlation_stats(cursor, decay=db.correlation_decay)
+
+    db.submit_write(operation).result()
+    for user_id in user_ids:
+        db.invalidate_user(int(user_id))
+    return {'users': users, 'surveys': len(survey_rows)}
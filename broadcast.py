@@ -0,0 +1,155 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from database import Database
+from ratelimit import is_blocked_error
+
+logger = logging.getLogger(__name__)
+
+# Результаты доставки одного сообщения
+DELIVERED = 'delivered'
+FAILED = 'failed'
+BLOCKED = 'blocked'
+
+
+class BroadcastEngine:
+    """Рассылка сообщений всем пользователям вне потока обработчика.
+
+    Сообщения уходят через send - очередь исходящих с классом массовых
+    рассылок: скорость (общий лимит Telegram и лимит класса) и повторы
+    при ответах 429 - только там. Отправка идет пулом потоков. Пользователи перебираются по возрастанию
+    user_id порциями; после каждой порции состояние задания сохраняется
+    в broadcast_jobs, поэтому прерванная рассылка продолжается после перезапуска.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        send: Callable[[int, str], Any],
+        report: Callable[[int, str, bool], Any],
+        workers: int = 8,
+        chunk_size: int = 200,
+        progress_interval: float = 60
+    ):
+        self.db = db
+        self._send = send
+        self._report = report
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.progress_interval = progress_interval
+        self._threads: Dict[int, threading.Thread] = {}
+
+    def start(self, admin_id: int, text: str) -> int:
+        """Создать задание рассылки и запустить его в фоне; вернуть id задания"""
+        job = self.db.create_broadcast_job(admin_id, text)
+        if job is None:
+            raise RuntimeError("Не удалось создать задание рассылки")
+        self._spawn(job)
+        return job['job_id']
+
+    def resume_unfinished(self) -> int:
+        """Продолжить рассылки, прерванные остановкой бота"""
+        jobs = self.db.get_unfinished_broadcast_jobs()
+        for job in jobs:
+            self._spawn(job)
+        return len(jobs)
+
+    def wait(self, job_id: int, timeout: Optional[float] = None):
+        """Дождаться завершения задания (для тестов и бенчмарков)"""
+        thread = self._threads.get(job_id)
+        if thread is not None:
+            thread.join(timeout)
+
+    def _spawn(self, job: Dict):
+        """Запустить поток задания"""
+        thread = threading.Thread(
+            target=self._run_job, args=(job,),
+            name=f"broadcast-{job['job_id']}", daemon=True
+        )
+        self._threads[job['job_id']] = thread
+        thread.start()
+
+    def _run_job(self, job: Dict):
+        """Выполнить задание рассылки"""
+        counters = {
+            DELIVERED: job['success'],
+            FAILED: job['failures'],
+            BLOCKED: job['blocked']
+        }
+        last_user_id = job['last_user_id']
+        last_report = time.monotonic()
+        started = time.monotonic()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='broadcast-send') as executor:
+                while True:
+                    user_ids = self.db.get_user_ids_after(last_user_id, self.chunk_size)
+                    if not user_ids:
+                        break
+
+                    for result in executor.map(lambda uid: self._deliver(uid, job['text']), user_ids):
+                        counters[result] += 1
+                    last_user_id = user_ids[-1]
+                    self.db.update_broadcast_job(
+                        job['job_id'], last_user_id,
+                        counters[DELIVERED], counters[FAILED], counters[BLOCKED]
+                    )
+
+                    if time.monotonic() - last_report >= self.progress_interval:
+                        last_report = time.monotonic()
+                        self._safe_report(job['admin_id'], self._format_progress(job, counters), False)
+        except Exception as e:
+            logger.error(f"Рассылка {job['job_id']} прервана: {e}")
+            self._safe_report(job['admin_id'], f"⚠️ Рассылка прервана из-за ошибки: {e}", True)
+            return
+
+        self.db.update_broadcast_job(
+            job['job_id'], last_user_id,
+            counters[DELIVERED], counters[FAILED], counters[BLOCKED],
+            status='done'
+        )
+        elapsed = time.monotonic() - started
+        self._safe_report(
+            job['admin_id'],
+            f"Рассылка завершена!\n\n"
+            f"Успешно: {counters[DELIVERED]}\n"
+            f"Не удалось: {counters[FAILED]}\n"
+            f"Заблокировали бота: {counters[BLOCKED]}\n"
+            f"Время: {elapsed:.0f} с",
+            True
+        )
+
+    def _deliver(self, user_id: int, text: str) -> str:
+        """Отправить одно сообщение и дождаться результата"""
+        try:
+            self._send(user_id, text)
+            return DELIVERED
+        except Exception as e:
+            return self._failure(user_id, e)
+
+    def _failure(self, user_id: int, error: Exception) -> str:
+        """Итог неудачной отправки (429 сюда не доходят - их повторяет очередь)"""
+        if is_blocked_error(error):
+            return BLOCKED
+        logger.warning(f"Не удалось отправить рассылку пользователю {user_id}: {error}")
+        return FAILED
+
+    def _format_progress(self, job: Dict, counters: Dict[str, int]) -> str:
+        """Текст промежуточного отчета"""
+        done = sum(counters.values())
+        total = job['total'] or done
+        return (
+            f"Рассылка #{job['job_id']}: обработано {done} из {total}\n"
+            f"Успешно: {counters[DELIVERED]}, не удалось: {counters[FAILED]}, "
+            f"заблокировали бота: {counters[BLOCKED]}"
+        )
+
+    def _safe_report(self, admin_id: int, text: str, finished: bool):
+        """Отправить отчет администратору, не прерывая рассылку при ошибке"""
+        try:
+            self._report(admin_id, text, finished)
+        except Exception as e:
+            logger.error(f"Не удалось отправить отчет о рассылке: {e}")
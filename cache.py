@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """Потокобезопасный LRU-кэш с ограничением размера и временем жизни записей"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Получить значение или None, если его нет или оно устарело"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        """Сохранить значение, вытеснив самую старую запись при переполнении"""
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """Удалить запись из кэша"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Очистить кэш"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика попаданий и промахов"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0
+            }
+
+
+class MarkupCache:
+    """Клавиатуры, собранные и сериализованные в JSON один раз.
+
+    Одна и та же клавиатура уходит с тысячами сообщений, поэтому отправляется
+    готовая JSON-строка (telebot передает строку в API как есть). Ключ должен
+    включать все, от чего зависят кнопки: изменились кнопки - изменился ключ,
+    и клавиатура собирается заново.
+    """
+
+    def __init__(self):
+        self._markups: Dict[Hashable, str] = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def get(self, key: Hashable, build: Callable[[], Any]) -> str:
+        """JSON клавиатуры по ключу; build() собирает ее при первом обращении"""
+        markup = self._markups.get(key)
+        if markup is None:
+            markup = build().to_json()
+            with self._lock:
+                if key not in self._markups:
+                    self._markups[key] = markup
+                    self.builds += 1
+                markup = self._markups[key]
+        return markup
+
+    def clear(self):
+        """Забыть все клавиатуры (соберутся заново при следующем обращении)"""
+        with self._lock:
+            self._markups.clear()
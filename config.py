@@ -5,7 +5,50 @@ load_dotenv()
 
 # Конфигурационные параметры
 TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
-ADMIN_IDS = list(map(int, os.getenv('ADMIN_IDS', '').replace(' ', '').split(','))) if os.getenv('ADMIN_IDS') else []
+# Адрес сервера Bot API без /bot<token> (например, заглушки benchmarks/fake_telegram.py); пусто - api.telegram.org
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+ADMIN_IDS = frozenset(map(int, os.getenv('ADMIN_IDS', '').replace(' ', '').split(','))) if os.getenv('ADMIN_IDS') else frozenset()
 DB_NAME = 'sleep_bot.db'
-POLL_TIME = '08:00'  # Время отправки опроса (по умолчанию 8 утра)
-FACT_TIME = '20:00'  # Время отправки факта/совета (по умолчанию 8 вечера)
\ No newline at end of file
+
+# Параметры массовой рассылки (скорость - OUTBOX_CLASS_RATES для массовых сообщений)
+BROADCAST_WORKERS = 8  # потоков отправки
+BROADCAST_PROGRESS_INTERVAL = 60  # период отчетов о ходе рассылки, секунд
+
+# Параметры общей очереди исходящих сообщений
+OUTBOX_GLOBAL_RATE = 30  # всего сообщений в секунду
+OUTBOX_CLASS_RATES = {  # сообщений в секунду по классам: интерактивные, плановые, массовые
+    0: 30,
+    1: 25,
+    2: 20
+}
+OUTBOX_WORKERS = 4  # потоков отправки (шардов очереди)
+OUTBOX_SHUTDOWN_TIMEOUT = 30  # секунд на отправку оставшихся сообщений при остановке
+
+# Параметры еженедельного анализа
+ANALYSIS_WORKERS = int(os.getenv('ANALYSIS_WORKERS', os.cpu_count() or 1))  # процессов анализа (1 - без пула)
+# Затухание в корреляционном анализе: через сколько опросов вес записи падает вдвое (0 - без затухания)
+CORRELATION_HALF_LIFE = float(os.getenv('CORRELATION_HALF_LIFE', 0))
+
+# Хранилище состояний диалогов (регистрация, опрос): 'sqlite' - переживает перезапуск, 'memory' - только в памяти
+STATE_STORE = os.getenv('STATE_STORE', 'sqlite')
+
+# Прием обновлений: 'polling' - опрос getUpdates, 'webhook' - встроенный HTTP-сервер
+UPDATE_MODE = os.getenv('UPDATE_MODE', 'polling')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8443))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+# Публичный адрес вебхука для setWebhook (обычно https-прокси перед ботом); пусто - не регистрировать
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')  # секретный токен, который Telegram передает в заголовке
+WEBHOOK_QUEUE_SIZE = 10000  # обновлений в очереди; при переполнении Telegram получает 503 и повторяет
+WEBHOOK_WORKERS = 8  # потоков обработки обновлений
+
+# Среда выполнения: 'threads' - TeleBot и потоки, 'asyncio' - AsyncTeleBot и корутины (нужен aiohttp)
+RUNTIME = os.getenv('RUNTIME', 'threads')
+ASYNC_EXECUTOR_WORKERS = 16  # потоков для обработчиков и запросов к базе данных в режиме asyncio
+ASYNC_NOTIFICATION_WORKERS = 4  # потоков для персональных уведомлений в режиме asyncio (отдельно от обработчиков)
+ASYNC_SEND_CONCURRENCY = {  # одновременных запросов к Telegram по классам приоритета в режиме asyncio
+    0: 100,
+    1: 200,
+    2: 500
+}
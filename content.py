@@ -0,0 +1,132 @@
+import logging
+import random
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Виды материалов
+TIP = 'tip'
+FACT = 'fact'
+
+RELOAD_INTERVAL = 5  # как часто подхватывать изменения, сделанные другими процессами, минут
+PICK_ATTEMPTS = 8  # случайных проб до перебора непросмотренных материалов
+TAGS_PREFIX = 'ТЕГИ:'  # последняя строка сообщения администратора с тегами материала
+
+
+class ContentItem(NamedTuple):
+    """Совет или факт из таблицы content"""
+    content_id: int
+    type: str
+    text: str
+    tags: Tuple[str, ...] = ()
+
+
+def unpack_tags(packed: Optional[str]) -> Tuple[str, ...]:
+    """Строка из базы данных -> кортеж тегов"""
+    return tuple(packed.split(',')) if packed else ()
+
+
+def pack_tags(tags: Tuple[str, ...]) -> str:
+    """Кортеж тегов -> строка для базы данных"""
+    return ','.join(tags)
+
+
+def split_tags(text: str) -> Tuple[str, Tuple[str, ...]]:
+    """'Текст\\nТЕГИ: кофеин, вечер' -> ('Текст', ('кофеин', 'вечер'))"""
+    body, _, last_line = text.rpartition('\n')
+    if not last_line.strip().upper().startswith(TAGS_PREFIX):
+        return text.strip(), ()
+    tags = last_line.strip()[len(TAGS_PREFIX):].split(',')
+    tags = tuple(dict.fromkeys(tag.strip().lower() for tag in tags if tag.strip()))
+    return body.strip(), tags
+
+
+def pack_seen(seen: int) -> bytes:
+    """Битовая маска просмотренных id -> байты для базы данных"""
+    return seen.to_bytes((seen.bit_length() + 7) // 8, 'little')
+
+
+def unpack_seen(packed: Optional[bytes]) -> int:
+    """Байты из базы данных -> битовая маска просмотренных id"""
+    return int.from_bytes(packed, 'little') if packed else 0
+
+
+class ContentPool:
+    """Активные советы и факты в памяти: массив id на каждый вид.
+
+    Выбор случайного материала - одно обращение к массиву. reload() читает
+    только строки, измененные после прошлой загрузки (по возрастающему
+    номеру ревизии), и добавляет их в массив или удаляет из него, поэтому
+    новый совет появляется без перезапуска и без правки кода.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._items: Dict[int, ContentItem] = {}
+        self._active: Dict[str, List[int]] = {TIP: [], FACT: []}
+        # Позиция id в массиве своего вида - для удаления за O(1)
+        self._positions: Dict[int, int] = {}
+        self._revision = 0
+        self._lock = threading.Lock()
+        self.reload()
+        logger.info(f"Загружено советов: {len(self._active[TIP])}, фактов: {len(self._active[FACT])}")
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def reload(self) -> int:
+        """Подхватить добавленные и измененные материалы; вернуть число изменений"""
+        with self._lock:
+            rows = self.db.get_content_since(self._revision)
+            for content_id, content_type, text, tags, active, revision in rows:
+                self._remove(content_id)
+                item = ContentItem(content_id, content_type, text, unpack_tags(tags))
+                self._items[content_id] = item
+                if active:
+                    ids = self._active.setdefault(content_type, [])
+                    self._positions[content_id] = len(ids)
+                    ids.append(content_id)
+                self._revision = max(self._revision, revision)
+        return len(rows)
+
+    def _remove(self, content_id: int):
+        """Убрать id из массива активных: на его место встает последний"""
+        position = self._positions.pop(content_id, None)
+        if position is None:
+            return
+        ids = self._active[self._items[content_id].type]
+        last = ids.pop()
+        if last != content_id:
+            ids[position] = last
+            self._positions[last] = position
+
+    def get(self, content_id: int) -> Optional[ContentItem]:
+        """Материал по id (в том числе отключенный)"""
+        return self._items.get(content_id)
+
+    def pick_unseen(self, content_type: str, seen: int) -> Tuple[Optional[ContentItem], int]:
+        """Случайный активный материал, которого пользователь еще не видел.
+
+        seen - битовая маска просмотренных id (бит content_id). Пока
+        непросмотренных много, хватает пары случайных проб; иначе выбор
+        из оставшихся. Когда просмотрены все материалы вида, их биты
+        сбрасываются и круг начинается заново. Новые материалы сразу
+        считаются непросмотренными. Возвращает материал и новую маску.
+        """
+        with self._lock:
+            ids = self._active.get(content_type)
+            if not ids:
+                return None, seen
+            for _ in range(PICK_ATTEMPTS):
+                content_id = random.choice(ids)
+                if not seen >> content_id & 1:
+                    break
+            else:
+                unseen = [content_id for content_id in ids if not seen >> content_id & 1]
+                if not unseen:
+                    for content_id in ids:
+                        seen &= ~(1 << content_id)
+                    unseen = ids
+                content_id = random.choice(unseen)
+            return self._items[content_id], seen | 1 << content_id
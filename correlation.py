@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import math
+import sqlite3
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Факторы, корреляция которых с качеством сна анализируется
+CORRELATION_FACTORS = [
+    'stress_level', 'exercise', 'caffeine', 'alcohol', 
+    'screen_time', 'bedtime_num', 'awakenings', 'mood_morning'
+]
+# Суммы, по которым считается коэффициент Пирсона фактора x с качеством сна y
+STAT_COLUMNS = ['weight', 'sum_x', 'sum_y', 'sum_xx', 'sum_yy', 'sum_xy']
+# Столбцы опроса, из которых берутся факторы (bedtime_num - из bedtime)
+SURVEY_COLUMNS = ['stress_level', 'exercise', 'caffeine', 'alcohol', 'screen_time', 'bedtime', 'awakenings', 'mood_morning']
+
+
+def hours_or_nan(value: str) -> float:
+    """Разобрать одно значение 'ЧЧ:ММ' в часы (NaN, если формат неверный)"""
+    try:
+        hours, minutes = value.split(':')
+        return float(hours) + float(minutes)/60
+    except (AttributeError, ValueError):
+        return math.nan
+
+
+def decay_for_half_life(half_life: float) -> float:
+    """Множитель веса старых опросов при каждом новом опросе.
+
+    half_life - через сколько опросов вес записи падает вдвое; 0 - без затухания.
+    """
+    if half_life <= 0:
+        return 1.0
+    return 0.5 ** (1 / half_life)
+
+
+def survey_factor_values(survey: Dict) -> Dict[str, float]:
+    """Значения факторов корреляционного анализа для одного опроса"""
+    values = {}
+    for factor in CORRELATION_FACTORS:
+        if factor == 'bedtime_num':
+            value = hours_or_nan(survey.get('bedtime'))
+        else:
+            value = survey.get(factor)
+            value = math.nan if value is None else float(value)
+        values[factor] = value
+    return values
+
+
+def update_correlation_stats(
+    cursor: sqlite3.Cursor,
+    user_id: int,
+    survey: Dict,
+    decay: float = 1.0
+):
+    """Учесть новый опрос в накопленных суммах пользователя.
+
+    При decay < 1 все прежние суммы сначала умножаются на decay, поэтому
+    недавние недели весят больше. Фактор без значения в опросе пропускается,
+    как и в DataFrame.corr (попарно заданные значения). Опрос без оценки
+    качества сна не учитывается вовсе и не старит прежние суммы -
+    так же, как в rebuild_correlation_stats.
+    """
+    quality = survey.get('sleep_quality')
+    if quality is None:
+        return
+    quality = float(quality)
+
+    if decay < 1:
+        cursor.execute('''
+        UPDATE correlation_stats
+        SET weight = weight * ?, sum_x = sum_x * ?, sum_y = sum_y * ?,
+            sum_xx = sum_xx * ?, sum_yy = sum_yy * ?, sum_xy = sum_xy * ?
+        WHERE user_id = ?
+        ''', (decay,) * 6 + (user_id,))
+
+    rows = [
+        (user_id, factor, value, quality, value * value, quality * quality, value * quality)
+        for factor, value in survey_factor_values(survey).items()
+        if not math.isnan(value)
+    ]
+    cursor.executemany('''
+    INSERT INTO correlation_stats (user_id, factor, weight, sum_x, sum_y, sum_xx, sum_yy, sum_xy)
+    VALUES (?, ?, 1, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, factor) DO UPDATE SET
+        weight = weight + 1,
+        sum_x = sum_x + excluded.sum_x,
+        sum_y = sum_y + excluded.sum_y,
+        sum_xx = sum_xx + excluded.sum_xx,
+        sum_yy = sum_yy + excluded.sum_yy,
+        sum_xy = sum_xy + excluded.sum_xy
+    ''', rows)
+
+
+def rebuild_correlation_stats(
+    cursor: sqlite3.Cursor,
+    user_id: Optional[int] = None,
+    decay: float = 1.0
+) -> int:
+    """Пересчитать суммы по полной истории опросов (всех пользователей или одного).
+
+    Опросы без оценки качества сна пропускаются (и не участвуют в затухании),
+    поэтому результат совпадает с последовательными update_correlation_stats.
+    Возвращает количество пересчитанных пользователей.
+    """
+    import numpy as np
+    import pandas as pd
+    from analysis import parse_hours
+
+    condition = 'WHERE user_id = ?' if user_id is not None else ''
+    params = (user_id,) if user_id is not None else ()
+    cursor.execute(f'DELETE FROM correlation_stats {condition}', params)
+    cursor.execute(f'''
+    SELECT user_id, sleep_quality, {', '.join(SURVEY_COLUMNS)}
+    FROM surveys
+    WHERE sleep_quality IS NOT NULL {'AND user_id = ?' if user_id is not None else ''}
+    ORDER BY user_id, date, survey_id
+    ''', params)
+    columns = [description[0] for description in cursor.description]
+    data = pd.DataFrame(cursor.fetchall(), columns=columns)
+    if data.empty:
+        return 0
+
+    data['bedtime_num'] = parse_hours(data['bedtime'])
+    # Вес записи: decay в степени числа более поздних опросов пользователя
+    newer = data.groupby('user_id').cumcount(ascending=False).to_numpy()
+    weight = pd.Series(np.power(decay, newer), index=data.index)
+    y = data['sleep_quality'].astype(float)
+
+    rows = []
+    for factor in CORRELATION_FACTORS:
+        x = data[factor].astype(float)
+        valid = x.notna() & y.notna()
+        w = weight.where(valid, 0.0)
+        xv = x.where(valid, 0.0)
+        yv = y.where(valid, 0.0)
+        sums = pd.DataFrame({
+            'weight': w,
+            'sum_x': w * xv,
+            'sum_y': w * yv,
+            'sum_xx': w * xv * xv,
+            'sum_yy': w * yv * yv,
+            'sum_xy': w * xv * yv,
+            'count': valid.astype(int)
+        }).groupby(data['user_id']).sum()
+        sums = sums[sums['count'] > 0]
+        rows.extend(
+            (int(uid), factor, *map(float, values))
+            for uid, values in zip(sums.index, sums[STAT_COLUMNS].to_numpy())
+        )
+
+    cursor.executemany('''
+    INSERT INTO correlation_stats (user_id, factor, weight, sum_x, sum_y, sum_xx, sum_yy, sum_xy)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    return int(data['user_id'].nunique())
+
+
+def pearson_from_stats(stats: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Коэффициенты Пирсона и средние факторов по накопленным суммам.
+
+    stats - строки correlation_stats (столбцы user_id, factor и STAT_COLUMNS).
+    Возвращает две таблицы (строки - user_id, столбцы - факторы):
+    корреляции с качеством сна и средние значения факторов.
+    Время работы не зависит от длины истории пользователя.
+    """
+    import numpy as np
+    import pandas as pd
+
+    n = stats['weight']
+    cov = n * stats['sum_xy'] - stats['sum_x'] * stats['sum_y']
+    var_x = n * stats['sum_xx'] - stats['sum_x'] ** 2
+    var_y = n * stats['sum_yy'] - stats['sum_y'] ** 2
+    # Постоянный ряд дает не ровно ноль из-за округления - считаем его нулевым
+    var_x = var_x.where(var_x > 1e-9 * n * stats['sum_xx'])
+    var_y = var_y.where(var_y > 1e-9 * n * stats['sum_yy'])
+
+    corr = (cov / np.sqrt(var_x * var_y)).clip(-1, 1)
+    means = stats['sum_x'] / n.where(n > 0)
+
+    index = pd.MultiIndex.from_frame(stats[['user_id', 'factor']])
+    corr = pd.Series(corr.to_numpy(), index=index).unstack('factor').reindex(columns=CORRELATION_FACTORS)
+    means = pd.Series(means.to_numpy(), index=index).unstack('factor').reindex(columns=CORRELATION_FACTORS)
+    return corr, means
+
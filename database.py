@@ -1,18 +1,246 @@
+from __future__ import annotations
+
 import sqlite3
 from datetime import datetime, timedelta
-import pandas as pd
-import numpy as np
-from typing import List, Dict, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator, List, Dict, Optional, Set, Tuple
 import logging
+import threading
+import queue
+import time
+import atexit
+import weakref
+from concurrent.futures import Future
+
+if TYPE_CHECKING:
+    # pandas нужен только для анализа и загружается при первом обращении к нему
+    import pandas as pd
+
+    from content import ContentItem
+
+from cache import TTLCache
+from correlation import pearson_from_stats, rebuild_correlation_stats, update_correlation_stats, STAT_COLUMNS
+from migrations import apply_migrations, rebuild_user_aggregates
 
 # Настройка логгирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class Database:
+# Параметры соединений SQLite
+BUSY_TIMEOUT = 30  # секунд ожидания блокировки вместо мгновенного "database is locked"
+CACHED_STATEMENTS = 256  # размер кэша подготовленных запросов на соединение
+CACHE_SIZE_KB = 16384  # размер страничного кэша (PRAGMA cache_size, в КБ)
+MMAP_SIZE = 256 * 1024 * 1024  # объем файла, читаемый через mmap
+
+# Параметры отложенной записи
+WRITE_QUEUE_SIZE = 10000  # максимум операций в очереди (при переполнении вызывающий ждет)
+WRITE_BATCH_SIZE = 200  # максимум операций в одной транзакции
+WRITE_BATCH_LATENCY = 0.05  # максимальная задержка перед фиксацией пакета, секунд
+
+# Параметры кэша профилей пользователей
+PROFILE_CACHE_SIZE = 10000  # максимум профилей в памяти
+PROFILE_CACHE_TTL = 300  # время жизни профиля в кэше, секунд
+
+FETCH_BATCH_SIZE = 500  # строк за одно чтение при потоковой выборке
+
+# Вид персональной рекомендации по итогам анализа (recommendations.kind).
+# Советы и факты дня записываются с видом материала: 'tip' или 'fact'
+PERSONAL_RECOMMENDATION = 'personal'
+ANALYSIS_CHUNK_ROWS = 50000  # строк опросов за одно чтение при пакетном анализе
+
+
+class _ConnectionHolder:
+    """Соединение в threading.local (на sqlite3.Connection нельзя взять слабую ссылку)"""
+
+    __slots__ = ('conn', '__weakref__')
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+
+class ConnectionManager:
+    """Долгоживущие соединения SQLite: по одному на поток.
+
+    База переводится в режим WAL, поэтому читатели не блокируют писателя
+    опросов и наоборот. Каждое соединение хранит кэш подготовленных запросов.
+    Соединение закрывается, когда его поток завершается, поэтому короткие
+    потоки (например, задания рассылки) не копят открытые соединения.
+    """
+
     def __init__(self, db_name: str):
         self.db_name = db_name
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: Set[sqlite3.Connection] = set()
+
+    def get(self) -> sqlite3.Connection:
+        """Получить соединение текущего потока (создается при первом обращении)"""
+        holder = getattr(self._local, 'holder', None)
+        if holder is None:
+            conn = self._connect()
+            with self._lock:
+                self._connections.add(conn)
+            # Данные threading.local удаляются при завершении потока - вместе с ними
+            # освобождается holder, и финализатор закрывает соединение
+            holder = self._local.holder = _ConnectionHolder(conn)
+            weakref.finalize(holder, self._release, conn)
+        return holder.conn
+
+    def _release(self, conn: sqlite3.Connection):
+        """Закрыть соединение завершившегося потока"""
+        with self._lock:
+            self._connections.discard(conn)
+        try:
+            conn.close()
+        except Exception as e:
+            logger.error(f"Ошибка при закрытии соединения: {e}")
+
+    def _connect(self) -> sqlite3.Connection:
+        """Открыть новое соединение и настроить PRAGMA"""
+        conn = sqlite3.connect(
+            self.db_name,
+            timeout=BUSY_TIMEOUT,
+            cached_statements=CACHED_STATEMENTS,
+            check_same_thread=False
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    def close_all(self):
+        """Закрыть все открытые соединения (при остановке бота)"""
+        with self._lock:
+            connections, self._connections = self._connections, set()
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception as e:
+                logger.error(f"Ошибка при закрытии соединения: {e}")
+        self._local = threading.local()
+
+
+class WriteBehindQueue:
+    """Фоновый поток записи с групповой фиксацией транзакций.
+
+    Операции записи (функции, принимающие курсор) ставятся в ограниченную
+    очередь и выполняются пакетами: пакет фиксируется, как только набралось
+    WRITE_BATCH_SIZE операций или прошло WRITE_BATCH_LATENCY секунд с первой
+    операции пакета. Каждая операция выполняется внутри SAVEPOINT, поэтому
+    ошибка одной не откатывает остальные. Результат доступен через Future.
+    """
+
+    _STOP = object()
+
+    def __init__(self, connections: ConnectionManager):
+        self._connections = connections
+        self._queue: queue.Queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._closed = False
+        self._thread.start()
+
+    def submit(self, operation: Callable[[sqlite3.Cursor], Any]) -> Future:
+        """Поставить операцию записи в очередь"""
+        future: Future = Future()
+        if self._closed:
+            future.set_exception(RuntimeError("Очередь записи остановлена"))
+            return future
+        self._queue.put((operation, future))
+        return future
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Дождаться записи всех ранее поставленных операций"""
+        if self._closed:
+            return True
+        marker: Future = Future()
+        self._queue.put((None, marker))
+        try:
+            marker.result(timeout)
+            return True
+        except Exception:
+            return False
+
+    def close(self, timeout: Optional[float] = None):
+        """Записать оставшиеся операции и остановить поток"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put((self._STOP, None))
+        self._thread.join(timeout)
+
+    def _run(self):
+        """Основной цикл потока записи"""
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + WRITE_BATCH_LATENCY
+            while len(batch) < WRITE_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            if any(operation is self._STOP for operation, _ in batch):
+                stop = True
+                # Забираем все, что успели поставить до остановки
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+            self._commit_batch([item for item in batch if item[0] is not self._STOP])
+
+    def _commit_batch(self, batch: List[Tuple[Optional[Callable], Future]]):
+        """Выполнить пакет операций в одной транзакции"""
+        operations = [(operation, future) for operation, future in batch if operation is not None]
+        markers = [future for operation, future in batch if operation is None]
+        outcomes = []
+
+        conn = self._connections.get()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            for operation, future in operations:
+                cursor.execute('SAVEPOINT write_op')
+                try:
+                    outcomes.append((future, operation(cursor), None))
+                except Exception as e:
+                    cursor.execute('ROLLBACK TO write_op')
+                    outcomes.append((future, None, e))
+                cursor.execute('RELEASE write_op')
+            conn.commit()
+        except Exception as e:
+            logger.error(f"Ошибка при фиксации пакета записи: {e}")
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            outcomes = [(future, None, e) for _, future in operations]
+
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        for marker in markers:
+            marker.set_result(True)
+
+
+class Database:
+    def __init__(self, db_name: str, correlation_decay: float = 1.0):
+        self.db_name = db_name
+        # Множитель веса старых опросов в суммах для корреляций (1 - без затухания)
+        self.correlation_decay = correlation_decay
+        self._connections = ConnectionManager(db_name)
+        self._profile_cache = TTLCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL)
         self._initialize_db()
+        self._writer = WriteBehindQueue(self._connections)
+        atexit.register(self.close)
 
     def _initialize_db(self):
         """Инициализация базы данных и создание таблиц"""
@@ -82,13 +310,57 @@ class Database:
                 ''')
                 
                 conn.commit()
+
+                # Индексы и изменения схемы для существующих баз
+                apply_migrations(conn, correlation_decay=self.correlation_decay)
         except Exception as e:
             logger.error(f"Ошибка при инициализации базы данных: {e}")
             raise
 
-    def _get_connection(self):
-        """Получить соединение с базой данных"""
-        return sqlite3.connect(self.db_name)
+    def _get_connection(self) -> sqlite3.Connection:
+        """Получить соединение с базой данных (одно на поток, переиспользуется)"""
+        return self._connections.get()
+
+    def close(self):
+        """Записать отложенные операции и закрыть все соединения с базой данных"""
+        self._writer.close()
+        self._connections.close_all()
+
+    def submit_write(self, operation: Callable[[sqlite3.Cursor], Any]) -> Future:
+        """Поставить операцию записи в фоновую очередь (результат - через Future)"""
+        return self._writer.submit(operation)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Дождаться записи всех отложенных операций"""
+        return self._writer.flush(timeout)
+
+    def _write(
+        self,
+        operation: Callable[[sqlite3.Cursor], Any],
+        wait: bool,
+        error_message: str,
+        on_done: Optional[Callable[[], None]] = None
+    ) -> bool:
+        """Поставить операцию в очередь; при wait=True дождаться результата.
+
+        on_done вызывается после фиксации (или ошибки) операции.
+        """
+        future = self._writer.submit(operation)
+        if on_done is not None:
+            future.add_done_callback(lambda _: on_done())
+        if not wait:
+            def log_error(done: Future):
+                if done.exception() is not None:
+                    logger.error(f"{error_message}: {done.exception()}")
+
+            future.add_done_callback(log_error)
+            return True
+        try:
+            future.result()
+            return True
+        except Exception as e:
+            logger.error(f"{error_message}: {e}")
+            return False
 
     def register_user(
         self,
@@ -110,6 +382,7 @@ class Database:
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)
                 ''', (user_id, username, age, age_category, gender, lifestyle, registration_date, registration_date))
                 conn.commit()
+            self.invalidate_user(user_id)
             return True
         except sqlite3.IntegrityError:
             logger.warning(f"Пользователь {user_id} уже зарегистрирован")
@@ -131,8 +404,28 @@ class Database:
         else:
             return "пожилой"
 
+    def invalidate_user(self, user_id: int):
+        """Удалить профиль пользователя из кэша (вызывать при любом изменении профиля)"""
+        self._profile_cache.invalidate(user_id)
+
+    def profile_cache_stats(self) -> Dict:
+        """Статистика кэша профилей"""
+        return self._profile_cache.stats()
+
     def get_user(self, user_id: int) -> Optional[Dict]:
-        """Получить информацию о пользователе"""
+        """Получить информацию о пользователе (через кэш профилей)"""
+        user = self._profile_cache.get(user_id)
+        if user is not None:
+            return dict(user)
+
+        user = self._load_user(user_id)
+        if user is not None:
+            self._profile_cache.set(user_id, user)
+            return dict(user)
+        return None
+
+    def _load_user(self, user_id: int) -> Optional[Dict]:
+        """Прочитать профиль пользователя из базы данных"""
         try:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
@@ -147,21 +440,22 @@ class Database:
             logger.error(f"Ошибка при получении пользователя: {e}")
             return None
 
-    def update_user_activity(self, user_id: int) -> bool:
+    def update_user_activity(self, user_id: int, wait: bool = False) -> bool:
         """Обновить дату последней активности пользователя"""
-        try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                UPDATE users 
-                SET last_active_date = ?
-                WHERE user_id = ?
-                ''', (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), user_id))
-                conn.commit()
-            return True
-        except Exception as e:
-            logger.error(f"Ошибка при обновлении активности пользователя: {e}")
-            return False
+        last_active_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        def operation(cursor: sqlite3.Cursor):
+            cursor.execute('''
+            UPDATE users 
+            SET last_active_date = ?
+            WHERE user_id = ?
+            ''', (last_active_date, user_id))
+
+        self.invalidate_user(user_id)
+        return self._write(
+            operation, wait, "Ошибка при обновлении активности пользователя",
+            on_done=lambda: self.invalidate_user(user_id)
+        )
 
     def save_survey(
         self,
@@ -177,41 +471,69 @@ class Database:
         caffeine: int,
         alcohol: int,
         screen_time: int,
-        notes: str = ""
+        notes: str = "",
+        wait: bool = False
     ) -> bool:
         """Сохранить результаты опроса"""
-        try:
-            date = datetime.now().strftime('%Y-%m-%d')
-            
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                INSERT INTO surveys (
-                    user_id, date, bedtime, wakeup_time, sleep_duration, 
-                    awakenings, sleep_quality, mood_morning, stress_level, 
-                    exercise, caffeine, alcohol, screen_time, notes
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    user_id, date, bedtime, wakeup_time, sleep_duration,
-                    awakenings, sleep_quality, mood_morning, stress_level,
-                    exercise, caffeine, alcohol, screen_time, notes
-                ))
-                
-                # Проверяем достижения
-                self._check_achievements(user_id, cursor)
-                
-                conn.commit()
-            return True
-        except Exception as e:
-            logger.error(f"Ошибка при сохранении опроса: {e}")
-            return False
+        date = datetime.now().strftime('%Y-%m-%d')
+
+        def operation(cursor: sqlite3.Cursor):
+            cursor.execute('''
+            INSERT INTO surveys (
+                user_id, date, bedtime, wakeup_time, sleep_duration, 
+                awakenings, sleep_quality, mood_morning, stress_level, 
+                exercise, caffeine, alcohol, screen_time, notes
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                user_id, date, bedtime, wakeup_time, sleep_duration,
+                awakenings, sleep_quality, mood_morning, stress_level,
+                exercise, caffeine, alcohol, screen_time, notes
+            ))
+
+            # Агрегаты обновляются в той же транзакции, что и сам опрос
+            cursor.execute('''
+            INSERT INTO user_aggregates (
+                user_id, survey_count,
+                sum_sleep_duration, sum_sleep_quality, sum_awakenings,
+                min_sleep_duration, max_sleep_duration,
+                min_sleep_quality, max_sleep_quality,
+                last_survey_date
+            )
+            VALUES (?, 1, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET
+                survey_count = survey_count + 1,
+                sum_sleep_duration = sum_sleep_duration + excluded.sum_sleep_duration,
+                sum_sleep_quality = sum_sleep_quality + excluded.sum_sleep_quality,
+                sum_awakenings = sum_awakenings + excluded.sum_awakenings,
+                min_sleep_duration = MIN(COALESCE(min_sleep_duration, excluded.min_sleep_duration), excluded.min_sleep_duration),
+                max_sleep_duration = MAX(COALESCE(max_sleep_duration, excluded.max_sleep_duration), excluded.max_sleep_duration),
+                min_sleep_quality = MIN(COALESCE(min_sleep_quality, excluded.min_sleep_quality), excluded.min_sleep_quality),
+                max_sleep_quality = MAX(COALESCE(max_sleep_quality, excluded.max_sleep_quality), excluded.max_sleep_quality),
+                last_survey_date = MAX(COALESCE(last_survey_date, excluded.last_survey_date), excluded.last_survey_date)
+            ''', (
+                user_id, sleep_duration, sleep_quality, awakenings,
+                sleep_duration, sleep_duration, sleep_quality, sleep_quality, date
+            ))
+
+            # Суммы для корреляционного анализа
+            update_correlation_stats(cursor, user_id, {
+                'bedtime': bedtime, 'sleep_quality': sleep_quality, 'awakenings': awakenings,
+                'mood_morning': mood_morning, 'stress_level': stress_level, 'exercise': exercise,
+                'caffeine': caffeine, 'alcohol': alcohol, 'screen_time': screen_time
+            }, self.correlation_decay)
+
+            # Проверяем достижения
+            self._check_achievements(user_id, cursor)
+
+        return self._write(operation, wait, "Ошибка при сохранении опроса")
 
     def _check_achievements(self, user_id: int, cursor: sqlite3.Cursor):
         """Проверить и добавить достижения пользователя"""
         # Получаем количество завершенных опросов
-        cursor.execute('SELECT COUNT(*) FROM surveys WHERE user_id = ?', (user_id,))
-        survey_count = cursor.fetchone()[0]
+        cursor.execute('SELECT survey_count FROM user_aggregates WHERE user_id = ?', (user_id,))
+        row = cursor.fetchone()
+        survey_count = row[0] if row else 0
         
         achievements = {
             10: "10 опросов",
@@ -256,51 +578,49 @@ class Database:
             logger.error(f"Ошибка при получении достижений: {e}")
             return []
 
-    def save_recommendation(self, user_id: int, recommendation_text: str) -> bool:
+    def save_recommendation(
+        self,
+        user_id: int,
+        recommendation_text: str,
+        wait: bool = False,
+        kind: str = PERSONAL_RECOMMENDATION
+    ) -> bool:
         """Сохранить рекомендацию для пользователя"""
-        try:
-            date = datetime.now().strftime('%Y-%m-%d')
-            
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                INSERT INTO recommendations (user_id, date, recommendation_text)
-                VALUES (?, ?, ?)
-                ''', (user_id, date, recommendation_text))
-                conn.commit()
-            return True
-        except Exception as e:
-            logger.error(f"Ошибка при сохранении рекомендации: {e}")
-            return False
+        date = datetime.now().strftime('%Y-%m-%d')
 
-    def update_recommendation_feedback(self, recommendation_id: int, is_helpful: bool) -> bool:
+        def operation(cursor: sqlite3.Cursor):
+            cursor.execute('''
+            INSERT INTO recommendations (user_id, date, recommendation_text, kind)
+            VALUES (?, ?, ?, ?)
+            ''', (user_id, date, recommendation_text, kind))
+
+        return self._write(operation, wait, "Ошибка при сохранении рекомендации")
+
+    def update_recommendation_feedback(self, recommendation_id: int, is_helpful: bool, wait: bool = False) -> bool:
         """Обновить отзыв о рекомендации"""
-        try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                UPDATE recommendations 
-                SET is_helpful = ?, feedback_date = ?
-                WHERE recommendation_id = ?
-                ''', (int(is_helpful), datetime.now().strftime('%Y-%m-%d %H:%M:%S'), recommendation_id))
-                conn.commit()
-            return True
-        except Exception as e:
-            logger.error(f"Ошибка при обновлении отзыва: {e}")
-            return False
+        feedback_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-    def get_last_recommendation(self, user_id: int) -> Optional[Dict]:
-        """Получить последнюю рекомендацию для пользователя"""
+        def operation(cursor: sqlite3.Cursor):
+            cursor.execute('''
+            UPDATE recommendations 
+            SET is_helpful = ?, feedback_date = ?
+            WHERE recommendation_id = ?
+            ''', (int(is_helpful), feedback_date, recommendation_id))
+
+        return self._write(operation, wait, "Ошибка при обновлении отзыва")
+
+    def get_last_recommendation(self, user_id: int, kind: str = PERSONAL_RECOMMENDATION) -> Optional[Dict]:
+        """Получить последнюю рекомендацию вида kind для пользователя"""
         try:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                 SELECT recommendation_id, recommendation_text, date 
                 FROM recommendations 
-                WHERE user_id = ? 
-                ORDER BY date DESC 
+                WHERE user_id = ? AND kind = ?
+                ORDER BY date DESC, recommendation_id DESC
                 LIMIT 1
-                ''', (user_id,))
+                ''', (user_id, kind))
                 
                 row = cursor.fetchone()
                 if row:
@@ -320,34 +640,33 @@ class Database:
             with self._get_connection() as conn:
                 stats = {}
                 
-                # Основная информация о пользователе
-                cursor = conn.cursor()
-                cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-                user_row = cursor.fetchone()
+                # Основная информация о пользователе (из кэша профилей)
+                user = self.get_user(user_id)
+                if user:
+                    stats['user_info'] = user
                 
-                if user_row:
-                    columns = [description[0] for description in cursor.description]
-                    stats['user_info'] = dict(zip(columns, user_row))
-                
-                # Статистика сна
+                # Статистика сна - одно чтение по первичному ключу из агрегатов
+                cursor = conn.cursor()
                 cursor.execute('''
                 SELECT 
-                    AVG(sleep_duration) as avg_sleep_duration,
-                    AVG(sleep_quality) as avg_sleep_quality,
-                    AVG(awakenings) as avg_awakenings,
-                    COUNT(*) as total_surveys
-                FROM surveys 
+                    survey_count, sum_sleep_duration, sum_sleep_quality, sum_awakenings,
+                    min_sleep_duration, max_sleep_duration, min_sleep_quality, max_sleep_quality
+                FROM user_aggregates 
                 WHERE user_id = ?
                 ''', (user_id,))
                 
-                sleep_stats = cursor.fetchone()
-                if sleep_stats:
-                    stats['sleep_stats'] = {
-                        'avg_sleep_duration': round(sleep_stats[0], 1) if sleep_stats[0] else 0,
-                        'avg_sleep_quality': round(sleep_stats[1], 1) if sleep_stats[1] else 0,
-                        'avg_awakenings': round(sleep_stats[2], 1) if sleep_stats[2] else 0,
-                        'total_surveys': sleep_stats[3] if sleep_stats[3] else 0
-                    }
+                row = cursor.fetchone()
+                count = row[0] if row else 0
+                stats['sleep_stats'] = {
+                    'avg_sleep_duration': round(row[1] / count, 1) if count else 0,
+                    'avg_sleep_quality': round(row[2] / count, 1) if count else 0,
+                    'avg_awakenings': round(row[3] / count, 1) if count else 0,
+                    'total_surveys': count,
+                    'min_sleep_duration': round(row[4], 1) if count else 0,
+                    'max_sleep_duration': round(row[5], 1) if count else 0,
+                    'min_sleep_quality': row[6] if count else 0,
+                    'max_sleep_quality': row[7] if count else 0
+                }
                 
                 # Последние 7 записей сна
                 cursor.execute('''
@@ -372,6 +691,61 @@ class Database:
             logger.error(f"Ошибка при получении статистики: {e}")
             return {}
 
+    def rebuild_user_aggregates(self, user_id: Optional[int] = None) -> Optional[int]:
+        """Пересчитать агрегаты опросов по полной истории (всех пользователей или одного).
+
+        Возвращает количество пересчитанных пользователей или None при ошибке.
+        """
+        try:
+            return self._writer.submit(lambda cursor: rebuild_user_aggregates(cursor, user_id)).result()
+        except Exception as e:
+            logger.error(f"Ошибка при пересчете агрегатов опросов: {e}")
+            return None
+
+    def rebuild_correlation_stats(self, user_id: Optional[int] = None) -> Optional[int]:
+        """Пересчитать суммы для корреляций по полной истории с текущим затуханием.
+
+        Возвращает количество пересчитанных пользователей или None при ошибке.
+        """
+        try:
+            return self._writer.submit(
+                lambda cursor: rebuild_correlation_stats(cursor, user_id, self.correlation_decay)
+            ).result()
+        except Exception as e:
+            logger.error(f"Ошибка при пересчете сумм для корреляций: {e}")
+            return None
+
+    def get_correlations(self, user_ids: Iterable[int]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Корреляции факторов с качеством сна и средние факторов по накопленным суммам.
+
+        Строки таблиц - user_id в порядке user_ids; для пользователей без данных - NaN.
+        История опросов не читается.
+        """
+        import pandas as pd
+
+        # Идентификаторы могут прийти как numpy.int64, которые sqlite3 не принимает
+        user_ids = [int(user_id) for user_id in user_ids]
+        frames = []
+        try:
+            conn = self._get_connection()
+            for start in range(0, len(user_ids), FETCH_BATCH_SIZE):
+                batch = user_ids[start:start + FETCH_BATCH_SIZE]
+                frames.append(pd.read_sql_query(
+                    f'''
+                    SELECT user_id, factor, {', '.join(STAT_COLUMNS)}
+                    FROM correlation_stats
+                    WHERE user_id IN ({', '.join('?' * len(batch))})
+                    ''',
+                    conn,
+                    params=batch
+                ))
+        except Exception as e:
+            logger.error(f"Ошибка при получении сумм для корреляций: {e}")
+            frames = []
+        stats = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['user_id', 'factor'] + STAT_COLUMNS)
+        corr, means = pearson_from_stats(stats)
+        return corr.reindex(user_ids), means.reindex(user_ids)
+
     def get_all_users(self) -> List[int]:
         """Получить список всех пользователей"""
         try:
@@ -383,38 +757,349 @@ class Database:
             logger.error(f"Ошибка при получении списка пользователей: {e}")
             return []
 
+    def iter_notification_settings(self) -> Iterator[Tuple[int, Optional[str], Optional[str], Optional[int]]]:
+        """Потоково перебрать настройки уведомлений: (user_id, время опроса, время факта, смещение UTC в минутах)"""
+        try:
+            cursor = self._get_connection().cursor()
+            cursor.execute('''
+            SELECT user_id, notification_time, fact_time, timezone_offset
+            FROM users
+            ''')
+            while True:
+                rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+                if not rows:
+                    break
+                yield from rows
+        except Exception as e:
+            logger.error(f"Ошибка при получении настроек уведомлений: {e}")
+
+    def update_notification_settings(
+        self,
+        user_id: int,
+        notification_time: Optional[str] = None,
+        fact_time: Optional[str] = None,
+        timezone_offset: Optional[int] = None
+    ) -> bool:
+        """Изменить время опроса, время факта и/или часовой пояс пользователя"""
+        updates = {
+            'notification_time': notification_time,
+            'fact_time': fact_time,
+            'timezone_offset': timezone_offset
+        }
+        updates = {column: value for column, value in updates.items() if value is not None}
+        if not updates:
+            return True
+
+        def operation(cursor: sqlite3.Cursor):
+            assignments = ', '.join(f'{column} = ?' for column in updates)
+            cursor.execute(
+                f'UPDATE users SET {assignments} WHERE user_id = ?',
+                (*updates.values(), user_id)
+            )
+
+        self.invalidate_user(user_id)
+        return self._write(
+            operation, True, "Ошибка при обновлении настроек уведомлений",
+            on_done=lambda: self.invalidate_user(user_id)
+        )
+
+    def has_survey_on(self, user_id: int, date: str) -> bool:
+        """Проверить, заполнял ли пользователь опрос в указанную дату"""
+        try:
+            cursor = self._get_connection().cursor()
+            cursor.execute(
+                'SELECT 1 FROM surveys WHERE user_id = ? AND date = ? LIMIT 1',
+                (user_id, date)
+            )
+            return cursor.fetchone() is not None
+        except Exception as e:
+            logger.error(f"Ошибка при проверке опроса: {e}")
+            return False
+
     def get_survey_data_for_analysis(self, user_id: int) -> pd.DataFrame:
         """Получить данные опросов для анализа"""
+        import pandas as pd
+
         try:
             with self._get_connection() as conn:
                 query = '''
                 SELECT 
-                    bedtime, wakeup_time, sleep_duration, awakenings, 
+                    date, bedtime, wakeup_time, sleep_duration, awakenings, 
                     sleep_quality, mood_morning, stress_level, exercise, 
                     caffeine, alcohol, screen_time
                 FROM surveys 
                 WHERE user_id = ?
+                ORDER BY date, survey_id
                 '''
                 return pd.read_sql_query(query, conn, params=(user_id,))
         except Exception as e:
             logger.error(f"Ошибка при получении данных для анализа: {e}")
             return pd.DataFrame()
 
+    def iter_survey_frames(self, chunk_rows: int = ANALYSIS_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+        """Потоково читать опросы всех пользователей порциями для пакетного анализа.
+
+        Строки упорядочены по user_id и дате; каждая порция содержит все записи
+        входящих в нее пользователей (хвост последнего пользователя переносится
+        в следующую порцию).
+        """
+        import pandas as pd
+
+        try:
+            query = '''
+            SELECT 
+                user_id, date, bedtime, wakeup_time, sleep_duration, awakenings, 
+                sleep_quality, mood_morning, stress_level, exercise, 
+                caffeine, alcohol, screen_time
+            FROM surveys 
+            ORDER BY user_id, date, survey_id
+            '''
+            carry = None
+            for chunk in pd.read_sql_query(query, self._get_connection(), chunksize=chunk_rows):
+                if carry is not None:
+                    chunk = pd.concat([carry, chunk], ignore_index=True)
+                last_user = chunk['user_id'].iloc[-1]
+                is_last_user = chunk['user_id'] == last_user
+                carry = chunk[is_last_user]
+                if not is_last_user.all():
+                    yield chunk[~is_last_user].reset_index(drop=True)
+            if carry is not None and not carry.empty:
+                yield carry.reset_index(drop=True)
+        except Exception as e:
+            logger.error(f"Ошибка при получении данных для пакетного анализа: {e}")
+
+    def get_user_profiles(self) -> Dict[int, Dict]:
+        """Получить профили всех пользователей одним запросом"""
+        try:
+            cursor = self._get_connection().cursor()
+            cursor.execute('SELECT * FROM users')
+            columns = [description[0] for description in cursor.description]
+            return {row[0]: dict(zip(columns, row)) for row in cursor.fetchall()}
+        except Exception as e:
+            logger.error(f"Ошибка при получении профилей пользователей: {e}")
+            return {}
+
+    def has_recommendation(self, user_id: int, kinds: Iterable[str], since_date: str) -> bool:
+        """Получал ли пользователь рекомендации видов kinds начиная с даты"""
+        kinds = list(kinds)
+        try:
+            cursor = self._get_connection().cursor()
+            cursor.execute(f'''
+            SELECT 1 FROM recommendations
+            WHERE user_id = ? AND kind IN ({', '.join('?' * len(kinds))}) AND date >= ?
+            LIMIT 1
+            ''', (user_id, *kinds, since_date))
+            return cursor.fetchone() is not None
+        except Exception as e:
+            logger.error(f"Ошибка при проверке рекомендаций пользователя: {e}")
+            return False
+
+    def get_users_with_personal_recommendations(self, since_date: str, until_date: str = '9999-12-31') -> Set[int]:
+        """Пользователи, получившие персональные рекомендации (не советы и не факты) с since_date по until_date"""
+        try:
+            cursor = self._get_connection().cursor()
+            cursor.execute('''
+            SELECT DISTINCT user_id FROM recommendations 
+            WHERE kind = ? AND date BETWEEN ? AND ?
+            ''', (PERSONAL_RECOMMENDATION, since_date, until_date))
+            return {row[0] for row in cursor.fetchall()}
+        except Exception as e:
+            logger.error(f"Ошибка при получении пользователей с рекомендациями: {e}")
+            return set()
+
     def add_fact(self, fact_text: str, fact_type: str = "fact") -> bool:
         """Добавить новый факт или совет (для админа)"""
+        return self.add_content(fact_type, fact_text) is not None
+
+    def add_content(self, content_type: str, text: str, tags: str = '') -> Optional[int]:
+        """Добавить совет или факт (теги - через запятую); вернуть его id.
+
+        None - ошибка или такой текст уже есть.
+        """
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        def operation(cursor: sqlite3.Cursor) -> int:
+            cursor.execute('''
+            INSERT INTO content (type, text, tags, revision, created_date)
+            VALUES (?, ?, ?, (SELECT COALESCE(MAX(revision), 0) + 1 FROM content), ?)
+            ''', (content_type, text, tags, now))
+            return cursor.lastrowid
+
         try:
-            # В этом упрощенном примере факты хранятся в отдельном файле
-            # В реальном проекте можно добавить таблицу в БД
-            with open('facts.py', 'a', encoding='utf-8') as f:
-                if fact_type == "fact":
-                    f.write(f'    "{fact_text}",\n')
-                else:
-                    f.write(f'    "{fact_text}",\n')
-            return True
+            return self.submit_write(operation).result()
         except Exception as e:
-            logger.error(f"Ошибка при добавлении факта: {e}")
+            logger.error(f"Ошибка при добавлении материала: {e}")
+            return None
+
+    def set_content_active(self, content_id: int, active: bool) -> bool:
+        """Включить или отключить совет/факт; False - ошибка или такого id нет"""
+        def operation(cursor: sqlite3.Cursor) -> int:
+            cursor.execute('''
+            UPDATE content
+            SET active = ?, revision = (SELECT COALESCE(MAX(revision), 0) + 1 FROM content)
+            WHERE content_id = ?
+            ''', (int(active), content_id))
+            return cursor.rowcount
+
+        try:
+            return self.submit_write(operation).result() > 0
+        except Exception as e:
+            logger.error(f"Ошибка при изменении материала {content_id}: {e}")
             return False
 
+    def save_daily_content(
+        self,
+        user_id: int,
+        pick: Callable[[Optional[bytes]], Optional[Tuple[ContentItem, str, bytes]]]
+    ) -> Future:
+        """Выбрать совет/факт и сохранить его вместе с маской просмотренных.
+
+        pick получает маску из базы и возвращает (материал, текст рекомендации,
+        новая маска) или None, если выбрать нечего. Чтение маски, выбор и запись
+        выполняются одной операцией в потоке записи, поэтому две отправки подряд
+        не повторят материал, а вызывающий поток не ждет записи. Результат
+        Future - выбранный материал (None - ничего не сохранено).
+        """
+        date = datetime.now().strftime('%Y-%m-%d')
+
+        def operation(cursor: sqlite3.Cursor) -> Optional[ContentItem]:
+            cursor.execute('SELECT seen FROM content_seen WHERE user_id = ?', (user_id,))
+            row = cursor.fetchone()
+            picked = pick(row[0] if row else None)
+            if picked is None:
+                return None
+            item, recommendation_text, seen = picked
+            cursor.execute('''
+            INSERT INTO recommendations (user_id, date, recommendation_text, kind)
+            VALUES (?, ?, ?, ?)
+            ''', (user_id, date, recommendation_text, item.type))
+            cursor.execute('''
+            INSERT OR REPLACE INTO content_seen (user_id, seen) VALUES (?, ?)
+            ''', (user_id, seen))
+            return item
+
+        return self._writer.submit(operation)
+
+    def get_content_since(self, revision: int) -> List[Tuple[int, str, str, str, int, int]]:
+        """Материалы, измененные после ревизии revision (id, вид, текст, теги, активен, ревизия)"""
+        try:
+            cursor = self._get_connection().cursor()
+            cursor.execute('''
+            SELECT content_id, type, text, tags, active, revision
+            FROM content WHERE revision > ?
+            ORDER BY revision
+            ''', (revision,))
+            return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке советов и фактов: {e}")
+            return []
+
+    def get_user_ids_after(self, last_user_id: int, limit: int) -> List[int]:
+        """Получить следующую порцию user_id по возрастанию (для постраничного обхода)"""
+        try:
+            cursor = self._get_connection().cursor()
+            cursor.execute(
+                'SELECT user_id FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?',
+                (last_user_id, limit)
+            )
+            return [row[0] for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Ошибка при получении списка пользователей: {e}")
+            return []
+
+    def create_broadcast_job(self, admin_id: int, text: str) -> Optional[Dict]:
+        """Создать задание рассылки"""
+        try:
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                INSERT INTO broadcast_jobs (admin_id, text, total, created_date, updated_date)
+                VALUES (?, ?, (SELECT COUNT(*) FROM users), ?, ?)
+                ''', (admin_id, text, now, now))
+                job_id = cursor.lastrowid
+                conn.commit()
+            return self._get_broadcast_job(job_id)
+        except Exception as e:
+            logger.error(f"Ошибка при создании рассылки: {e}")
+            return None
+
+    def _get_broadcast_job(self, job_id: int) -> Optional[Dict]:
+        """Получить задание рассылки по id"""
+        cursor = self._get_connection().cursor()
+        cursor.execute('SELECT * FROM broadcast_jobs WHERE job_id = ?', (job_id,))
+        row = cursor.fetchone()
+        if row:
+            columns = [description[0] for description in cursor.description]
+            return dict(zip(columns, row))
+        return None
+
+    def get_unfinished_broadcast_jobs(self) -> List[Dict]:
+        """Получить незавершенные задания рассылки"""
+        try:
+            cursor = self._get_connection().cursor()
+            cursor.execute("SELECT * FROM broadcast_jobs WHERE status = 'running' ORDER BY job_id")
+            columns = [description[0] for description in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Ошибка при получении заданий рассылки: {e}")
+            return []
+
+    def update_broadcast_job(
+        self,
+        job_id: int,
+        last_user_id: int,
+        success: int,
+        failures: int,
+        blocked: int,
+        status: str = 'running'
+    ) -> bool:
+        """Сохранить прогресс задания рассылки"""
+        updated_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        def operation(cursor: sqlite3.Cursor):
+            cursor.execute('''
+            UPDATE broadcast_jobs
+            SET last_user_id = ?, success = ?, failures = ?, blocked = ?, status = ?, updated_date = ?
+            WHERE job_id = ?
+            ''', (last_user_id, success, failures, blocked, status, updated_date, job_id))
+
+        return self._write(operation, status != 'running', "Ошибка при сохранении прогресса рассылки")
+
+    def get_user_states(self) -> List[Tuple[int, str, int, str, int]]:
+        """Получить сохраненные состояния диалогов (user_id, вид, шаг, ответы, время изменения)"""
+        try:
+            cursor = self._get_connection().cursor()
+            cursor.execute('SELECT user_id, kind, step, answers, updated_at FROM user_states')
+            return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке состояний диалогов: {e}")
+            return []
+
+    def save_user_state(self, user_id: int, kind: str, step: int, answers: str, updated_at: int) -> bool:
+        """Сохранить состояние диалога пользователя (без ожидания записи)"""
+        def operation(cursor: sqlite3.Cursor):
+            cursor.execute('''
+            INSERT OR REPLACE INTO user_states (user_id, kind, step, answers, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ''', (user_id, kind, step, answers, updated_at))
+
+        return self._write(operation, False, "Ошибка при сохранении состояния диалога")
+
+    def delete_user_state(self, user_id: int) -> bool:
+        """Удалить состояние завершенного диалога (без ожидания записи)"""
+        def operation(cursor: sqlite3.Cursor):
+            cursor.execute('DELETE FROM user_states WHERE user_id = ?', (user_id,))
+
+        return self._write(operation, False, "Ошибка при удалении состояния диалога")
+
+    def delete_user_states_before(self, updated_at: int) -> bool:
+        """Удалить состояния брошенных диалогов, не менявшиеся с updated_at"""
+        def operation(cursor: sqlite3.Cursor):
+            cursor.execute('DELETE FROM user_states WHERE updated_at < ?', (updated_at,))
+
+        return self._write(operation, False, "Ошибка при удалении устаревших состояний диалогов")
+
     def get_user_count(self) -> int:
         """Получить количество пользователей"""
         try:
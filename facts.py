@@ -1,3 +1,6 @@
+# Начальный набор советов и фактов: миграция 9 переносит его в таблицу content.
+# Новые материалы добавляются через админ-панель, а не правкой этого файла
+
 # Советы для улучшения сна
 SLEEP_TIPS = [
     "Старайтесь ложиться спать и просыпаться в одно и то же время каждый день, даже в выходные.",
@@ -0,0 +1,133 @@
+from typing import List, Tuple
+
+import numpy as np
+
+KMEANS_SEED = 42  # фиксированное зерно: одни и те же данные - одни и те же кластеры
+KMEANS_INIT = 4  # число запусков с разной начальной расстановкой центров
+KMEANS_MAX_ITER = 100  # максимум итераций Ллойда
+KMEANS_BATCH_ROWS = 100000  # строк (с учетом выравнивания) в одном пакетном вызове
+
+
+def pad_matrices(matrices: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Сложить матрицы разной длины в один массив (B, N, D) с маской заполненных строк"""
+    size = max((len(matrix) for matrix in matrices), default=0)
+    dims = matrices[0].shape[1] if matrices else 0
+    batch = np.zeros((len(matrices), size, dims))
+    mask = np.zeros((len(matrices), size), dtype=bool)
+    for i, matrix in enumerate(matrices):
+        batch[i, :len(matrix)] = matrix
+        mask[i, :len(matrix)] = True
+    return batch, mask
+
+
+def standardize(batch: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Привести каждый столбец каждой матрицы к нулевому среднему и единичному разбросу.
+
+    Как и StandardScaler: стандартное отклонение без поправки (ddof=0),
+    столбец с нулевым разбросом только центрируется.
+    """
+    weights = mask[..., None]
+    counts = np.maximum(mask.sum(axis=1), 1)[:, None]
+    means = (batch * weights).sum(axis=1) / counts
+    centered = (batch - means[:, None, :]) * weights
+    std = np.sqrt((centered ** 2).sum(axis=1) / counts)
+    std[std == 0] = 1
+    return centered / std[:, None, :]
+
+
+def _init_centers(batch: np.ndarray, mask: np.ndarray, draws: np.ndarray) -> np.ndarray:
+    """Начальные центры k-means++ для двух кластеров во всех матрицах сразу.
+
+    draws - два случайных числа из [0, 1), общие для всех матриц: начальная
+    расстановка зависит только от данных матрицы, а не от состава пакета.
+    """
+    rows = np.arange(len(batch))
+    counts = mask.sum(axis=1)
+    # Первый центр - случайная заполненная строка (заполненные строки идут подряд с начала)
+    first = np.minimum((draws[0] * counts).astype(int), np.maximum(counts - 1, 0))
+    first_center = batch[rows, first]
+    # Второй - с вероятностью, пропорциональной квадрату расстояния до первого
+    distances = ((batch - first_center[:, None, :]) ** 2).sum(axis=2) * mask
+    cumulative = distances.cumsum(axis=1)
+    target = draws[1] * cumulative[:, -1]
+    second = (cumulative <= target[:, None]).sum(axis=1)
+    second = np.where(cumulative[:, -1] > 0, np.minimum(second, np.maximum(counts - 1, 0)), first)
+    return np.stack([first_center, batch[rows, second]], axis=1)
+
+
+def _distances(batch: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """Квадраты расстояний от строк до центров, форма (B, N, 2)"""
+    return (
+        (batch ** 2).sum(axis=2)[:, :, None]
+        - 2 * np.einsum('bnd,bkd->bnk', batch, centers)
+        + (centers ** 2).sum(axis=2)[:, None, :]
+    )
+
+
+def _lloyd(batch: np.ndarray, mask: np.ndarray, centers: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Итерации Ллойда до сходимости; вернуть метки строк и суммарную инерцию.
+
+    Сошедшиеся матрицы исключаются из дальнейших итераций.
+    """
+    labels = _distances(batch, centers).argmin(axis=2)
+    active = np.arange(len(batch))
+    for _ in range(KMEANS_MAX_ITER):
+        if not len(active):
+            break
+        part, part_mask = batch[active], mask[active]
+        members = np.stack([labels[active] == 0, labels[active] == 1], axis=2) & part_mask[:, :, None]
+        count = members.sum(axis=1)[:, :, None]
+        total = np.einsum('bnk,bnd->bkd', members.astype(float), part)
+        # Пустой кластер сохраняет прежний центр
+        centers[active] = np.where(count > 0, total / np.maximum(count, 1), centers[active])
+        new_labels = _distances(part, centers[active]).argmin(axis=2)
+        changed = ((new_labels != labels[active]) & part_mask).any(axis=1)
+        labels[active] = new_labels
+        active = active[changed]
+    distances = _distances(batch, centers)
+    inertia = (np.maximum(distances.min(axis=2), 0) * mask).sum(axis=1)
+    return labels, inertia
+
+
+def two_means(batch: np.ndarray, mask: np.ndarray, seed: int = KMEANS_SEED) -> np.ndarray:
+    """Разбить строки каждой матрицы на два кластера (k-means, k=2).
+
+    batch - массив (B, N, D), mask - заполненные строки (B, N). Матрицы
+    обрабатываются одновременно; из KMEANS_INIT запусков для каждой матрицы
+    берется разбиение с наименьшей инерцией. Возвращает метки 0/1 формы (B, N);
+    для незаполненных строк метки не определены.
+    """
+    draws = np.random.default_rng(seed).random((KMEANS_INIT, 2))
+    best_labels = np.zeros(mask.shape, dtype=int)
+    best_inertia = np.full(len(batch), np.inf)
+    for init_draws in draws:
+        labels, inertia = _lloyd(batch, mask, _init_centers(batch, mask, init_draws))
+        better = inertia < best_inertia
+        best_labels[better] = labels[better]
+        best_inertia[better] = inertia[better]
+    return best_labels
+
+
+def cluster_matrices(matrices: List[np.ndarray], seed: int = KMEANS_SEED) -> List[np.ndarray]:
+    """Стандартизировать и разбить на два кластера строки каждой матрицы.
+
+    Матрицы сортируются по длине и группируются так, чтобы выравнивание
+    по самой длинной матрице пакета не раздувало память (не больше
+    KMEANS_BATCH_ROWS строк с учетом выравнивания). Возвращает метки
+    для каждой матрицы в исходном порядке.
+    """
+    labels: List[np.ndarray] = [None] * len(matrices)
+    order = sorted(range(len(matrices)), key=lambda i: len(matrices[i]))
+    start = 0
+    while start < len(order):
+        # Пакет растет, пока выровненный размер укладывается в бюджет
+        end = start + 1
+        while end < len(order) and (end + 1 - start) * len(matrices[order[end]]) <= KMEANS_BATCH_ROWS:
+            end += 1
+        indices = order[start:end]
+        batch, mask = pad_matrices([matrices[i] for i in indices])
+        batch_labels = two_means(standardize(batch, mask), mask, seed)
+        for row, i in enumerate(indices):
+            labels[i] = batch_labels[row, :len(matrices[i])]
+        start = end
+    return labels
@@ -1,40 +1,102 @@
+import time
+
+# Момент начала импорта модуля - для замера времени импорта (IMPORT_SECONDS)
+IMPORT_STARTED_AT = time.perf_counter()
+
 import telebot
-import pandas as pd
-from typing import Dict, List
-from telebot import types
+from telebot import apihelper, types
 from datetime import datetime, timedelta
 import random
-import time
-import traceback
-import numpy
+import logging
 import schedule
 import threading
-from typing import Dict, List
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from config import TOKEN, ADMIN_IDS, POLL_TIME, FACT_TIME
-from database import Database
-from facts import SLEEP_TIPS, SLEEP_FACTS
+from config import (
+    TOKEN, TELEGRAM_API_URL, ADMIN_IDS, DB_NAME, BROADCAST_WORKERS, BROADCAST_PROGRESS_INTERVAL,
+    OUTBOX_GLOBAL_RATE, OUTBOX_CLASS_RATES, OUTBOX_WORKERS, OUTBOX_SHUTDOWN_TIMEOUT, ANALYSIS_WORKERS, CORRELATION_HALF_LIFE,
+    STATE_STORE, UPDATE_MODE, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET,
+    WEBHOOK_QUEUE_SIZE, WEBHOOK_WORKERS, RUNTIME, ASYNC_EXECUTOR_WORKERS, ASYNC_NOTIFICATION_WORKERS,
+    ASYNC_SEND_CONCURRENCY
+)
+from broadcast import BroadcastEngine
+from cache import MarkupCache
+from content import ContentPool, RELOAD_INTERVAL, TIP, FACT as FACT_CONTENT, pack_seen, pack_tags, split_tags, unpack_seen
+from correlation import decay_for_half_life
+from database import Database, PERSONAL_RECOMMENDATION
+from outbox import Outbox, PRIORITY_INTERACTIVE, PRIORITY_SCHEDULED, PRIORITY_BULK
+from scheduler import NotificationScheduler, SURVEY, FACT
+from state import MemoryStateStore, SQLiteStateStore, REGISTRATION, ADD_FACT, BROADCAST
+from state import SURVEY as SURVEY_DIALOG
+from router import Router
+from webhook import WebhookServer
 from questions import SURVEY_QUESTIONS
 
+logger = logging.getLogger(__name__)
+
+
+# Бот, база данных и очередь исходящих сообщений создаются в SleepBot.start(),
+# а не при импорте модуля. pandas и модули анализа загружаются при первом анализе.
+bot: Optional[telebot.TeleBot] = None
+db: Optional[Database] = None
+# Все исходящие сообщения идут через общую очередь с приоритетами
+outbox: Optional[Outbox] = None
+# Советы и факты из таблицы content
+content: Optional[ContentPool] = None
+
+# Обработчики сообщений: собираются при импорте, регистрируются в боте при запуске
+HANDLERS: List[Tuple[str, Callable, Dict[str, Any]]] = []
 
-# Инициализация бота и базы данных
-bot = telebot.TeleBot(TOKEN)
-db = Database('sleep_bot.db')
+def callback_query_handler(**filters):
+    """Декоратор обработчика нажатий инлайн-кнопок (аналог bot.callback_query_handler)"""
+    def decorator(handler: Callable) -> Callable:
+        HANDLERS.append(('callback_query', handler, filters))
+        return handler
+    return decorator
 
-# Состояния пользователей для регистрации и опросов
-user_states = {}
+def send_message(chat_id: int, text: str, priority: int = PRIORITY_INTERACTIVE, wait: bool = True, **kwargs):
+    """Отправить сообщение через очередь; при wait=True дождаться отправки и вернуть сообщение"""
+    future = outbox.send_message(chat_id, text, priority=priority, **kwargs)
+    return future.result() if wait else future
 
-# Клавиатуры
-def get_main_keyboard(user_id: int) -> types.ReplyKeyboardMarkup:
+def answer_callback(call: types.CallbackQuery, text: str):
+    """Ответить на нажатие инлайн-кнопки (тоже через очередь - бот может быть асинхронным)"""
+    outbox.call('answer_callback_query', call.id, text)
+
+# Состояния диалогов пользователей (регистрация, опрос, ввод администратора).
+# Хранятся вне обработчиков, поэтому после перезапуска диалог продолжается с того же шага
+states: Optional[MemoryStateStore] = None
+
+# Шаги регистрации: ответы хранятся в состоянии в этом порядке
+REGISTRATION_AGE, REGISTRATION_GENDER, REGISTRATION_LIFESTYLE = range(3)
+
+# Все текстовые сообщения проходят через один обработчик - маршрутизатор:
+# команды и кнопки ищутся в словарях, состояние диалога читается один раз
+router = Router(lambda user_id: states.get(user_id), ADMIN_IDS)
+HANDLERS.append(('message', router.dispatch, {}))
+
+# Клавиатуры. Каждый вариант собирается и сериализуется один раз,
+# get_*_keyboard возвращают готовую JSON-строку для reply_markup
+markups = MarkupCache()
+
+def get_main_keyboard(user_id: int) -> str:
     """Получить основную клавиатуру"""
+    is_admin = user_id in ADMIN_IDS
+    return markups.get(('main', is_admin), lambda: _build_main_keyboard(is_admin))
+
+def _build_main_keyboard(is_admin: bool) -> types.ReplyKeyboardMarkup:
     keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True)
     keyboard.add('Моя статистика', 'Мои достижения')
-    if user_id in ADMIN_IDS:
+    if is_admin:
         keyboard.add('Админ-панель')
     return keyboard
 
-def get_lifestyle_keyboard() -> types.ReplyKeyboardMarkup:
+def get_lifestyle_keyboard() -> str:
     """Получить клавиатуру для выбора образа жизни"""
+    return markups.get('lifestyle', _build_lifestyle_keyboard)
+
+def _build_lifestyle_keyboard() -> types.ReplyKeyboardMarkup:
     keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=1)
     keyboard.add(
         types.KeyboardButton('Активный (регулярные тренировки, подвижная работа)'),
@@ -43,8 +105,11 @@ def get_lifestyle_keyboard() -> types.ReplyKeyboardMarkup:
     )
     return keyboard
 
-def get_gender_keyboard() -> types.ReplyKeyboardMarkup:
+def get_gender_keyboard() -> str:
     """Получить клавиатуру для выбора пола"""
+    return markups.get('gender', _build_gender_keyboard)
+
+def _build_gender_keyboard() -> types.ReplyKeyboardMarkup:
     keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     keyboard.add(
         types.KeyboardButton('Мужской'),
@@ -53,20 +118,27 @@ def get_gender_keyboard() -> types.ReplyKeyboardMarkup:
     )
     return keyboard
 
-def get_admin_keyboard() -> types.ReplyKeyboardMarkup:
+def get_admin_keyboard() -> str:
     """Получить клавиатуру админа"""
+    return markups.get('admin', _build_admin_keyboard)
+
+def _build_admin_keyboard() -> types.ReplyKeyboardMarkup:
     keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     keyboard.add(
         'Количество пользователей',
         'Добавить совет/факт',
         'Отправить сообщение всем',
         'Тестовый запуск',
+        'Пересчитать статистику',
         'Назад'
     )
     return keyboard
 
-def get_feedback_keyboard() -> types.InlineKeyboardMarkup:
+def get_feedback_keyboard() -> str:
     """Получить инлайн-клавиатуру для отзыва о рекомендации"""
+    return markups.get('feedback', _build_feedback_keyboard)
+
+def _build_feedback_keyboard() -> types.InlineKeyboardMarkup:
     keyboard = types.InlineKeyboardMarkup()
     keyboard.add(
         types.InlineKeyboardButton('👍 Помогло', callback_data='feedback_yes'),
@@ -74,8 +146,11 @@ def get_feedback_keyboard() -> types.InlineKeyboardMarkup:
     )
     return keyboard
 
-def get_test_run_keyboard() -> types.ReplyKeyboardMarkup:
+def get_test_run_keyboard() -> str:
     """Получить клавиатуру для тестового запуска"""
+    return markups.get('test_run', _build_test_run_keyboard)
+
+def _build_test_run_keyboard() -> types.ReplyKeyboardMarkup:
     keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     keyboard.add(
         'Отправить совет',
@@ -85,8 +160,21 @@ def get_test_run_keyboard() -> types.ReplyKeyboardMarkup:
     )
     return keyboard
 
+def get_question_keyboard(question: Dict) -> str:
+    """Клавиатура вопроса опроса: варианты ответа или скрытие клавиатуры"""
+    options = tuple(question['options'] or ()) if question['type'] == 'int' else ()
+    # Варианты - часть ключа: изменился вопрос в SURVEY_QUESTIONS - клавиатура соберется заново
+    return markups.get(('question', question['key'], options), lambda: _build_question_keyboard(options))
+
+def _build_question_keyboard(options: Tuple) -> types.JsonSerializable:
+    if not options:
+        return types.ReplyKeyboardRemove()
+    keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=5)
+    keyboard.add(*[str(opt) for opt in options])
+    return keyboard
+
 # Обработчики команд
-@bot.message_handler(commands=['start'])
+@router.command('start')
 def handle_start(message: types.Message):
     """Обработчик команды /start"""
     user_id = message.from_user.id
@@ -97,7 +185,7 @@ def handle_start(message: types.Message):
     
     if user:
         # Пользователь уже зарегистрирован
-        bot.send_message(
+        send_message(
             user_id, 
             f"С возвращением, {username}! 😊\nЯ СОНЯ - ваш помощник для улучшения качества сна.\n\n"
             "Вы можете посмотреть свою статистику или дождаться утреннего опроса.",
@@ -105,16 +193,17 @@ def handle_start(message: types.Message):
         )
         db.update_user_activity(user_id)
     else:
-        # Начинаем процесс регистрации
-        bot.send_message(
+        # Начинаем процесс регистрации. Состояние - до отправки вопроса:
+        # ответ может прийти раньше, чем обработчик вернется из send_message
+        states.set(user_id, REGISTRATION)
+        send_message(
             user_id, 
             f"Привет, {username}! 😊\nЯ СОНЯ - твой помощник для улучшения качества сна.\n\n"
             "Для начала давай познакомимся! Это займет всего пару минут.\n\n"
             "Сколько тебе лет? (Введи число)"
         )
-        user_states[user_id] = {'state': 'registration', 'step': 'age'}
 
-@bot.message_handler(commands=['help'])
+@router.command('help')
 def handle_help(message: types.Message):
     """Обработчик команды /help"""
     help_text = (
@@ -125,43 +214,96 @@ def handle_help(message: types.Message):
         "🏆 Достижения за регулярное использование\n\n"
         "Основные команды:\n"
         "/start - начать работу с ботом\n"
+        "/time - время опроса и совета (например, /time 07:30 21:00 +3)\n"
         "/help - показать эту справку\n\n"
         "Просто нажимай на кнопки в меню, чтобы взаимодействовать со мной!"
     )
-    bot.send_message(message.from_user.id, help_text)
+    send_message(message.from_user.id, help_text)
+
+@router.command('time')
+def handle_time(message: types.Message):
+    """Обработчик команды /time: настройка времени уведомлений"""
+    user_id = message.from_user.id
+    user = db.get_user(user_id)
+    
+    if not user:
+        send_message(user_id, "Сначала нужно зарегистрироваться. Напишите /start")
+        return
+    
+    args = message.text.split()[1:]
+    if not args:
+        send_message(
+            user_id,
+            f"Утренний опрос: {user.get('notification_time')}\n"
+            f"Вечерний совет: {user.get('fact_time')}\n\n"
+            "Чтобы изменить, напишите: /time ЧЧ:ММ [ЧЧ:ММ] [±ЧЧ]\n"
+            "Например: /time 07:30 21:00 +3 (опрос, совет и часовой пояс относительно UTC)"
+        )
+        return
+    
+    try:
+        times = []
+        timezone_offset = None
+        for arg in args:
+            if arg[0] in '+-':
+                timezone_offset = int(round(float(arg.replace(',', '.')) * 60))
+                if abs(timezone_offset) > 14 * 60:
+                    raise ValueError
+            else:
+                times.append(datetime.strptime(arg, '%H:%M').strftime('%H:%M'))
+        if len(times) > 2:
+            raise ValueError
+    except ValueError:
+        send_message(user_id, "Не удалось разобрать время. Пример: /time 07:30 21:00 +3")
+        return
+    
+    notification_time = times[0] if times else None
+    fact_time = times[1] if len(times) > 1 else None
+    if not db.update_notification_settings(user_id, notification_time, fact_time, timezone_offset):
+        send_message(user_id, "Ошибка при сохранении настроек. Попробуйте позже.")
+        return
+    
+    user = db.get_user(user_id)
+    notification_scheduler.schedule_user(
+        user_id, user['notification_time'], user['fact_time'], user['timezone_offset']
+    )
+    send_message(
+        user_id,
+        f"Готово! Утренний опрос: {user['notification_time']}, вечерний совет: {user['fact_time']}."
+    )
 
 # Обработчики сообщений
-@bot.message_handler(func=lambda message: message.text == 'Назад')
+@router.text('Назад')
 def handle_back(message: types.Message):
     """Обработчик кнопки 'Назад'"""
     user_id = message.from_user.id
     if user_id in ADMIN_IDS:
-        bot.send_message(
+        send_message(
             user_id, 
             "Возвращаемся в главное меню.", 
             reply_markup=get_main_keyboard(user_id)
         )
     else:
-        bot.send_message(
+        send_message(
             user_id, 
             "Возвращаемся в главное меню.", 
             reply_markup=get_main_keyboard(user_id)
         )
 
-@bot.message_handler(func=lambda message: message.text == 'Моя статистика')
+@router.text('Моя статистика')
 def handle_stats(message: types.Message):
     """Обработчик кнопки 'Моя статистика'"""
     user_id = message.from_user.id
     user = db.get_user(user_id)
     
     if not user:
-        bot.send_message(user_id, "Сначала нужно зарегистрироваться. Напишите /start")
+        send_message(user_id, "Сначала нужно зарегистрироваться. Напишите /start")
         return
     
     stats = db.get_user_stats(user_id)
     
     if not stats or 'sleep_stats' not in stats:
-        bot.send_message(user_id, "У вас пока недостаточно данных для статистики. Пожалуйста, заполните несколько опросов.")
+        send_message(user_id, "У вас пока недостаточно данных для статистики. Пожалуйста, заполните несколько опросов.")
         return
     
     sleep_stats = stats['sleep_stats']
@@ -173,6 +315,7 @@ def handle_stats(message: types.Message):
         f"Средняя продолжительность сна: {sleep_stats['avg_sleep_duration']} часов\n"
         f"Среднее качество сна: {sleep_stats['avg_sleep_quality']}/10\n"
         f"Среднее количество пробуждений: {sleep_stats['avg_awakenings']}\n"
+        f"Сон: от {sleep_stats['min_sleep_duration']} до {sleep_stats['max_sleep_duration']} часов\n"
         f"Всего заполненных опросов: {sleep_stats['total_surveys']}\n\n"
         f"Последние 7 дней:\n"
     )
@@ -180,59 +323,73 @@ def handle_stats(message: types.Message):
     for day in last_week:
         stats_text += f"{day['date']}: {day['duration']} ч, качество {day['quality']}/10\n"
     
-    bot.send_message(user_id, stats_text)
+    send_message(user_id, stats_text)
 
-@bot.message_handler(func=lambda message: message.text == 'Мои достижения')
+@router.text('Мои достижения')
 def handle_achievements(message: types.Message):
     """Обработчик кнопки 'Мои достижения'"""
     user_id = message.from_user.id
     user = db.get_user(user_id)
     
     if not user:
-        bot.send_message(user_id, "Сначала нужно зарегистрироваться. Напишите /start")
+        send_message(user_id, "Сначала нужно зарегистрироваться. Напишите /start")
         return
     
     achievements = db.get_user_achievements(user_id)
     
     if not achievements:
-        bot.send_message(user_id, "У вас пока нет достижений. Продолжайте заполнять опросы, чтобы их получить!")
+        send_message(user_id, "У вас пока нет достижений. Продолжайте заполнять опросы, чтобы их получить!")
         return
     
     achievements_text = "🏆 Ваши достижения:\n\n"
     for ach in achievements:
         achievements_text += f"{ach['type']} - {ach['date']}\n"
     
-    bot.send_message(user_id, achievements_text)
+    send_message(user_id, achievements_text)
 
-@bot.message_handler(func=lambda message: message.text == 'Админ-панель' and message.from_user.id in ADMIN_IDS)
+@router.text('Админ-панель', admin=True)
 def handle_admin_panel(message: types.Message):
     """Обработчик кнопки 'Админ-панель'"""
     user_id = message.from_user.id
-    bot.send_message(
+    send_message(
         user_id, 
         "Добро пожаловать в админ-панель! Что вы хотите сделать?", 
         reply_markup=get_admin_keyboard()
     )
 
-@bot.message_handler(func=lambda message: message.text == 'Количество пользователей' and message.from_user.id in ADMIN_IDS)
+@router.text('Количество пользователей', admin=True)
 def handle_user_count(message: types.Message):
     """Обработчик кнопки 'Количество пользователей'"""
     user_id = message.from_user.id
     count = db.get_user_count()
-    bot.send_message(user_id, f"Всего зарегистрированных пользователей: {count}")
+    send_message(user_id, f"Всего зарегистрированных пользователей: {count}")
 
-@bot.message_handler(func=lambda message: message.text == 'Добавить совет/факт' and message.from_user.id in ADMIN_IDS)
+@router.text('Пересчитать статистику', admin=True)
+def handle_rebuild_stats(message: types.Message):
+    """Обработчик кнопки 'Пересчитать статистику' (агрегаты и суммы для корреляций по истории опросов)"""
+    user_id = message.from_user.id
+    rebuilt = db.rebuild_user_aggregates()
+    if db.rebuild_correlation_stats() is None:
+        rebuilt = None
+    if rebuilt is None:
+        send_message(user_id, "Не удалось пересчитать статистику. Подробности в логах.")
+    else:
+        send_message(user_id, f"Статистика пересчитана для {rebuilt} пользователей.")
+
+@router.text('Добавить совет/факт', admin=True)
 def handle_add_fact(message: types.Message):
     """Обработчик кнопки 'Добавить совет/факт'"""
     user_id = message.from_user.id
-    msg = bot.send_message(
+    states.set(user_id, ADD_FACT)
+    send_message(
         user_id, 
         "Введите текст совета или факта, который хотите добавить.\n\n"
         "В начале сообщения укажите тип:\n"
         "СОВЕТ: для советов по улучшению сна\n"
-        "ФАКТ: для интересных фактов о сне"
+        "ФАКТ: для интересных фактов о сне\n\n"
+        "Теги можно указать последней строкой через запятую:\n"
+        "ТЕГИ: кофеин, вечер"
     )
-    bot.register_next_step_handler(msg, process_fact_type)
 
 def process_fact_type(message: types.Message):
     """Обработчик типа факта/совета"""
@@ -240,86 +397,117 @@ def process_fact_type(message: types.Message):
     text = message.text
     
     if text.startswith('СОВЕТ:'):
-        fact_text = text.replace('СОВЕТ:', '').strip()
-        if db.add_fact(fact_text, "tip"):
-            bot.send_message(user_id, "Совет успешно добавлен!", reply_markup=get_admin_keyboard())
+        states.delete(user_id)
+        fact_text, tags = split_tags(text.replace('СОВЕТ:', ''))
+        content_id = db.add_content(TIP, fact_text, pack_tags(tags))
+        if content_id is not None:
+            content.reload()
+            send_message(
+                user_id,
+                f"Совет №{content_id} успешно добавлен! Отключить его: /disable {content_id}",
+                reply_markup=get_admin_keyboard()
+            )
         else:
-            bot.send_message(user_id, "Ошибка при добавлении совета.", reply_markup=get_admin_keyboard())
+            send_message(user_id, "Ошибка при добавлении совета.", reply_markup=get_admin_keyboard())
     elif text.startswith('ФАКТ:'):
-        fact_text = text.replace('ФАКТ:', '').strip()
-        if db.add_fact(fact_text, "fact"):
-            bot.send_message(user_id, "Факт успешно добавлен!", reply_markup=get_admin_keyboard())
+        states.delete(user_id)
+        fact_text, tags = split_tags(text.replace('ФАКТ:', ''))
+        content_id = db.add_content(FACT_CONTENT, fact_text, pack_tags(tags))
+        if content_id is not None:
+            content.reload()
+            send_message(
+                user_id,
+                f"Факт №{content_id} успешно добавлен! Отключить его: /disable {content_id}",
+                reply_markup=get_admin_keyboard()
+            )
         else:
-            bot.send_message(user_id, "Ошибка при добавлении факта.", reply_markup=get_admin_keyboard())
+            send_message(user_id, "Ошибка при добавлении факта.", reply_markup=get_admin_keyboard())
     else:
-        msg = bot.send_message(
+        # Состояние не меняем: следующее сообщение снова попадет сюда
+        send_message(
             user_id, 
             "Пожалуйста, укажите тип (СОВЕТ: или ФАКТ:) в начале сообщения. Попробуйте еще раз."
         )
-        bot.register_next_step_handler(msg, process_fact_type)
 
-@bot.message_handler(func=lambda message: message.text == 'Отправить сообщение всем' and message.from_user.id in ADMIN_IDS)
+@router.command('disable', 'enable', admin=True)
+def handle_content_active(message: types.Message):
+    """Обработчик команд /disable и /enable: отключить или вернуть совет/факт по номеру"""
+    user_id = message.from_user.id
+    args = message.text.split()
+    if len(args) != 2 or not args[1].isdigit():
+        send_message(user_id, "Укажите номер совета или факта, например: /disable 12")
+        return
+    
+    active = args[0].startswith('/enable')
+    if db.set_content_active(int(args[1]), active):
+        content.reload()
+        send_message(user_id, f"Материал №{args[1]} {'включен' if active else 'отключен'}.")
+    else:
+        send_message(user_id, f"Материал №{args[1]} не найден.")
+
+@router.text('Отправить сообщение всем', admin=True)
 def handle_send_to_all(message: types.Message):
     """Обработчик кнопки 'Отправить сообщение всем'"""
     user_id = message.from_user.id
-    msg = bot.send_message(
+    states.set(user_id, BROADCAST)
+    send_message(
         user_id, 
         "Введите сообщение, которое хотите отправить всем пользователям:"
     )
-    bot.register_next_step_handler(msg, process_message_to_all)
 
 def process_message_to_all(message: types.Message):
     """Обработчик сообщения для всех пользователей"""
     user_id = message.from_user.id
     text = message.text
+    states.delete(user_id)
     
-    users = db.get_all_users()
-    success = 0
-    failures = 0
-    
-    bot.send_message(user_id, f"Начинаю рассылку для {len(users)} пользователей...")
-    
-    for user in users:
-        try:
-            bot.send_message(user, f"📢 Сообщение от администратора:\n\n{text}")
-            success += 1
-            time.sleep(0.1)  # Чтобы не превысить лимиты Telegram
-        except Exception as e:
-            failures += 1
+    count = db.get_user_count()
+    job_id = broadcast_engine.start(user_id, text)
     
-    bot.send_message(
-        user_id, 
-        f"Рассылка завершена!\n\nУспешно: {success}\nНе удалось: {failures}",
+    send_message(
+        user_id,
+        f"Начинаю рассылку #{job_id} для {count} пользователей...\n"
+        "Я буду присылать отчеты о ходе рассылки.",
         reply_markup=get_admin_keyboard()
     )
 
-@bot.message_handler(func=lambda message: message.text == 'Тестовый запуск' and message.from_user.id in ADMIN_IDS)
+def send_broadcast_message(user_id: int, text: str, wait: bool = True):
+    """Отправить пользователю сообщение рассылки"""
+    return send_message(user_id, f"📢 Сообщение от администратора:\n\n{text}", priority=PRIORITY_BULK, wait=wait)
+
+def report_broadcast_progress(admin_id: int, text: str, finished: bool):
+    """Отправить администратору отчет о ходе рассылки"""
+    send_message(admin_id, text, reply_markup=get_admin_keyboard() if finished else None)
+
+broadcast_engine: Optional[BroadcastEngine] = None
+
+@router.text('Тестовый запуск', admin=True)
 def handle_test_run(message: types.Message):
     """Обработчик кнопки 'Тестовый запуск'"""
     user_id = message.from_user.id
-    bot.send_message(
+    send_message(
         user_id, 
         "Выберите действие для тестового запуска:",
         reply_markup=get_test_run_keyboard()
     )
 
-@bot.message_handler(func=lambda message: message.text == 'Отправить совет' and message.from_user.id in ADMIN_IDS)
+@router.text('Отправить совет', admin=True)
 def handle_send_test_tip(message: types.Message):
     """Обработчик кнопки 'Отправить совет'"""
     user_id = message.from_user.id
     send_daily_fact(user_id, test_mode=True)
-    bot.send_message(
+    send_message(
         user_id, 
         "Тестовый совет отправлен!",
         reply_markup=get_admin_keyboard()
     )
 
-@bot.message_handler(func=lambda message: message.text == 'Отправить опрос' and message.from_user.id in ADMIN_IDS)
+@router.text('Отправить опрос', admin=True)
 def handle_send_test_survey(message: types.Message):
     """Обработчик кнопки 'Отправить опрос'"""
     user_id = message.from_user.id
     send_daily_survey(user_id, test_mode=True)
-    bot.send_message(
+    send_message(
         user_id, 
         "Тестовый опрос отправлен!",
         reply_markup=get_admin_keyboard()
@@ -345,10 +533,15 @@ def create_test_data(user_id: int):
             screen_time=random.randint(30, 120),
             notes="Тестовые данные"
         )
+    # Данные нужны для анализа сразу, поэтому дожидаемся записи
+    db.flush()
 
-@bot.message_handler(func=lambda message: message.text == 'Анализ и рекомендации' and message.from_user.id in ADMIN_IDS)
+@router.text('Анализ и рекомендации', admin=True)
 def handle_test_analysis(message: types.Message):
     """Обработчик кнопки 'Анализ и рекомендации'"""
+    import pandas as pd
+    from analysis import calculate_ideal_sleep
+
     user_id = message.from_user.id
     
     try:
@@ -357,13 +550,13 @@ def handle_test_analysis(message: types.Message):
         
         # Проверяем, есть ли данные
         if data is None or (hasattr(data, 'empty') and data.empty):
-            bot.send_message(user_id, "Нет данных для анализа. Создаю тестовые данные...")
+            send_message(user_id, "Нет данных для анализа. Создаю тестовые данные...")
             create_test_data(user_id)
             data = db.get_survey_data_for_analysis(user_id)
         
         # Проверяем, достаточно ли данных
         if len(data) < 7:
-            bot.send_message(user_id, "Для анализа нужно как минимум 7 дней данных. Создаю дополнительные тестовые данные...")
+            send_message(user_id, "Для анализа нужно как минимум 7 дней данных. Создаю дополнительные тестовые данные...")
             days_needed = 7 - len(data)
             for _ in range(days_needed):
                 create_test_data(user_id)
@@ -423,8 +616,8 @@ def handle_test_analysis(message: types.Message):
         recommendations.append(random.choice(test_tips))
         
         # Отправляем рекомендации
-        bot.send_message(user_id, "\n".join(recommendations))
-        bot.send_message(
+        send_message(user_id, "\n".join(recommendations))
+        send_message(
             user_id, 
             "Тестовый анализ завершен!",
             reply_markup=get_admin_keyboard()
@@ -432,13 +625,11 @@ def handle_test_analysis(message: types.Message):
     
     except Exception as e:
         error_msg = f"⚠️ Произошла ошибка при анализе: {str(e)}"
-        print(error_msg)
-        traceback.print_exc()
-        bot.send_message(user_id, error_msg)
+        logger.exception(error_msg)
+        send_message(user_id, error_msg)
 
 # Обработчики регистрации
-@bot.message_handler(func=lambda message: user_states.get(message.from_user.id, {}).get('state') == 'registration' and 
-                                      user_states.get(message.from_user.id, {}).get('step') == 'age')
+@router.step(REGISTRATION, REGISTRATION_AGE)
 def handle_age(message: types.Message):
     """Обработчик возраста при регистрации"""
     user_id = message.from_user.id
@@ -447,43 +638,39 @@ def handle_age(message: types.Message):
         if age < 1 or age > 120:
             raise ValueError
         
-        user_states[user_id]['age'] = age
-        user_states[user_id]['step'] = 'gender'
+        states.advance(user_id, age)
         
-        bot.send_message(
+        send_message(
             user_id, 
             "Отлично! Теперь укажите ваш пол:",
             reply_markup=get_gender_keyboard()
         )
     except ValueError:
-        bot.send_message(user_id, "Пожалуйста, введите корректный возраст (число от 1 до 120).")
+        send_message(user_id, "Пожалуйста, введите корректный возраст (число от 1 до 120).")
 
-@bot.message_handler(func=lambda message: user_states.get(message.from_user.id, {}).get('state') == 'registration' and 
-                                      user_states.get(message.from_user.id, {}).get('step') == 'gender')
+@router.step(REGISTRATION, REGISTRATION_GENDER)
 def handle_gender(message: types.Message):
     """Обработчик пола при регистрации"""
     user_id = message.from_user.id
     gender = message.text
     
     if gender not in ['Мужской', 'Женский', 'Другой']:
-        bot.send_message(
+        send_message(
             user_id, 
             "Пожалуйста, выберите пол из предложенных вариантов.",
             reply_markup=get_gender_keyboard()
         )
         return
     
-    user_states[user_id]['gender'] = gender
-    user_states[user_id]['step'] = 'lifestyle'
+    states.advance(user_id, gender)
     
-    bot.send_message(
+    send_message(
         user_id, 
         "Хорошо! Теперь опишите ваш образ жизни:",
         reply_markup=get_lifestyle_keyboard()
     )
 
-@bot.message_handler(func=lambda message: user_states.get(message.from_user.id, {}).get('state') == 'registration' and 
-                                      user_states.get(message.from_user.id, {}).get('step') == 'lifestyle')
+@router.step(REGISTRATION, REGISTRATION_LIFESTYLE)
 def handle_lifestyle(message: types.Message):
     """Обработчик образа жизни при регистрации"""
     user_id = message.from_user.id
@@ -494,7 +681,7 @@ def handle_lifestyle(message: types.Message):
         'Малоподвижный (редкие тренировки, сидячая работа)',
         'Сидячий (нет тренировок, сидячая работа)'
     ]:
-        bot.send_message(
+        send_message(
             user_id, 
             "Пожалуйста, выберите вариант из предложенных.",
             reply_markup=get_lifestyle_keyboard()
@@ -503,11 +690,17 @@ def handle_lifestyle(message: types.Message):
     
     # Завершаем регистрацию
     username = message.from_user.first_name
-    age = user_states[user_id]['age']
-    gender = user_states[user_id]['gender']
+    age, gender = states.get(user_id).answers[:REGISTRATION_LIFESTYLE]
+    
+    states.delete(user_id)
     
     if db.register_user(user_id, username, age, gender, lifestyle):
-        bot.send_message(
+        user = db.get_user(user_id)
+        if user:
+            notification_scheduler.schedule_user(
+                user_id, user['notification_time'], user['fact_time'], user['timezone_offset']
+            )
+        send_message(
             user_id, 
             f"Регистрация завершена, {username}! 🎉\n\n"
             "Теперь я буду помогать тебе улучшить качество сна.\n\n"
@@ -518,12 +711,10 @@ def handle_lifestyle(message: types.Message):
             reply_markup=get_main_keyboard(user_id)
         )
     else:
-        bot.send_message(
+        send_message(
             user_id, 
             "Произошла ошибка при регистрации. Пожалуйста, попробуйте позже."
         )
-    
-    del user_states[user_id]
 
 # Обработчики опроса
 def send_daily_survey(user_id: int, test_mode: bool = False):
@@ -535,53 +726,49 @@ def send_daily_survey(user_id: int, test_mode: bool = False):
     if not test_mode:
         # Проверяем, не заполнял ли пользователь уже опрос сегодня
         today = datetime.now().strftime('%Y-%m-%d')
-        with db._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT COUNT(*) FROM surveys WHERE user_id = ? AND date = ?', (user_id, today))
-            if cursor.fetchone()[0] > 0:
-                return  # Уже заполнял опрос сегодня
+        if db.has_survey_on(user_id, today):
+            return  # Уже заполнял опрос сегодня
     
-    # Начинаем опрос
-    user_states[user_id] = {
-        'state': 'survey',
-        'step': 0,
-        'answers': {}
-    }
+    start_survey(user_id, PRIORITY_INTERACTIVE if test_mode else PRIORITY_SCHEDULED)
+
+def start_survey(user_id: int, priority: int = PRIORITY_SCHEDULED):
+    """Начать опрос (без проверок - они выполнены вызывающим кодом)"""
+    states.set(user_id, SURVEY_DIALOG)
     
     first_question = SURVEY_QUESTIONS[0]
-    ask_question(user_id, first_question)
+    ask_question(user_id, first_question, priority)
 
-def ask_question(user_id: int, question: Dict):
-    """Задать вопрос из опроса"""
+def ask_question(user_id: int, question: Dict, priority: int = PRIORITY_INTERACTIVE):
+    """Задать вопрос из опроса (ответ придет в process_answer через состояние опроса)"""
     if question['type'] == 'time':
-        msg = bot.send_message(
+        send_message(
             user_id, 
-            question['text'] + "\n\nВведите время в формате ЧЧ:ММ (например, 23:30)"
-        )
-    elif question['type'] == 'int' and question['options']:
-        # Создаем клавиатуру для вариантов ответа
-        keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=5)
-        keyboard.add(*[str(opt) for opt in question['options']])
-        msg = bot.send_message(
-            user_id, 
-            question['text'],
-            reply_markup=keyboard
+            question['text'] + "\n\nВведите время в формате ЧЧ:ММ (например, 23:30)",
+            priority=priority,
+            wait=False
         )
     else:
-        msg = bot.send_message(
+        # Варианты ответа кнопками (или скрыть клавиатуру, если вариантов нет)
+        send_message(
             user_id, 
             question['text'],
-            reply_markup=types.ReplyKeyboardRemove()
+            priority=priority,
+            wait=False,
+            reply_markup=get_question_keyboard(question)
         )
-    
-    bot.register_next_step_handler(msg, process_answer, question)
 
-def process_answer(message: types.Message, question: Dict):
-    """Обработать ответ на вопрос"""
+def process_answer(message: types.Message):
+    """Обработать ответ на текущий вопрос опроса"""
     user_id = message.from_user.id
     
-    if user_id not in user_states or user_states[user_id]['state'] != 'survey':
+    state = states.get(user_id)
+    if state is None or state.kind != SURVEY_DIALOG:
+        return
+    if state.step >= len(SURVEY_QUESTIONS):
+        # Список вопросов сократился, пока опрос был не закончен
+        complete_survey(user_id)
         return
+    question = SURVEY_QUESTIONS[state.step]
     
     try:
         # Проверяем и преобразуем ответ в нужный формат
@@ -599,14 +786,10 @@ def process_answer(message: types.Message, question: Dict):
         else:  # text
             answer = message.text
         
-        # Сохраняем ответ
-        user_states[user_id]['answers'][question['key']] = answer
-        
-        # Переходим к следующему вопросу или завершаем опрос
-        next_step = user_states[user_id]['step'] + 1
-        if next_step < len(SURVEY_QUESTIONS):
-            user_states[user_id]['step'] = next_step
-            ask_question(user_id, SURVEY_QUESTIONS[next_step])
+        # Сохраняем ответ и переходим к следующему вопросу или завершаем опрос
+        state = states.advance(user_id, answer)
+        if state.step < len(SURVEY_QUESTIONS):
+            ask_question(user_id, SURVEY_QUESTIONS[state.step])
         else:
             complete_survey(user_id)
     except ValueError:
@@ -620,12 +803,11 @@ def process_answer(message: types.Message, question: Dict):
         else:
             error_msg = "Пожалуйста, введите корректный ответ"
         
-        msg = bot.send_message(user_id, error_msg)
-        bot.register_next_step_handler(msg, process_answer, question)
+        send_message(user_id, error_msg, wait=False)
 
 def complete_survey(user_id: int):
     """Завершить опрос и сохранить результаты"""
-    answers = user_states[user_id]['answers']
+    answers = dict(zip((question['key'] for question in SURVEY_QUESTIONS), states.get(user_id).answers))
     
     # Сохраняем результаты в базу данных
     db.save_survey(
@@ -644,10 +826,10 @@ def complete_survey(user_id: int):
         notes=answers.get('notes', '')
     )
     
-    del user_states[user_id]
+    states.delete(user_id)
     
     # Отправляем благодарность
-    bot.send_message(
+    send_message(
         user_id, 
         "Спасибо за заполнение опроса! 💤\n\n"
         "Эти данные помогут мне лучше понять твой сон и давать более точные рекомендации.\n\n"
@@ -655,6 +837,11 @@ def complete_survey(user_id: int):
         reply_markup=get_main_keyboard(user_id)
     )
 
+# Ответы внутри этих диалогов обрабатываются раньше кнопок и команд
+router.dialog(SURVEY_DIALOG)(process_answer)
+router.dialog(ADD_FACT)(process_fact_type)
+router.dialog(BROADCAST)(process_message_to_all)
+
 # Обработчики советов и фактов
 def send_daily_fact(user_id: int, test_mode: bool = False):
     """Отправить ежедневный совет или факт"""
@@ -665,430 +852,129 @@ def send_daily_fact(user_id: int, test_mode: bool = False):
     if not test_mode:
         # Проверяем, не отправляли ли уже сегодня
         today = datetime.now().strftime('%Y-%m-%d')
-        with db._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-            SELECT COUNT(*) FROM recommendations 
-            WHERE user_id = ? AND date = ? AND recommendation_text LIKE 'Совет:%' OR recommendation_text LIKE 'Факт:%'
-            ''', (user_id, today))
-            if cursor.fetchone()[0] > 0:
-                return  # Уже отправляли сегодня
+        if db.has_recommendation(user_id, (TIP, FACT_CONTENT), today):
+            return  # Уже отправляли сегодня
     
-    # Выбираем случайный совет или факт
-    if random.random() < 0.7:  # 70% chance for a tip
-        fact = random.choice(SLEEP_TIPS)
-        fact_type = "Совет"
-    else:
-        fact = random.choice(SLEEP_FACTS)
-        fact_type = "Факт"
-    
-    # Сохраняем в базу как рекомендацию
-    db.save_recommendation(user_id, f"{fact_type}: {fact}")
-    
-    # Отправляем пользователю
-    if fact_type == "Совет":
-        emoji = "💡"
-        header = "Совет дня для улучшения сна:"
-    else:
-        emoji = "🌙"
-        header = "Интересный факт о сне:"
-    
-    bot.send_message(
-        user_id, 
-        f"{emoji} {header}\n\n{fact}"
-    )
+    # Выбираем совет или факт, которого пользователь еще не видел
+    # (если материалов одного вида нет - другой)
+    first, second = (TIP, FACT_CONTENT) if random.random() < 0.7 else (FACT_CONTENT, TIP)  # 70% chance for a tip
+
+    def pick(packed_seen: Optional[bytes]):
+        seen = unpack_seen(packed_seen)
+        item, seen = content.pick_unseen(first, seen)
+        if item is None:
+            item, seen = content.pick_unseen(second, seen)
+        if item is None:
+            return None
+        fact_type = "Совет" if item.type == TIP else "Факт"
+        return item, f"{fact_type}: {item.text}", pack_seen(seen)
+
+    def send(saved: Future):
+        if saved.exception() is not None:
+            logger.error(f"Ошибка при сохранении совета дня для пользователя {user_id}: {saved.exception()}")
+            return
+        item = saved.result()
+        if item is None:
+            return
+        if item.type == TIP:
+            emoji = "💡"
+            header = "Совет дня для улучшения сна:"
+        else:
+            emoji = "🌙"
+            header = "Интересный факт о сне:"
+        send_message(
+            user_id, 
+            f"{emoji} {header}\n\n{item.text}",
+            priority=PRIORITY_INTERACTIVE if test_mode else PRIORITY_SCHEDULED,
+            wait=False
+        )
+
+    # Выбор, отметка о просмотре и сохранение рекомендации - одна операция записи,
+    # сообщение ставится в очередь после ее фиксации (поток планировщика не ждет)
+    db.save_daily_content(user_id, pick).add_done_callback(send)
 
 # Обработчики анализа и рекомендаций
 def analyze_and_recommend(user_id: int, test_mode: bool = False):
     """Провести расширенный анализ данных и отправить персонализированные рекомендации"""
+    from analysis import MIN_ANALYSIS_DAYS, build_recommendations
+
     user = db.get_user(user_id)
     if not user:
         return
     
     if not test_mode:
         last_week = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-        with db._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-            SELECT COUNT(*) FROM recommendations 
-            WHERE user_id = ? AND date >= ? AND recommendation_text NOT LIKE 'Совет:%' AND recommendation_text NOT LIKE 'Факт:%'
-            ''', (user_id, last_week))
-            if cursor.fetchone()[0] > 0:
-                return
+        if db.has_recommendation(user_id, (PERSONAL_RECOMMENDATION,), last_week):
+            return
     
     data = db.get_survey_data_for_analysis(user_id)
     
-    if len(data) < 7:  # Минимум неделя данных
+    if len(data) < MIN_ANALYSIS_DAYS:  # Минимум неделя данных
         if not test_mode:
-            bot.send_message(
-                user_id, 
-                "Для точного анализа мне нужно больше данных о твоем сне. "
-                "Пожалуйста, заполни опросы еще несколько дней."
-            )
+            send_not_enough_data(user_id)
         return
     
-    # Преобразуем данные для анализа
-    data = preprocess_data(data)
-    
-    # Основные метрики
-    recommendations = analyze_basic_metrics(data, user)
-    
-    # Углубленный корреляционный анализ
-    corr_recommendations = advanced_correlation_analysis(data, user)
-    recommendations.extend(corr_recommendations)
-    
-    # Анализ временных рядов
-    time_series_recommendations = analyze_time_series(data, user)
-    recommendations.extend(time_series_recommendations)
-    
-    # Кластерный анализ дней
-    cluster_recommendations = cluster_analysis(data, user)
-    recommendations.extend(cluster_recommendations)
-    
-    # Персонализированные советы на основе профиля
-    profile_recommendations = generate_profile_based_recommendations(user)
-    recommendations.extend(profile_recommendations)
-    
-    if not recommendations:
-        recommendations = [
-            "Пока у меня нет конкретных рекомендаций. Продолжай заполнять опросы!"
-        ]
-    
-    # Удаляем дубликаты и сохраняем
-    unique_recommendations = list(dict.fromkeys(recommendations))
+    # Корреляции берутся из накопленных сумм, а не считаются по истории заново
+    correlations = tuple(table.loc[user_id] for table in db.get_correlations([user_id]))
+    deliver_recommendations(user_id, build_recommendations(data, user, correlations), test_mode)
+
+def deliver_recommendations(user_id: int, unique_recommendations: List[str], test_mode: bool = False):
+    """Сохранить и отправить пользователю рекомендации по итогам анализа"""
+    priority = PRIORITY_INTERACTIVE if test_mode else PRIORITY_SCHEDULED
     
     # В тестовом режиме сразу отправляем рекомендации
     if test_mode:
         for rec in unique_recommendations[:5]:  # Ограничиваем 5 лучшими рекомендациями
-            bot.send_message(
+            send_message(
                 user_id, 
-                f"🌿 Тестовая персонализированная рекомендация:\n\n{rec}"
+                f"🌿 Тестовая персонализированная рекомендация:\n\n{rec}",
+                priority=priority,
+                wait=False
             )
     else:
         for rec in unique_recommendations[:5]:  # Ограничиваем 5 лучшими рекомендациями
             db.save_recommendation(user_id, rec)
-            bot.send_message(
+            send_message(
                 user_id, 
-                f"🌿 Персонализированная рекомендация:\n\n{rec}"
+                f"🌿 Персонализированная рекомендация:\n\n{rec}",
+                priority=priority,
+                wait=False
             )
     
     if not test_mode and unique_recommendations:
-        time.sleep(2)
-        bot.send_message(
+        # Очередь сохраняет порядок сообщений одного чата, пауза перед итогом не нужна
+        send_message(
             user_id, 
             "Через неделю я спрошу, помогли ли тебе мои рекомендации. "
             "Если хочешь, можешь уже сейчас написать отзыв или задать вопрос!",
+            priority=priority,
+            wait=False,
             reply_markup=get_main_keyboard(user_id)
         )
 
-def preprocess_data(data: pd.DataFrame) -> pd.DataFrame:
-    """Предварительная обработка данных"""
-    # Преобразуем время отхода ко сну в числовой формат (часы с десятичной частью)
-    data['bedtime_num'] = data['bedtime'].apply(
-        lambda x: float(x.split(':')[0]) + float(x.split(':')[1])/60 if pd.notnull(x) else None
-    )
-    
-    # Аналогично для времени подъема
-    data['wakeup_num'] = data['wakeup_time'].apply(
-        lambda x: float(x.split(':')[0]) + float(x.split(':')[1])/60 if pd.notnull(x) else None
-    )
-    
-    # Рассчитываем регулярность сна
-    data['sleep_regularity'] = data['bedtime_num'].rolling(window=3).std().fillna(0)
-    
-    # Дополнительные метрики
-    data['sleep_efficiency'] = data['sleep_duration'] / (data['wakeup_num'] - data['bedtime_num'] + 24*(data['wakeup_num'] < data['bedtime_num']))
-    data['weekday'] = pd.to_datetime(data['date']).dt.dayofweek
-    data['is_weekend'] = data['weekday'].isin([5, 6]).astype(int)
-    
-    return data
-
-def analyze_basic_metrics(data: pd.DataFrame, user: Dict) -> List[str]:
-    """Анализ основных метрик сна"""
-    recommendations = []
-    
-    # Средние показатели
-    avg_sleep = data['sleep_duration'].mean()
-    avg_quality = data['sleep_quality'].mean()
-    avg_awakenings = data['awakenings'].mean()
-    avg_efficiency = data['sleep_efficiency'].mean()
-    
-    # Рекомендации по продолжительности
-    age = user['age']
-    ideal_sleep = calculate_ideal_sleep(age)
-    
-    if avg_sleep < ideal_sleep - 1:
-        recommendations.append(
-            f"Для твоего возраста ({age} лет) рекомендованная продолжительность сна {ideal_sleep}-{ideal_sleep+1} часов. "
-            f"Ты спишь в среднем {avg_sleep:.1f} часов. Попробуй увеличить продолжительность сна на {ideal_sleep - avg_sleep:.1f} часов."
-        )
-    elif avg_sleep > ideal_sleep + 1:
-        recommendations.append(
-            f"Ты спишь больше ({avg_sleep:.1f} часов) рекомендованной для твоего возраста ({age} лет) нормы ({ideal_sleep} часов). "
-            "Избыток сна может снижать продуктивность. Попробуй сократить время сна на 30 минут."
-        )
-    
-    # Рекомендации по качеству
-    if avg_quality < 6:
-        recommendations.append(
-            f"Твое среднее качество сна ({avg_quality:.1f}/10) ниже оптимального. "
-            "Рассмотри возможность улучшения гигиены сна: регулярное время отхода ко сну, "
-            "комфортные условия в спальне, ограничение кофеина и экранов перед сном."
-        )
-    
-    # Эффективность сна
-    if avg_efficiency < 0.85:
-        recommendations.append(
-            f"Твоя эффективность сна ({avg_efficiency:.1%}) ниже оптимальной (85%+). "
-            "Это означает, что ты проводишь много времени в постели без сна. "
-            "Попробуй ложиться только когда действительно хочешь спать."
-        )
-    
-    return recommendations
-
-def calculate_ideal_sleep(age: int) -> int:
-    """Рассчитать идеальную продолжительность сна по возрасту"""
-    if age < 18: return 9
-    elif 18 <= age < 25: return 8
-    elif 25 <= age < 45: return 7.5
-    elif 45 <= age < 65: return 7
-    else: return 7.5  # Пожилым часто нужно немного больше сна
-
-def advanced_correlation_analysis(data: pd.DataFrame, user: Dict) -> List[str]:
-    """Расширенный корреляционный анализ"""
-    recommendations = []
-    
-    # Рассчитываем корреляции с качеством сна
-    numeric_cols = [
-        'stress_level', 'exercise', 'caffeine', 'alcohol', 
-        'screen_time', 'bedtime_num', 'awakenings', 'mood_morning'
-    ]
-    
-    try:
-        corr_matrix = data[numeric_cols + ['sleep_quality']].corr()
-        sleep_quality_corr = corr_matrix['sleep_quality'].drop('sleep_quality').abs().sort_values(ascending=False)
-        
-        # Анализ топ-3 факторов
-        for factor in sleep_quality_corr.index[:3]:
-            corr_value = corr_matrix.loc['sleep_quality', factor]
-            abs_corr = abs(corr_value)
-            
-            if abs_corr > 0.4:  # Значимая корреляция
-                if factor == 'stress_level' and corr_value < -0.4:
-                    recommendations.append(
-                        "Выявлена сильная отрицательная связь между уровнем стресса и качеством сна (r={:.2f}). ".format(corr_value) +
-                        "Техники управления стрессом могут значительно улучшить твой сон:\n"
-                        "- Вечерняя медитация или дыхательные упражнения\n"
-                        "- Ведение 'списка тревог' перед сном\n"
-                        "- Теплый душ или ванна за час до сна"
-                    )
-                
-                elif factor == 'exercise' and corr_value > 0.4:
-                    rec = "Физическая активность положительно влияет на твой сон (r={:.2f}). ".format(corr_value)
-                    if data['exercise'].mean() < 30:
-                        rec += "Ты занимаешься в среднем всего {:.1f} минут в день. ".format(data['exercise'].mean())
-                        rec += "Попробуй увеличить активность до 30-40 минут, особенно аэробные упражнения."
-                    else:
-                        rec += "Отлично! Продолжай в том же духе, но избегай интенсивных тренировок за 3 часа до сна."
-                    recommendations.append(rec)
-                
-                elif factor == 'screen_time' and corr_value < -0.3:
-                    avg_screen_time = data['screen_time'].mean()
-                    recommendations.append(
-                        "Время перед экранами перед сном отрицательно влияет на качество твоего сна (r={:.2f}). ".format(corr_value) +
-                        f"Ты проводишь в среднем {avg_screen_time:.1f} минут с гаджетами перед сном. Попробуй:\n"
-                        "- Установить 'ночной режим' на устройствах\n"
-                        "- Использовать приложения, ограничивающие синий свет\n"
-                        "- Читать бумажные книги вместо электронных"
-                    )
-                
-                elif factor == 'bedtime_num' and abs_corr > 0.3:
-                    if corr_value > 0:  # Поздний отход ко сну = хуже качество
-                        avg_bedtime = data['bedtime_num'].mean()
-                        ideal_bedtime = 22.5 if user['age'] >= 18 else 21.5
-                        if avg_bedtime > ideal_bedtime:
-                            recommendations.append(
-                                "Более поздний отход ко сну связан с ухудшением качества твоего сна (r={:.2f}). ".format(corr_value) +
-                                f"Ты обычно ложишься в {int(avg_bedtime)}:{int((avg_bedtime%1)*60):02d}. " +
-                                f"Попробуй постепенно смещать время отхода ко сну к {int(ideal_bedtime)}:{int((ideal_bedtime%1)*60):02d}."
-                            )
-    except Exception as e:
-        print(f"Ошибка корреляционного анализа: {e}")
-    
-    return recommendations
-
-def analyze_time_series(data: pd.DataFrame, user: Dict) -> List[str]:
-    """Анализ временных рядов и паттернов"""
-    recommendations = []
-    
-    try:
-        # Анализ различий будни/выходные
-        weekend_data = data[data['is_weekend'] == 1]
-        weekday_data = data[data['is_weekend'] == 0]
-        
-        if len(weekend_data) > 2 and len(weekday_data) > 5:
-            weekend_sleep = weekend_data['sleep_duration'].mean()
-            weekday_sleep = weekday_data['sleep_duration'].mean()
-            
-            if abs(weekend_sleep - weekday_sleep) > 1.5:
-                recommendations.append(
-                    "Я заметил значительную разницу в продолжительности твоего сна в выходные ({:.1f} ч) ".format(weekend_sleep) +
-                    "и будни ({:.1f} ч). ".format(weekday_sleep) +
-                    "Такие колебания могут вызывать 'социальный джетлаг'. " +
-                    "Попробуй сократить разницу до 1 часа, вставая в выходные не более чем на 1 час позже."
-                )
-        
-        # Анализ тренда качества сна
-        data['date_dt'] = pd.to_datetime(data['date'])
-        data.set_index('date_dt', inplace=True)
-        weekly_avg = data['sleep_quality'].resample('W').mean()
-        
-        if len(weekly_avg) > 2:
-            trend = (weekly_avg.iloc[-1] - weekly_avg.iloc[0]) / len(weekly_avg)
-            
-            if trend < -0.3:
-                recommendations.append(
-                    "За последние недели я заметил ухудшение качества твоего сна. " +
-                    "Это может быть связано с повышенным стрессом, изменением распорядка дня или другими факторами. " +
-                    "Давай обсудим, что изменилось в твоей жизни за это время?"
-                )
-            elif trend > 0.3:
-                recommendations.append(
-                    "Отличные новости! Качество твоего сна постепенно улучшается. " +
-                    "Продолжай практиковать хорошие привычки сна, которые ты выработал."
-                )
-    except Exception as e:
-        print(f"Ошибка анализа временных рядов: {e}")
-    
-    return recommendations
-
-def cluster_analysis(data: pd.DataFrame, user: Dict) -> List[str]:
-    """Кластерный анализ дней по характеристикам сна"""
-    recommendations = []
-    
-    try:
-        from sklearn.cluster import KMeans
-        from sklearn.preprocessing import StandardScaler
-        
-        # Подготовка данных
-        cluster_data = data[['sleep_duration', 'sleep_quality', 'awakenings', 'stress_level']].dropna()
-        if len(cluster_data) < 10:
-            return recommendations
-        
-        # Масштабирование
-        scaler = StandardScaler()
-        scaled_data = scaler.fit_transform(cluster_data)
-        
-        # Кластеризация
-        kmeans = KMeans(n_clusters=2, random_state=42)
-        clusters = kmeans.fit_predict(scaled_data)
-        cluster_data['cluster'] = clusters
-        
-        # Анализ кластеров
-        cluster_stats = cluster_data.groupby('cluster').mean()
-        
-        # Находим "хороший" и "плохой" кластеры
-        good_cluster = cluster_stats['sleep_quality'].idxmax()
-        bad_cluster_stats = cluster_stats.loc[1 - good_cluster]
-        good_cluster_stats = cluster_stats.loc[good_cluster]
-        
-        # Сравниваем факторы
-        significant_diffs = []
-        for col in ['stress_level', 'awakenings']:
-            diff = bad_cluster_stats[col] - good_cluster_stats[col]
-            if diff > 0.5 * good_cluster_stats[col]:  # Значимая разница
-                significant_diffs.append((col, diff))
-        
-        # Формируем рекомендации
-        if significant_diffs:
-            rec = "Анализ твоих данных выявил два типа ночей: с хорошим и плохим сном. "
-            rec += "В 'плохие' ночи наблюдаются:\n"
-            
-            for col, diff in significant_diffs:
-                if col == 'stress_level':
-                    rec += f"- Значительно более высокий уровень стресса (+{diff:.1f} балла)\n"
-                elif col == 'awakenings':
-                    rec += f"- Больше пробуждений (+{diff:.1f} раза)\n"
-            
-            rec += "\nПопробуй в дни с высоким стрессом:\n"
-            rec += "- Техники релаксации перед сном\n"
-            rec += "- Теплый ромашковый чай\n"
-            rec += "- Более ранний отход ко сну"
-            
-            recommendations.append(rec)
-    except Exception as e:
-        print(f"Ошибка кластерного анализа: {e}")
-    
-    return recommendations
-
-def generate_profile_based_recommendations(user: Dict) -> List[str]:
-    """Генерация рекомендаций на основе профиля пользователя"""
-    recommendations = []
-    age = user['age']
-    gender = user['gender']
-    lifestyle = user['lifestyle']
-    
-    # По возрасту
-    if age >= 45:
-        recommendations.append(
-            "В твоем возрасте мелатонин (гормон сна) вырабатывается менее активно. "
-            "Попробуй:\n"
-            "- Увеличить воздействие естественного света днем\n"
-            "- Рассмотреть добавки мелатонина после консультации с врачом\n"
-            "- Соблюдать строгий режим сна"
-        )
-    
-    # По полу
-    if gender == 'Женский':
-        recommendations.append(
-            "Женщины часто более чувствительны к изменениям циркадных ритмов. "
-            "Попробуй:\n"
-            "- Стабильный график сна даже в выходные\n"
-            "- Техники релаксации при ПМС\n"
-            "- Более темную и прохладную спальню"
-        )
-    
-    # По образу жизни
-    if 'сидячий' in lifestyle.lower():
-        recommendations.append(
-            "Твой сидячий образ жизни может влиять на качество сна. "
-            "Даже небольшая активность может помочь:\n"
-            "- 10-минутная прогулка после ужина\n"
-            "- Растяжка перед сном\n"
-            "- Использование стоячего рабочего места"
-        )
-    elif 'активный' in lifestyle.lower():
-        recommendations.append(
-            "Хотя ты ведешь активный образ жизни, обрати внимание:\n"
-            "- Интенсивные тренировки за 3+ часа до сна могут мешать засыпанию\n"
-            "- Восстановительные практики (йога, растяжка) вечером\n"
-            "- Достаточное потребление магния и белка"
-        )
-    
-    return recommendations
-
 # Обработчик обратной связи
-@bot.callback_query_handler(func=lambda call: call.data.startswith('feedback_'))
+@callback_query_handler(func=lambda call: call.data.startswith('feedback_'))
 def handle_feedback(call: types.CallbackQuery):
     """Обработчик отзыва о рекомендации"""
     user_id = call.from_user.id
     recommendation = db.get_last_recommendation(user_id)
     
     if not recommendation:
-        bot.answer_callback_query(call.id, "Не удалось найти рекомендацию для отзыва.")
+        answer_callback(call, "Не удалось найти рекомендацию для отзыва.")
         return
     
     is_helpful = call.data.endswith('_yes')
     db.update_recommendation_feedback(recommendation['id'], is_helpful)
     
     if is_helpful:
-        bot.answer_callback_query(call.id, "Спасибо за отзыв! Рад, что рекомендация была полезной. 😊")
+        answer_callback(call, "Спасибо за отзыв! Рад, что рекомендация была полезной. 😊")
     else:
-        bot.answer_callback_query(call.id, "Спасибо за честный отзыв! Учту это в будущих рекомендациях.")
+        answer_callback(call, "Спасибо за честный отзыв! Учту это в будущих рекомендациях.")
     
     # Удаляем клавиатуру
-    bot.edit_message_reply_markup(
-        chat_id=call.message.chat.id,
+    outbox.call(
+        'edit_message_reply_markup',
+        call.message.chat.id,
         message_id=call.message.message_id,
         reply_markup=None
     )
@@ -1100,77 +986,344 @@ def schedule_checker():
         schedule.run_pending()
         time.sleep(60)  # Проверяем каждую минуту
 
-def send_morning_surveys():
-    """Отправить утренние опросы всем пользователям"""
-    users = db.get_all_users()
-    for user_id in users:
-        try:
-            user = db.get_user(user_id)
-            if user:
-                # Отправляем в установленное пользователем время или в 8 утра по умолчанию
-                notification_time = user.get('notification_time', POLL_TIME)
-                current_time = datetime.now().strftime('%H:%M')
-                if current_time == notification_time:
-                    send_daily_survey(user_id)
-        except Exception as e:
-            print(f"Ошибка при отправке опроса пользователю {user_id}: {e}")
+def send_not_enough_data(user_id: int):
+    """Сообщить, что для анализа пока мало данных"""
+    send_message(
+        user_id, 
+        "Для точного анализа мне нужно больше данных о твоем сне. "
+        "Пожалуйста, заполни опросы еще несколько дней.",
+        priority=PRIORITY_SCHEDULED,
+        wait=False
+    )
+
+def weekly_analysis():
+    """Еженедельный анализ и рекомендации (пакетно для всех пользователей)"""
+    from analysis import iter_cohort_recommendations
 
-def send_evening_facts():
-    """Отправить вечерние советы/факты всем пользователям"""
-    users = db.get_all_users()
-    for user_id in users:
+    last_week = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
+    already_recommended = db.get_users_with_personal_recommendations(last_week)
+    users = {
+        user_id: user for user_id, user in db.get_user_profiles().items()
+        if user_id not in already_recommended
+    }
+    analyzed = set()
+    
+    # Опросы читаются порциями; порции анализируются в пуле процессов,
+    # запись в базу и отправка остаются в этом процессе
+    for user_id, recommendations in iter_cohort_recommendations(
+        db.iter_survey_frames(), users, ANALYSIS_WORKERS, db.get_correlations
+    ):
+        analyzed.add(user_id)
+        if recommendations is None:
+            continue
         try:
-            send_daily_fact(user_id)
+            deliver_recommendations(user_id, recommendations)
         except Exception as e:
-            print(f"Ошибка при отправке совета пользователю {user_id}: {e}")
-
-def weekly_analysis():
-    """Еженедельный анализ и рекомендации"""
-    users = db.get_all_users()
-    for user_id in users:
+            logger.error(f"Ошибка при отправке рекомендаций пользователю {user_id}: {e}")
+    
+    for user_id in users.keys() - analyzed:
         try:
-            analyze_and_recommend(user_id)
+            send_not_enough_data(user_id)
         except Exception as e:
-            print(f"Ошибка при анализе данных пользователя {user_id}: {e}")
+            logger.error(f"Ошибка при анализе данных пользователя {user_id}: {e}")
 
 def ask_feedback():
     """Спросить отзыв о рекомендациях"""
     week_ago = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-    users_with_recommendations = set()
     
     # Получаем пользователей, которым отправляли рекомендации неделю назад
-    with db._get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-        SELECT DISTINCT user_id FROM recommendations 
-        WHERE date = ? AND recommendation_text NOT LIKE 'Совет:%' AND recommendation_text NOT LIKE 'Факт:%'
-        ''', (week_ago,))
-        users_with_recommendations.update(row[0] for row in cursor.fetchall())
+    users_with_recommendations = db.get_users_with_personal_recommendations(week_ago, week_ago)
     
     # Спрашиваем отзыв
     for user_id in users_with_recommendations:
         try:
             recommendation = db.get_last_recommendation(user_id)
             if recommendation:
-                bot.send_message(
+                send_message(
                     user_id,
                     f"Неделю назад я отправил тебе эту рекомендацию:\n\n{recommendation['text']}\n\n"
                     "Помогла ли она тебе улучшить сон?",
+                    priority=PRIORITY_SCHEDULED,
+                    wait=False,
                     reply_markup=get_feedback_keyboard()
                 )
         except Exception as e:
-            print(f"Ошибка при запросе отзыва у пользователя {user_id}: {e}")
+            logger.error(f"Ошибка при запросе отзыва у пользователя {user_id}: {e}")
+
+# Персональные уведомления: опрос и совет в выбранное пользователем время
+notification_scheduler: Optional[NotificationScheduler] = None
+
+class SleepBot:
+    """Приложение бота СОНЯ.
+
+    Импорт модуля ничего не запускает: бот, база данных, очереди и фоновые
+    потоки создаются в start(), опрос Telegram - в run().
+    В режиме вебхука start() запускает и HTTP-сервер приема обновлений,
+    а run() только ждет остановки.
+    """
+
+    def __init__(
+        self,
+        token: str = TOKEN,
+        db_name: str = DB_NAME,
+        api_url: Optional[str] = TELEGRAM_API_URL,
+        update_mode: str = UPDATE_MODE
+    ):
+        self.token = token
+        self.db_name = db_name
+        self.api_url = api_url
+        self.update_mode = update_mode
+        self.webhook: Optional[WebhookServer] = None
+        self.startup_seconds: Optional[float] = None
+        self._stopped = threading.Event()
+
+    def start(self) -> float:
+        """Создать компоненты и запустить фоновые потоки; вернуть время старта в секундах.
+
+        Время считается от вызова start(), импорт модуля - отдельно в IMPORT_SECONDS.
+        """
+        global bot, db, outbox, broadcast_engine, notification_scheduler, states, content
+
+        started_at = time.perf_counter()
+
+        bot = self._create_bot()
+        for kind, handler, filters in HANDLERS:
+            if kind == 'message':
+                bot.register_message_handler(self._handler(handler), **filters)
+            else:
+                bot.register_callback_query_handler(self._handler(handler), **filters)
+
+        db = Database(self.db_name, correlation_decay=decay_for_half_life(CORRELATION_HALF_LIFE))
+        states = SQLiteStateStore(db) if STATE_STORE == 'sqlite' else MemoryStateStore()
+        content = ContentPool(db)
+        outbox = self._create_outbox(bot)
+        broadcast_engine = self._create_broadcast_engine()
+
+        notification_scheduler = NotificationScheduler({
+            SURVEY: send_daily_survey,
+            FACT: send_daily_fact
+        })
+        for user_id, notification_time, fact_time, timezone_offset in db.iter_notification_settings():
+            notification_scheduler.schedule_user(user_id, notification_time, fact_time, timezone_offset)
+
+        # Продолжаем рассылки, прерванные перезапуском
+        broadcast_engine.resume_unfinished()
+
+        # Настройка расписания
+        schedule.every().sunday.at("12:00").do(self._job(weekly_analysis))
+        schedule.every().sunday.at("18:00").do(self._job(ask_feedback))
+        schedule.every().day.at("04:00").do(self._job(states.purge))
+        # Советы, добавленные другим процессом бота
+        schedule.every(RELOAD_INTERVAL).minutes.do(self._job(content.reload))
+
+        self._start_timers()
+
+        if self.update_mode == 'webhook':
+            self.webhook = WebhookServer(
+                self._webhook_target(bot), WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET,
+                queue_size=WEBHOOK_QUEUE_SIZE,
+                workers=WEBHOOK_WORKERS
+            ).start()
+
+        self.startup_seconds = time.perf_counter() - started_at
+        return self.startup_seconds
+
+    # Точки расширения для асинхронной среды выполнения (AsyncSleepBot)
+
+    def _create_bot(self) -> telebot.TeleBot:
+        """Клиент Telegram"""
+        if self.api_url:
+            # Свой сервер Bot API или локальная заглушка для нагрузочных тестов
+            apihelper.API_URL = self.api_url.rstrip('/') + '/bot{0}/{1}'
+        # С вебхуком обработчики выполняются в потоках WebhookServer, собственный пул TeleBot не нужен
+        return telebot.TeleBot(self.token, threaded=self.update_mode != 'webhook')
+
+    def _handler(self, handler: Callable) -> Callable:
+        """Обработчик в том виде, в котором его регистрирует клиент"""
+        return handler
+
+    def _create_outbox(self, bot) -> Outbox:
+        return Outbox(bot, OUTBOX_GLOBAL_RATE, OUTBOX_CLASS_RATES, OUTBOX_WORKERS)
+
+    def _create_broadcast_engine(self) -> BroadcastEngine:
+        return BroadcastEngine(
+            db,
+            send=send_broadcast_message,
+            report=report_broadcast_progress,
+            workers=BROADCAST_WORKERS,
+            progress_interval=BROADCAST_PROGRESS_INTERVAL
+        )
+
+    def _job(self, func: Callable) -> Callable:
+        """Задача для schedule"""
+        return func
+
+    def _start_timers(self):
+        """Запустить планировщик уведомлений и проверку расписания в отдельных потоках"""
+        notification_scheduler.start()
+        threading.Thread(target=schedule_checker, daemon=True).start()
+
+    def _webhook_target(self, bot):
+        """Объект с process_new_updates для потоков WebhookServer"""
+        return bot
+
+    def stop(self):
+        """Остановить фоновые задачи и закрыть базу данных"""
+        self._stopped.set()
+        if self.webhook is not None:
+            self.webhook.stop()
+        schedule.clear()
+        if notification_scheduler is not None:
+            notification_scheduler.stop()
+        if outbox is not None:
+            # Сообщения, уже поставленные в очередь, отправляем до закрытия базы данных
+            self._stop_outbox()
+        if db is not None:
+            db.close()
+
+    def _stop_outbox(self):
+        outbox.stop(OUTBOX_SHUTDOWN_TIMEOUT)
+
+    def run(self):
+        """Запустить бота и принимать обновления до остановки"""
+        startup_seconds = self.start()
+        print(f"Бот СОНЯ запущен за {startup_seconds:.2f} с, импорт {IMPORT_SECONDS:.2f} с ({self.update_mode})!")
+        try:
+            if self.webhook is not None:
+                if WEBHOOK_URL:
+                    bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+                self._stopped.wait()
+            else:
+                # getUpdates не работает, пока зарегистрирован вебхук (например, после запуска в режиме webhook)
+                bot.remove_webhook()
+                bot.infinity_polling()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+
+class AsyncSleepBot(SleepBot):
+    """Тот же бот на AsyncTeleBot и asyncio.
+
+    Обработчики остаются синхронными и выполняются в пуле потоков (там же -
+    все запросы к базе данных). Запросы к Telegram - корутины AsyncOutbox,
+    рассылка - корутины AsyncBroadcastEngine, поэтому тысячи одновременных
+    отправок не занимают потоков. Расписание и персональные уведомления -
+    задачи asyncio вместо отдельных потоков; уведомления отправляются в своем
+    пуле потоков, чтобы всплеск рассылки опросов не задерживал ответы. Нужен aiohttp.
+    """
+
+    def __init__(
+        self,
+        *args,
+        executor_workers: int = ASYNC_EXECUTOR_WORKERS,
+        notification_workers: int = ASYNC_NOTIFICATION_WORKERS,
+        **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.executor = ThreadPoolExecutor(max_workers=executor_workers, thread_name_prefix='async-handler')
+        self.notification_workers = notification_workers
+        self.notification_executor = ThreadPoolExecutor(
+            max_workers=notification_workers, thread_name_prefix='async-notification'
+        )
+        self.loop = None
+        self._tasks = []
+
+    def _create_bot(self):
+        from telebot import asyncio_helper
+        from telebot.async_telebot import AsyncTeleBot
+
+        if self.api_url:
+            asyncio_helper.API_URL = self.api_url.rstrip('/') + '/bot{0}/{1}'
+        return AsyncTeleBot(self.token)
+
+    def _handler(self, handler: Callable) -> Callable:
+        from aioruntime import offload
+        return offload(handler, self.executor)
+
+    def _create_outbox(self, bot):
+        from aioruntime import AsyncOutbox
+        return AsyncOutbox(bot, self.loop, OUTBOX_GLOBAL_RATE, OUTBOX_CLASS_RATES, ASYNC_SEND_CONCURRENCY)
+
+    def _create_broadcast_engine(self):
+        from aioruntime import AsyncBroadcastEngine
+        return AsyncBroadcastEngine(
+            db,
+            send=send_broadcast_message,
+            report=report_broadcast_progress,
+            loop=self.loop,
+            executor=self.executor,
+            concurrency=ASYNC_SEND_CONCURRENCY[PRIORITY_BULK],
+            progress_interval=BROADCAST_PROGRESS_INTERVAL
+        )
+
+    def _job(self, func: Callable) -> Callable:
+        """Задача для schedule: сама работа - в пуле потоков, цикл событий не блокируется"""
+        return lambda: self.loop.run_in_executor(self.executor, func)
+
+    def _start_timers(self):
+        from aioruntime import run_notifications, run_schedule
+        self._tasks = [
+            self.loop.create_task(run_schedule()),
+            self.loop.create_task(run_notifications(
+                notification_scheduler, self.notification_executor, self.notification_workers
+            ))
+        ]
+
+    def _webhook_target(self, bot):
+        from aioruntime import LoopBridge
+        return LoopBridge(bot, self.loop)
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        super().stop()
+        self.executor.shutdown(wait=False)
+        self.notification_executor.shutdown(wait=False)
+
+    def _stop_outbox(self):
+        """Очередь уже опустела в serve(): ждать ее здесь - значит заблокировать цикл событий"""
+
+    def request_stop(self):
+        """Попросить serve() завершиться (можно вызывать из любого потока)"""
+        self._stopped.set()
+
+    async def serve(self):
+        """Запустить бота в текущем цикле событий и принимать обновления до остановки"""
+        import asyncio
+
+        self.loop = asyncio.get_running_loop()
+        startup_seconds = self.start()
+        print(f"Бот СОНЯ запущен за {startup_seconds:.2f} с, импорт {IMPORT_SECONDS:.2f} с ({self.update_mode}, asyncio)!")
+        stopped = self.loop.run_in_executor(None, self._stopped.wait)
+        try:
+            if self.webhook is not None:
+                if WEBHOOK_URL:
+                    await bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+                await stopped
+            else:
+                await bot.remove_webhook()
+                polling = self.loop.create_task(bot.infinity_polling())
+                await asyncio.wait([polling, stopped], return_when=asyncio.FIRST_COMPLETED)
+                polling.cancel()
+        finally:
+            await outbox.drain(OUTBOX_SHUTDOWN_TIMEOUT)
+            self.stop()
+            await bot.close_session()
+
+    def run(self):
+        import asyncio
+
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
 
-# Настройка расписания
-schedule.every().day.at(POLL_TIME).do(send_morning_surveys)
-schedule.every().day.at(FACT_TIME).do(send_evening_facts)
-schedule.every().sunday.at("12:00").do(weekly_analysis)
-schedule.every().sunday.at("18:00").do(ask_feedback)
 
-# Запуск планировщика в отдельном потоке
-threading.Thread(target=schedule_checker, daemon=True).start()
+# Время импорта модуля (без создания компонентов - они создаются в SleepBot.start())
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED_AT
 
 # Запуск бота
 if __name__ == '__main__':
-    print("Бот СОНЯ запущен!")
-    bot.infinity_polling()
\ No newline at end of file
+    (AsyncSleepBot if RUNTIME == 'asyncio' else SleepBot)().run()
@@ -0,0 +1,272 @@
+import sqlite3
+import logging
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple, Union
+
+from correlation import rebuild_correlation_stats
+
+logger = logging.getLogger(__name__)
+
+# Шаг миграции: список SQL-запросов или функция, получающая курсор
+MigrationStep = Union[List[str], Callable[[sqlite3.Cursor], None]]
+
+
+def _dedupe_achievements(cursor: sqlite3.Cursor, **options):
+    """Удалить повторные достижения перед созданием уникального индекса"""
+    cursor.execute('''
+    DELETE FROM achievements
+    WHERE achievement_id NOT IN (
+        SELECT MIN(achievement_id) FROM achievements
+        GROUP BY user_id, achievement_type
+    )
+    ''')
+    if cursor.rowcount > 0:
+        logger.warning(f"Удалено повторяющихся достижений: {cursor.rowcount}")
+    cursor.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_achievements_user_type
+    ON achievements (user_id, achievement_type)
+    ''')
+
+
+def _add_column(cursor: sqlite3.Cursor, table: str, column: str, definition: str):
+    """Добавить столбец, если его еще нет (ALTER TABLE сам по себе не идемпотентен)"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+def _add_notification_settings(cursor: sqlite3.Cursor, **options):
+    """Персональное время факта и часовой пояс пользователя"""
+    _add_column(cursor, 'users', 'fact_time', "TEXT DEFAULT '20:00'")
+    _add_column(cursor, 'users', 'timezone_offset', 'INTEGER DEFAULT NULL')
+
+
+def rebuild_user_aggregates(cursor: sqlite3.Cursor, user_id: Optional[int] = None) -> int:
+    """Пересчитать агрегаты опросов по полной истории (всех пользователей или одного).
+
+    Возвращает количество пересчитанных пользователей.
+    """
+    condition = 'WHERE user_id = ?' if user_id is not None else ''
+    params = (user_id,) if user_id is not None else ()
+    cursor.execute(f'DELETE FROM user_aggregates {condition}', params)
+    cursor.execute(f'''
+    INSERT INTO user_aggregates (
+        user_id, survey_count,
+        sum_sleep_duration, sum_sleep_quality, sum_awakenings,
+        min_sleep_duration, max_sleep_duration,
+        min_sleep_quality, max_sleep_quality,
+        last_survey_date
+    )
+    SELECT
+        user_id, COUNT(*),
+        TOTAL(sleep_duration), TOTAL(sleep_quality), TOTAL(awakenings),
+        MIN(sleep_duration), MAX(sleep_duration),
+        MIN(sleep_quality), MAX(sleep_quality),
+        MAX(date)
+    FROM surveys
+    {condition}
+    GROUP BY user_id
+    ''', params)
+    return cursor.rowcount
+
+
+def _create_user_aggregates(cursor: sqlite3.Cursor, **options):
+    """Таблица агрегатов опросов и заполнение ее по существующим данным"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS user_aggregates (
+        user_id INTEGER PRIMARY KEY,
+        survey_count INTEGER DEFAULT 0,
+        sum_sleep_duration REAL DEFAULT 0,
+        sum_sleep_quality REAL DEFAULT 0,
+        sum_awakenings REAL DEFAULT 0,
+        min_sleep_duration REAL,
+        max_sleep_duration REAL,
+        min_sleep_quality INTEGER,
+        max_sleep_quality INTEGER,
+        last_survey_date TEXT
+    )
+    ''')
+    rebuilt = rebuild_user_aggregates(cursor)
+    logger.info(f"Агрегаты опросов посчитаны для {rebuilt} пользователей")
+
+
+def _create_correlation_stats(cursor: sqlite3.Cursor, correlation_decay: float = 1.0, **options):
+    """Накопленные суммы для корреляций факторов с качеством сна и их заполнение
+    (с тем же затуханием, что и при обновлении после каждого опроса)"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS correlation_stats (
+        user_id INTEGER,
+        factor TEXT,
+        weight REAL DEFAULT 0,
+        sum_x REAL DEFAULT 0,
+        sum_y REAL DEFAULT 0,
+        sum_xx REAL DEFAULT 0,
+        sum_yy REAL DEFAULT 0,
+        sum_xy REAL DEFAULT 0,
+        PRIMARY KEY (user_id, factor)
+    )
+    ''')
+    rebuilt = rebuild_correlation_stats(cursor, decay=correlation_decay)
+    logger.info(f"Суммы для корреляций посчитаны для {rebuilt} пользователей")
+
+
+def _create_content(cursor: sqlite3.Cursor, **options):
+    """Таблица советов и фактов, заполненная списками из facts.py"""
+    from facts import SLEEP_FACTS, SLEEP_TIPS
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS content (
+        content_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        type TEXT NOT NULL,
+        text TEXT NOT NULL,
+        tags TEXT DEFAULT '',
+        active INTEGER DEFAULT 1,
+        revision INTEGER NOT NULL,
+        created_date TEXT,
+        UNIQUE (type, text)
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_content_revision ON content (revision)')
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    items = [('tip', text) for text in SLEEP_TIPS] + [('fact', text) for text in SLEEP_FACTS]
+    cursor.executemany('''
+    INSERT OR IGNORE INTO content (type, text, revision, created_date)
+    VALUES (?, ?, (SELECT COALESCE(MAX(revision), 0) + 1 FROM content), ?)
+    ''', [(content_type, text, now) for content_type, text in items])
+    logger.info(f"В таблицу content перенесено материалов: {len(items)}")
+
+
+def _add_recommendation_kind(cursor: sqlite3.Cursor, **options):
+    """Вид рекомендации отдельным столбцом вместо префикса текста 'Совет:'/'Факт:'"""
+    _add_column(cursor, 'recommendations', 'kind', "TEXT NOT NULL DEFAULT 'personal'")
+    cursor.execute('''
+    UPDATE recommendations SET kind = CASE
+        WHEN recommendation_text LIKE 'Совет:%' THEN 'tip'
+        WHEN recommendation_text LIKE 'Факт:%' THEN 'fact'
+        ELSE 'personal'
+    END
+    ''')
+    logger.info(f"Вид рекомендации заполнен для {cursor.rowcount} строк")
+    # Проверки "уже отправляли" по пользователю и выборки пользователей по виду и дате
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_recommendations_user_kind_date ON recommendations (user_id, kind, date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_recommendations_kind_date ON recommendations (kind, date, user_id)')
+
+
+# Упорядоченный список миграций: (версия, описание, шаг).
+# Новые миграции добавляются только в конец с увеличением версии.
+MIGRATIONS: List[Tuple[int, str, MigrationStep]] = [
+    (1, 'Индексы опросов и рекомендаций по пользователю и дате', [
+        'CREATE INDEX IF NOT EXISTS idx_surveys_user_date ON surveys (user_id, date)',
+        'CREATE INDEX IF NOT EXISTS idx_recommendations_user_date ON recommendations (user_id, date)',
+    ]),
+    (2, 'Уникальный индекс достижений пользователя', _dedupe_achievements),
+    (3, 'Индекс пользователей по времени уведомления', [
+        'CREATE INDEX IF NOT EXISTS idx_users_notification_time ON users (notification_time)',
+    ]),
+    (4, 'Время факта и часовой пояс пользователя', _add_notification_settings),
+    (5, 'Состояние заданий рассылки', [
+        '''
+        CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            admin_id INTEGER,
+            text TEXT,
+            status TEXT DEFAULT 'running',
+            total INTEGER DEFAULT 0,
+            last_user_id INTEGER DEFAULT 0,
+            success INTEGER DEFAULT 0,
+            failures INTEGER DEFAULT 0,
+            blocked INTEGER DEFAULT 0,
+            created_date TEXT,
+            updated_date TEXT
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status ON broadcast_jobs (status)',
+    ]),
+    (6, 'Агрегаты опросов пользователя для статистики', _create_user_aggregates),
+    (7, 'Накопленные суммы для корреляционного анализа', _create_correlation_stats),
+    (8, 'Состояния диалогов пользователей', [
+        '''
+        CREATE TABLE IF NOT EXISTS user_states (
+            user_id INTEGER PRIMARY KEY,
+            kind TEXT,
+            step INTEGER,
+            answers TEXT,
+            updated_at INTEGER
+        )
+        ''',
+    ]),
+    (9, 'Советы и факты в базе данных', _create_content),
+    (10, 'Просмотренные пользователем советы и факты', [
+        '''
+        CREATE TABLE IF NOT EXISTS content_seen (
+            user_id INTEGER PRIMARY KEY,
+            seen BLOB
+        )
+        ''',
+    ]),
+    (11, 'Вид рекомендации и индексы по нему', _add_recommendation_kind),
+    # Выборка пользователей по времени уведомления заменена планировщиком уведомлений
+    (12, 'Удаление индекса пользователей по времени уведомления', [
+        'DROP INDEX IF EXISTS idx_users_notification_time',
+    ]),
+]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Получить текущую версию схемы базы данных"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_date TEXT
+    )
+    ''')
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def apply_migrations(conn: sqlite3.Connection, **options) -> int:
+    """Применить все еще не примененные миграции по порядку.
+
+    Каждая миграция выполняется в отдельной транзакции вместе с записью
+    в schema_version, поэтому сбой не оставляет схему в промежуточном состоянии.
+    options (например, correlation_decay) передаются миграциям-функциям.
+    Возвращает итоговую версию схемы.
+    """
+    current_version = get_schema_version(conn)
+    conn.commit()
+
+    for version, description, step in MIGRATIONS:
+        if version <= current_version:
+            continue
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            # Другой процесс мог применить миграцию, пока мы ждали блокировку
+            cursor.execute('SELECT 1 FROM schema_version WHERE version = ?', (version,))
+            if cursor.fetchone():
+                conn.commit()
+                current_version = version
+                continue
+
+            if callable(step):
+                step(cursor, **options)
+            else:
+                for statement in step:
+                    cursor.execute(statement)
+
+            cursor.execute('''
+            INSERT INTO schema_version (version, description, applied_date)
+            VALUES (?, ?, ?)
+            ''', (version, description, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Ошибка при применении миграции {version} ({description}): {e}")
+            raise
+
+        logger.info(f"Применена миграция {version}: {description}")
+        current_version = version
+
+    return current_version
@@ -0,0 +1,193 @@
+import itertools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+from ratelimit import TokenBucket, get_retry_after
+
+logger = logging.getLogger(__name__)
+
+# Классы приоритета исходящих сообщений (меньше - важнее)
+PRIORITY_INTERACTIVE = 0  # ответы на действия пользователя
+PRIORITY_SCHEDULED = 1  # персональные опросы, советы, рекомендации
+PRIORITY_BULK = 2  # массовые рассылки
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_SCHEDULED: 'scheduled',
+    PRIORITY_BULK: 'bulk'
+}
+
+# Сколько токенов общего лимита класс оставляет более важным классам:
+# когда общий лимит исчерпан, освободившийся токен первым получает интерактивный ответ
+GLOBAL_RESERVE = {
+    PRIORITY_INTERACTIVE: 0,
+    PRIORITY_SCHEDULED: 2,
+    PRIORITY_BULK: 4
+}
+
+MAX_ATTEMPTS = 5  # попыток отправки при ответе 429 от Telegram
+_STOP = len(PRIORITY_NAMES)  # "приоритет" элемента остановки: после всех сообщений
+
+
+class _ClassMetrics:
+    """Счетчики одного класса приоритета"""
+
+    def __init__(self):
+        self.enqueued = 0
+        self.sent = 0
+        self.failed = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        done = self.sent + self.failed
+        return {
+            'enqueued': self.enqueued,
+            'sent': self.sent,
+            'failed': self.failed,
+            'depth': self.enqueued - done,
+            'avg_latency': round(self.latency_total / done, 3) if done else 0,
+            'max_latency': round(self.latency_max, 3)
+        }
+
+
+class Outbox:
+    """Единая очередь исходящих запросов к Telegram с приоритетами.
+
+    Все вызовы транспорта (по умолчанию - объект TeleBot, в тестах - любой
+    объект с теми же методами) проходят через очередь: интерактивные ответы
+    обгоняют плановые задачи и рассылки. Скорость каждого класса ограничена
+    своим token bucket, общая - глобальным, из которого менее важные классы
+    берут токены, только оставив запас GLOBAL_RESERVE более важным (шарды
+    делят общий лимит, поэтому приоритет соблюдается и между шардами).
+    Очередь разбита на шарды по chat_id,
+    поэтому сообщения одного приоритета в один чат уходят в порядке постановки.
+    На ответ 429 вся очередь приостанавливается на retry_after, а сообщение
+    возвращается в очередь на свое место.
+    """
+
+    def __init__(
+        self,
+        transport: Any,
+        global_rate: float = 30,
+        class_rates: Optional[Dict[int, float]] = None,
+        workers: int = 4
+    ):
+        self.transport = transport
+        self._global_bucket = TokenBucket(global_rate)
+        class_rates = class_rates or {}
+        self._class_buckets = {
+            priority: TokenBucket(class_rates.get(priority, global_rate))
+            for priority in PRIORITY_NAMES
+        }
+        self._metrics = {priority: _ClassMetrics() for priority in PRIORITY_NAMES}
+        self._metrics_lock = threading.Lock()
+        # Сигнал об обработке очередного элемента - для flush()
+        self._done = threading.Condition(self._metrics_lock)
+        self._counter = itertools.count()
+        self._queues: List[queue.PriorityQueue] = [queue.PriorityQueue() for _ in range(workers)]
+        self._threads = [
+            threading.Thread(target=self._run, args=(q,), name=f'outbox-{i}', daemon=True)
+            for i, q in enumerate(self._queues)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def call(self, method: str, chat_id: int, *args, priority: int = PRIORITY_INTERACTIVE, **kwargs) -> Future:
+        """Поставить вызов метода транспорта в очередь; результат - через Future"""
+        future: Future = Future()
+        with self._metrics_lock:
+            self._metrics[priority].enqueued += 1
+        item = (priority, next(self._counter), time.monotonic(), 1, method, chat_id, args, kwargs, future)
+        self._queues[hash(chat_id) % len(self._queues)].put(item)
+        return future
+
+    def send_message(self, chat_id: int, text: str, priority: int = PRIORITY_INTERACTIVE, **kwargs) -> Future:
+        """Поставить сообщение в очередь"""
+        return self.call('send_message', chat_id, text, priority=priority, **kwargs)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Глубина очереди, задержки и счетчики по классам приоритета"""
+        with self._metrics_lock:
+            return {PRIORITY_NAMES[priority]: metrics.as_dict() for priority, metrics in self._metrics.items()}
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Дождаться отправки всех поставленных в очередь запросов; False - не успели за timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._done:
+            while any(metrics.enqueued > metrics.sent + metrics.failed for metrics in self._metrics.values()):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._done.wait(remaining)
+        return True
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """Отправить то, что уже в очереди (не дольше timeout), и остановить потоки"""
+        flushed = self.flush(timeout)
+        if not flushed:
+            logger.warning("Очередь исходящих сообщений не успела опустеть до остановки")
+        for items in self._queues:
+            items.put((_STOP, next(self._counter)))
+        for thread in self._threads:
+            thread.join(timeout)
+        return flushed
+
+    def _run(self, items: queue.PriorityQueue):
+        """Цикл обработки одного шарда очереди"""
+        while True:
+            item = items.get()
+            if item[0] == _STOP:
+                return
+            priority, sequence, enqueued_at, attempt, method, chat_id, args, kwargs, future = item
+
+            class_bucket = self._class_buckets[priority]
+            wait = class_bucket.try_acquire()
+            if wait <= 0:
+                wait = self._global_bucket.try_acquire(GLOBAL_RESERVE[priority])
+                if wait > 0:
+                    class_bucket.refund()
+            if wait > 0:
+                # Класс исчерпал лимит или общий лимит занят более важными классами:
+                # возвращаем элемент на место, чтобы за время ожидания могли пройти
+                # более приоритетные сообщения
+                items.put(item)
+                time.sleep(wait)
+                continue
+
+            try:
+                result = getattr(self.transport, method)(chat_id, *args, **kwargs)
+                error = None
+            except Exception as e:
+                result = None
+                error = e
+
+            retry_after = get_retry_after(error) if error is not None else None
+            if retry_after is not None and attempt < MAX_ATTEMPTS:
+                # Telegram просит подождать: притормаживаем всю очередь и повторяем
+                # сообщение с тем же порядковым номером - порядок в чате сохраняется
+                logger.warning(f"Telegram просит подождать {retry_after} с ({method} для чата {chat_id})")
+                self._global_bucket.pause(retry_after)
+                items.put((priority, sequence, enqueued_at, attempt + 1, method, chat_id, args, kwargs, future))
+                continue
+
+            latency = time.monotonic() - enqueued_at
+            with self._metrics_lock:
+                metrics = self._metrics[priority]
+                if error is None:
+                    metrics.sent += 1
+                else:
+                    metrics.failed += 1
+                metrics.latency_total += latency
+                metrics.latency_max = max(metrics.latency_max, latency)
+                self._done.notify_all()
+
+            if error is None:
+                future.set_result(result)
+            else:
+                logger.warning(f"Ошибка {method} для чата {chat_id}: {error}")
+                future.set_exception(error)
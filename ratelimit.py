@@ -0,0 +1,71 @@
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Потокобезопасный «ведро токенов»: не более rate операций в секунду с запасом capacity"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        """Пополнить токены за прошедшее время (вызывается под блокировкой)"""
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, reserve: float = 0) -> float:
+        """Взять токен; вернуть 0 при успехе или время ожидания до следующей попытки.
+
+        reserve - сколько токенов оставить в ведре для более важных вызовов:
+        токен выдается, только если после этого в ведре останется не меньше reserve.
+        """
+        # Запас не больше емкости ведра, иначе токен не достанется никогда
+        reserve = min(reserve, self.capacity - 1)
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._refill(now)
+            if self._tokens >= 1 + reserve:
+                self._tokens -= 1
+                return 0.0
+            return (1 + reserve - self._tokens) / self.rate
+
+    def refund(self):
+        """Вернуть взятый токен (операция не состоялась)"""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+    def acquire(self):
+        """Дождаться и взять токен"""
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Приостановить выдачу токенов (например, по retry_after от Telegram)"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Извлечь retry_after из ошибки Telegram 429 (None, если это другая ошибка)"""
+    if getattr(error, 'error_code', None) != 429:
+        return None
+    result_json = getattr(error, 'result_json', None) or {}
+    parameters = result_json.get('parameters') or {}
+    return float(parameters.get('retry_after', 1))
+
+
+def is_blocked_error(error: Exception) -> bool:
+    """Пользователь заблокировал бота или чат недоступен (повтор бессмыслен)"""
+    return getattr(error, 'error_code', None) in (400, 403)
@@ -0,0 +1,105 @@
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from telebot import types
+
+Handler = Callable[[types.Message], Any]
+
+
+def command_name(text: str) -> Optional[str]:
+    """'/time 07:30' или '/time@sonya_bot' -> 'time'; None - если это не команда"""
+    if not text.startswith('/'):
+        return None
+    return text.split(maxsplit=1)[0][1:].split('@', 1)[0]
+
+
+class Router:
+    """Маршрутизация текстовых сообщений по словарям вместо перебора фильтров.
+
+    telebot проверяет фильтры обработчиков по очереди для каждого сообщения,
+    здесь же на сообщение приходится одно чтение состояния пользователя и
+    одно-два обращения к словарям, сколько бы кнопок и команд ни было.
+    Порядок: диалог со свободным вводом (опрос, ввод администратора) ->
+    команда -> кнопка -> шаг диалога (регистрация). Команды и кнопки
+    администратора доступны только пользователям из admin_ids.
+    """
+
+    def __init__(self, get_state: Callable[[int], Any], admin_ids: Iterable[int] = ()):
+        self.get_state = get_state
+        self.admin_ids = frozenset(admin_ids)
+        self._dialogs: Dict[str, Tuple[str, Handler]] = {}
+        self._commands: Dict[str, Tuple[str, Handler, bool]] = {}
+        self._texts: Dict[str, Tuple[str, Handler, bool]] = {}
+        self._steps: Dict[Tuple[str, int], Tuple[str, Handler]] = {}
+        self._hits: Counter = Counter()
+        self._hits_lock = threading.Lock()
+
+    # Регистрация маршрутов (декораторы)
+
+    def dialog(self, kind: str) -> Callable[[Handler], Handler]:
+        """Обработчик любого текста, пока пользователь в диалоге kind (раньше команд и кнопок)"""
+        def decorator(handler: Handler) -> Handler:
+            self._dialogs[kind] = (f'dialog:{kind}', handler)
+            return handler
+        return decorator
+
+    def command(self, *names: str, admin: bool = False) -> Callable[[Handler], Handler]:
+        """Обработчик команд /name"""
+        def decorator(handler: Handler) -> Handler:
+            for name in names:
+                self._commands[name] = (f'/{name}', handler, admin)
+            return handler
+        return decorator
+
+    def text(self, *texts: str, admin: bool = False) -> Callable[[Handler], Handler]:
+        """Обработчик кнопки - сообщения с точно таким текстом"""
+        def decorator(handler: Handler) -> Handler:
+            for text in texts:
+                self._texts[text] = (text, handler, admin)
+            return handler
+        return decorator
+
+    def step(self, kind: str, step: int) -> Callable[[Handler], Handler]:
+        """Обработчик шага step диалога kind, если текст не команда и не кнопка"""
+        def decorator(handler: Handler) -> Handler:
+            self._steps[(kind, step)] = (f'{kind}:{step}', handler)
+            return handler
+        return decorator
+
+    # Обработка сообщений
+
+    def resolve(self, message: types.Message) -> Optional[Tuple[str, Handler]]:
+        """Маршрут сообщения (имя, обработчик) или None, если его некому обработать"""
+        text = message.text
+        if text is None:
+            return None
+        user_id = message.from_user.id
+        state = self.get_state(user_id)
+        if state is not None and state.kind in self._dialogs:
+            return self._dialogs[state.kind]
+
+        name = command_name(text)
+        route = self._commands.get(name) if name is not None else None
+        if route is None:
+            route = self._texts.get(text)
+        if route is not None and (not route[2] or user_id in self.admin_ids):
+            return route[:2]
+
+        if state is not None:
+            return self._steps.get((state.kind, state.step))
+        return None
+
+    def dispatch(self, message: types.Message):
+        """Передать сообщение обработчику своего маршрута"""
+        route = self.resolve(message)
+        name = route[0] if route is not None else None
+        with self._hits_lock:
+            self._hits[name] += 1
+        if route is not None:
+            route[1](message)
+
+    def stats(self) -> Dict[Optional[str], int]:
+        """Сколько сообщений ушло по каждому маршруту (None - без обработчика)"""
+        with self._hits_lock:
+            return dict(self._hits)
@@ -0,0 +1,144 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Виды персональных уведомлений
+SURVEY = 'survey'
+FACT = 'fact'
+
+
+def get_user_timezone(offset_minutes: Optional[int]) -> tzinfo:
+    """Часовой пояс пользователя: смещение от UTC в минутах или часовой пояс сервера"""
+    if offset_minutes is None:
+        return datetime.now().astimezone().tzinfo
+    return timezone(timedelta(minutes=offset_minutes))
+
+
+def next_fire_time(local_time: str, offset_minutes: Optional[int], now: Optional[float] = None) -> float:
+    """Ближайший момент (unix time), когда у пользователя наступит local_time (ЧЧ:ММ)"""
+    now = time.time() if now is None else now
+    tz = get_user_timezone(offset_minutes)
+    hour, minute = map(int, local_time.split(':'))
+    current = datetime.fromtimestamp(now, tz)
+    fire_at = current.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if fire_at.timestamp() <= now:
+        fire_at += timedelta(days=1)
+    return fire_at.timestamp()
+
+
+class NotificationScheduler:
+    """Планировщик персональных уведомлений на основе min-heap.
+
+    Для каждого пользователя и вида уведомления (опрос, факт) в куче хранится
+    ближайший момент срабатывания. Поток спит ровно до ближайшего дедлайна,
+    вызывает обработчик и перепланирует уведомление на следующий день.
+    Перепланирование выполняется лениво: устаревшие записи кучи пропускаются.
+    """
+
+    def __init__(self, handlers: Dict[str, Callable[[int], None]]):
+        self._handlers = handlers
+        self._heap: List[Tuple[float, int, int, str]] = []
+        self._settings: Dict[Tuple[int, str], Tuple[str, Optional[int], int]] = {}
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+    def schedule_user(
+        self,
+        user_id: int,
+        survey_time: Optional[str],
+        fact_time: Optional[str],
+        offset_minutes: Optional[int] = None
+    ):
+        """Запланировать (или перепланировать) уведомления пользователя"""
+        with self._condition:
+            for kind, local_time in ((SURVEY, survey_time), (FACT, fact_time)):
+                if kind not in self._handlers:
+                    continue
+                if not local_time:
+                    self._settings.pop((user_id, kind), None)
+                    continue
+                self._push(user_id, kind, local_time, offset_minutes)
+            self._condition.notify()
+
+    def _push(self, user_id: int, kind: str, local_time: str, offset_minutes: Optional[int]):
+        """Добавить запись в кучу (вызывается под блокировкой)"""
+        token = next(self._counter)
+        self._settings[(user_id, kind)] = (local_time, offset_minutes, token)
+        fire_at = next_fire_time(local_time, offset_minutes)
+        heapq.heappush(self._heap, (fire_at, token, user_id, kind))
+
+    def start(self):
+        """Запустить поток планировщика"""
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='notification-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Остановить поток планировщика"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _pop_due(self) -> Tuple[Optional[Tuple[int, str]], Optional[float]]:
+        """Снять наступившее уведомление (вызывается под блокировкой).
+
+        Возвращает ((user_id, вид), None) или (None, секунд до ближайшего
+        дедлайна); (None, None) - если куча пуста.
+        """
+        while self._heap:
+            fire_at, token, user_id, kind = self._heap[0]
+            settings = self._settings.get((user_id, kind))
+            if settings is None or settings[2] != token:
+                # Устаревшая запись после перепланирования или отмены
+                heapq.heappop(self._heap)
+                continue
+
+            delay = fire_at - time.time()
+            if delay > 0:
+                return None, delay
+
+            heapq.heappop(self._heap)
+            local_time, offset_minutes, _ = settings
+            self._push(user_id, kind, local_time, offset_minutes)
+            return (user_id, kind), None
+        return None, None
+
+    def pop_due(self) -> Tuple[Optional[Tuple[int, str]], Optional[float]]:
+        """То же, что _pop_due, без ожидания - для внешнего цикла (например, asyncio)"""
+        with self._condition:
+            return self._pop_due()
+
+    def _next_due(self) -> Optional[Tuple[int, str]]:
+        """Дождаться ближайшего дедлайна и вернуть (user_id, вид) или None при остановке"""
+        with self._condition:
+            while not self._stopped:
+                due, delay = self._pop_due()
+                if due is not None:
+                    return due
+                self._condition.wait(delay)
+        return None
+
+    def dispatch(self, user_id: int, kind: str):
+        """Вызвать обработчик уведомления"""
+        try:
+            self._handlers[kind](user_id)
+        except Exception as e:
+            logger.error(f"Ошибка при отправке уведомления '{kind}' пользователю {user_id}: {e}")
+
+    def _run(self):
+        """Основной цикл планировщика"""
+        while True:
+            due = self._next_due()
+            if due is None:
+                return
+            self.dispatch(*due)
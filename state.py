@@ -0,0 +1,123 @@
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Виды диалогов
+REGISTRATION = 'registration'
+SURVEY = 'survey'
+ADD_FACT = 'add_fact'
+BROADCAST = 'broadcast'
+
+STATE_TTL = 7 * 24 * 3600  # брошенный диалог удаляется через неделю, секунд
+
+
+class UserState(NamedTuple):
+    """Состояние диалога: вид, номер шага и ответы на пройденные шаги по порядку"""
+    kind: str
+    step: int = 0
+    answers: Tuple[Any, ...] = ()
+    updated_at: int = 0
+
+
+def pack_answers(answers: Iterable[Any]) -> str:
+    """Ответы -> компактная JSON-строка для базы данных"""
+    return json.dumps(list(answers), ensure_ascii=False, separators=(',', ':'))
+
+
+def unpack_answers(packed: Optional[str]) -> Tuple[Any, ...]:
+    """JSON-строка из базы данных -> кортеж ответов"""
+    return tuple(json.loads(packed)) if packed else ()
+
+
+class MemoryStateStore:
+    """Состояния диалогов в памяти процесса (теряются при перезапуске)"""
+
+    def __init__(self, ttl: float = STATE_TTL):
+        self.ttl = ttl
+        self._states: Dict[int, UserState] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def get(self, user_id: int) -> Optional[UserState]:
+        """Текущее состояние пользователя или None"""
+        return self._states.get(user_id)
+
+    def set(self, user_id: int, kind: str, step: int = 0, answers: Iterable[Any] = ()) -> UserState:
+        """Начать диалог (или перейти к шагу step) с заданными ответами"""
+        state = UserState(kind, step, tuple(answers), int(time.time()))
+        with self._lock:
+            self._states[user_id] = state
+            self._save(user_id, state)
+        return state
+
+    def advance(self, user_id: int, answer: Any) -> Optional[UserState]:
+        """Записать ответ на текущий шаг и перейти к следующему"""
+        with self._lock:
+            state = self._states.get(user_id)
+            if state is None:
+                return None
+            state = UserState(state.kind, state.step + 1, state.answers + (answer,), int(time.time()))
+            self._states[user_id] = state
+            self._save(user_id, state)
+        return state
+
+    def delete(self, user_id: int):
+        """Завершить диалог"""
+        with self._lock:
+            if self._states.pop(user_id, None) is not None:
+                self._delete(user_id)
+
+    def purge(self) -> int:
+        """Удалить брошенные диалоги старше ttl; вернуть их количество"""
+        expires_before = int(time.time() - self.ttl)
+        with self._lock:
+            expired = [user_id for user_id, state in self._states.items() if state.updated_at < expires_before]
+            for user_id in expired:
+                del self._states[user_id]
+            if expired:
+                self._purge(expires_before)
+        return len(expired)
+
+    # Сохранение изменений: в памяти - ничего, подклассы пишут во внешнее хранилище.
+    # Вызываются под блокировкой, поэтому изменения уходят в хранилище в том же порядке.
+
+    def _save(self, user_id: int, state: UserState):
+        pass
+
+    def _delete(self, user_id: int):
+        pass
+
+    def _purge(self, expires_before: int):
+        pass
+
+
+class SQLiteStateStore(MemoryStateStore):
+    """Состояния в памяти со сквозной записью в таблицу user_states.
+
+    Чтение - только из памяти; запись ставится в фоновую очередь базы данных
+    и не ждет фиксации. При старте состояния загружаются из таблицы, поэтому
+    перезапуск бота не прерывает начатые опросы и регистрации.
+    """
+
+    def __init__(self, db, ttl: float = STATE_TTL):
+        super().__init__(ttl)
+        self.db = db
+        for user_id, kind, step, answers, updated_at in db.get_user_states():
+            self._states[user_id] = UserState(kind, step, unpack_answers(answers), updated_at)
+        logger.info(f"Загружено состояний диалогов: {len(self._states)}")
+        self.purge()
+
+    def _save(self, user_id: int, state: UserState):
+        self.db.save_user_state(user_id, state.kind, state.step, pack_answers(state.answers), state.updated_at)
+
+    def _delete(self, user_id: int):
+        self.db.delete_user_state(user_id)
+
+    def _purge(self, expires_before: int):
+        self.db.delete_user_states_before(expires_before)
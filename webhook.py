@@ -0,0 +1,141 @@
+import hmac
+import json
+import logging
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from telebot import types
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+MAX_BODY_SIZE = 1024 * 1024  # обновление Telegram заведомо меньше, байт
+
+
+def update_chat_id(update: Dict[str, Any]) -> int:
+    """Пользователь, от которого пришло обновление (0 - если его нет)"""
+    for key in ('message', 'edited_message', 'callback_query', 'my_chat_member'):
+        if key in update:
+            return update[key].get('from', {}).get('id', 0)
+    return 0
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    """Прием обновления: проверить секрет, поставить в очередь и сразу ответить"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        server: WebhookServer = self.server
+        if self.path != server.path:
+            self._reply(404)
+            return
+        if not hmac.compare_digest(self.headers.get(SECRET_HEADER, ''), server.secret_token):
+            server.count('rejected')
+            self._reply(403)
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0 or length > MAX_BODY_SIZE:
+            self._reply(400)
+            return
+        try:
+            update = json.loads(self.rfile.read(length))
+        except ValueError:
+            self._reply(400)
+            return
+
+        # Очередь переполнена - 503: Telegram повторит доставку позже
+        self._reply(200 if server.enqueue(update) else 503)
+
+    def _reply(self, status: int):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass  # журнал доступа на каждое обновление не нужен
+
+
+class WebhookServer(ThreadingHTTPServer):
+    """Встроенный HTTP-сервер для приема обновлений Telegram через вебхук.
+
+    Обновления раскладываются по шардам очереди по id пользователя и
+    обрабатываются пулом потоков: обновления одного пользователя - по
+    порядку, разных пользователей - параллельно. Размер очереди ограничен,
+    при переполнении Telegram получает 503 и повторяет доставку.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        bot,
+        host: str,
+        port: int,
+        path: str,
+        secret_token: str,
+        queue_size: int = 10000,
+        workers: int = 8
+    ):
+        if not secret_token:
+            raise ValueError("Для вебхука нужен секретный токен (WEBHOOK_SECRET)")
+        super().__init__((host, port), _WebhookHandler)
+        self.bot = bot
+        self.path = path
+        self.secret_token = secret_token
+        self._queues: List[queue.Queue] = [queue.Queue(max(1, queue_size // workers)) for _ in range(workers)]
+        self._workers = [
+            threading.Thread(target=self._run, args=(q,), name=f'webhook-{i}', daemon=True)
+            for i, q in enumerate(self._queues)
+        ]
+        self._serve_thread: Optional[threading.Thread] = None
+        self._counters = {'received': 0, 'rejected': 0, 'dropped': 0, 'processed': 0, 'failed': 0}
+        self._counters_lock = threading.Lock()
+
+    def count(self, name: str):
+        with self._counters_lock:
+            self._counters[name] += 1
+
+    def enqueue(self, update: Dict[str, Any]) -> bool:
+        """Поставить обновление в очередь; False - если шард переполнен"""
+        self.count('received')
+        try:
+            self._queues[update_chat_id(update) % len(self._queues)].put_nowait(update)
+            return True
+        except queue.Full:
+            self.count('dropped')
+            return False
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики обновлений и текущая глубина очереди"""
+        with self._counters_lock:
+            return dict(self._counters, depth=sum(q.qsize() for q in self._queues))
+
+    def start(self) -> 'WebhookServer':
+        """Запустить обработчики и прием обновлений в фоновых потоках"""
+        for thread in self._workers:
+            thread.start()
+        self._serve_thread = threading.Thread(target=self.serve_forever, name='webhook-http', daemon=True)
+        self._serve_thread.start()
+        logger.info(f"Вебхук слушает {self.server_address[0]}:{self.server_address[1]}{self.path}")
+        return self
+
+    def stop(self):
+        """Остановить прием обновлений (необработанные обновления в очереди теряются)"""
+        self.shutdown()
+        self.server_close()
+
+    def _run(self, updates: queue.Queue):
+        """Цикл обработки одного шарда очереди"""
+        while True:
+            update = updates.get()
+            try:
+                self.bot.process_new_updates([types.Update.de_json(update)])
+                self.count('processed')
+            except Exception as e:
+                self.count('failed')
+                logger.error(f"Ошибка при обработке обновления {update.get('update_id')}: {e}")